@@ -0,0 +1,496 @@
+import copy
+import threading
+from datetime import date as Date
+from typing import Any, Dict, Iterable, Iterator, List, NamedTuple, Optional, Sequence, Tuple, Union, overload
+
+import numpy as np
+
+from ids import IdGenerator, parse_id
+
+# Flag fields (the time slots) packed per record; one byte holds them
+MAX_FLAGS = 8
+# Rows appended since the sorted lookups were last rebuilt are found through small dicts
+MIN_TAIL = 1024
+
+# Layout steps: how each key of a record is stored, in the record's key order
+PACKED_ID = 0      # generated ID: prefix + two 64-bit halves
+STUDENT = 1        # interned student ID
+DATE = 2           # interned date string
+FLAG = 3           # one bit of the record's flag byte
+BLANK = 4          # dict whose values are all "" (empty captured_images)
+TENANT = 5         # the store's own school ID
+VERBATIM = 6       # anything else, kept as is in a sparse side table
+IMAGES = 7         # dict of strings (captured_images), values in the flat image list from the row's offset
+
+Layout = Tuple[Tuple[int, str, Any], ...]
+LOW_64 = (1 << 64) - 1
+LOW_32 = (1 << 32) - 1
+NO_STUDENT = NO_DATE = 0xFFFFFFFF
+
+COLUMNS = {
+    "student": np.uint32,
+    "date": np.uint32,
+    "flags": np.uint8,
+    "layout": np.uint16,
+    "images": np.uint32,
+    "id_high": np.uint64,
+    "id_low": np.uint64,
+}
+
+
+def day_number(value: Optional[str]) -> int:
+    """Proleptic ordinal of a YYYY-MM-DD date, or -1 when it is not one"""
+    if value is None:
+        return -1
+    try:
+        return Date.fromisoformat(value).toordinal()
+    except (TypeError, ValueError):
+        return -1
+
+
+EMPTY = np.zeros(0, dtype=np.uint64)
+
+
+class Lookups(NamedTuple):
+    """Sorted lookups over rows [0, rows) plus dicts for the rows appended after them.
+
+    A refresh builds a new one and publishes it with a single assignment, so
+    a reader always sees arrays and tails that belong together.
+    """
+    rows: int
+    # (id_high, id_low) -> position, over rows with a generated ID
+    id_high: np.ndarray
+    id_low: np.ndarray
+    id_positions: np.ndarray
+    # student << 32 | date -> positions; one student's cells are contiguous
+    cell_keys: np.ndarray
+    cell_positions: np.ndarray
+    # date -> positions
+    date_keys: np.ndarray
+    date_positions: np.ndarray
+    recent_ids: Dict[Tuple[int, int], int]
+    recent_cells: Dict[int, List[int]]
+    recent_students: Dict[int, List[int]]
+    recent_dates: Dict[int, List[int]]
+
+
+def no_lookups() -> Lookups:
+    return Lookups(0, EMPTY, EMPTY, EMPTY, EMPTY, EMPTY, EMPTY, EMPTY, {}, {}, {}, {})
+
+
+class AttendanceColumns:
+    """One school's attendance records as parallel NumPy columns instead of a list of dicts.
+
+    A record is a row: interned student and date numbers, a byte of slot
+    flags, a layout number and the 128 bits of its generated ID. The layout
+    lists the record's keys in order and how each was stored, so the dict
+    built on read equals the one written. Captured image URLs go to one flat
+    list, the row keeping the offset of its first. Values that fit none of
+    the packed forms (hand-written IDs, unknown fields) sit in a sparse side
+    table.
+
+    It stands in for the tenant's attendance list: positions, len(),
+    iteration, append() and item assignment behave the same, and reads build
+    a new dict each time. It also indexes itself (sorted arrays by ID, by
+    student + date and by date) so TenantIndex keeps no per-record entries
+    for attendance. Writes must be serialized by the caller, as the
+    repository does under its lock; reads may run alongside them.
+    """
+
+    def __init__(self, tenant_id: str, records: Iterable[Dict[str, Any]] = ()):
+        self.tenant_id = tenant_id
+        self.students: List[str] = []
+        self._student_numbers: Dict[str, int] = {}
+        self.dates: List[str] = []
+        self._date_numbers: Dict[str, int] = {}
+        self._date_days: List[int] = []
+        self.flags: List[str] = []
+        self._layouts: List[Layout] = []
+        self._layout_numbers: Dict[Layout, int] = {}
+        # Per layout, the flag bits its records carry at all (set or not)
+        self._layout_flags: List[int] = []
+
+        self._size = 0
+        self._columns: Dict[str, np.ndarray] = {name: np.zeros(64, dtype=dtype) for name, dtype in COLUMNS.items()}
+        self._image_urls: List[str] = []
+        self._verbatim: Dict[int, Dict[str, Any]] = {}
+
+        # IDs that are not generated ones (seed data) map straight to their position
+        self._named_ids: Dict[str, int] = {}
+        self._lookups = no_lookups()
+        # Held by writes and by a reader rebuilding the lookups, so no row is missed in between
+        self._lookup_lock = threading.Lock()
+        self.extend(records)
+
+    # List behaviour
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        for position in range(self._size):
+            yield self._record(position)
+
+    @overload
+    def __getitem__(self, position: int) -> Dict[str, Any]: ...
+
+    @overload
+    def __getitem__(self, position: slice) -> List[Dict[str, Any]]: ...
+
+    def __getitem__(self, position: Union[int, slice]) -> Union[Dict[str, Any], List[Dict[str, Any]]]:
+        if isinstance(position, slice):
+            return [self._record(i) for i in range(*position.indices(self._size))]
+        return self._record(self._check(position))
+
+    def __setitem__(self, position: int, record: Dict[str, Any]):
+        position = self._check(position)
+        with self._lookup_lock:
+            before = self._keys(position)
+            named = self._verbatim.pop(position, {}).get("id")
+            if isinstance(named, str) and self._named_ids.get(named) == position:
+                del self._named_ids[named]
+            self._store(position, record)
+            if self._keys(position) != before:
+                # A record changed its ID, student or date: rebuild the sorted lookups on next use
+                self._lookups = no_lookups()
+
+    def append(self, record: Dict[str, Any]):
+        with self._lookup_lock:
+            if self._size == len(self._columns["layout"]):
+                self._columns = {name: np.concatenate([column, np.zeros_like(column)]) for name, column in self._columns.items()}
+            position = self._size
+            self._store(position, record)
+            self._size += 1
+            if self._lookups.rows:
+                self._remember(position)
+
+    def extend(self, records: Iterable[Dict[str, Any]]):
+        for record in records:
+            self.append(record)
+
+    def copy(self) -> "AttendanceColumns":
+        """Independent copy of the rows, cheap enough to take under the repository lock"""
+        clone = AttendanceColumns.__new__(AttendanceColumns)
+        clone.__dict__.update(self.__dict__)
+        for name in ("students", "dates", "_date_days", "flags", "_layouts", "_layout_flags", "_image_urls"):
+            setattr(clone, name, list(getattr(self, name)))
+        for name in ("_student_numbers", "_date_numbers", "_layout_numbers", "_verbatim", "_named_ids"):
+            setattr(clone, name, dict(getattr(self, name)))
+        # Copies are read whole (snapshots); they build their own lookups if ever asked
+        clone._lookups = no_lookups()
+        clone._lookup_lock = threading.Lock()
+        clone._columns = {name: column[:self._size].copy() for name, column in self._columns.items()}
+        return clone
+
+    def __deepcopy__(self, memo: Dict[int, Any]) -> "AttendanceColumns":
+        clone = self.copy()
+        clone._verbatim = copy.deepcopy(self._verbatim, memo)
+        return clone
+
+    def _check(self, position: int) -> int:
+        if position < 0:
+            position += self._size
+        if not 0 <= position < self._size:
+            raise IndexError("attendance position out of range")
+        return position
+
+    # Encoding
+
+    def _intern(self, values: List[str], numbers: Dict[str, int], value: str) -> int:
+        number = numbers.get(value)
+        if number is None:
+            number = numbers[value] = len(values)
+            values.append(value)
+            if values is self.dates:
+                self._date_days.append(day_number(value))
+        return number
+
+    def _store(self, position: int, record: Dict[str, Any]):
+        steps = []
+        student, date = NO_STUDENT, NO_DATE
+        flags = carried = high = low = 0
+        verbatim: Optional[Dict[str, Any]] = None
+        images: Optional[List[str]] = None
+        for key, value in record.items():
+            step = None
+            if key == "id" and isinstance(value, str):
+                parsed = parse_id(value)
+                if parsed is not None:
+                    step = (PACKED_ID, key, parsed[0])
+                    high, low = parsed[1] >> 64, parsed[1] & LOW_64
+            elif key == "student_id" and isinstance(value, str):
+                student = self._intern(self.students, self._student_numbers, value)
+                step = (STUDENT, key, None)
+            elif key == "date" and isinstance(value, str):
+                date = self._intern(self.dates, self._date_numbers, value)
+                step = (DATE, key, None)
+            elif isinstance(value, bool) and (key in self.flags or len(self.flags) < MAX_FLAGS):
+                if key not in self.flags:
+                    self.flags.append(key)
+                bit = self.flags.index(key)
+                carried |= 1 << bit
+                flags |= value << bit
+                step = (FLAG, key, bit)
+            elif isinstance(value, dict) and all(v == "" for v in value.values()):
+                step = (BLANK, key, tuple(value))
+            elif isinstance(value, dict) and images is None and all(isinstance(v, str) for v in value.values()):
+                images = list(value.values())
+                step = (IMAGES, key, tuple(value))
+            elif key == "school_id" and value == self.tenant_id:
+                step = (TENANT, key, None)
+            if step is None:
+                step = (VERBATIM, key, None)
+                if verbatim is None:
+                    verbatim = {}
+                verbatim[key] = value
+            steps.append(step)
+
+        columns = self._columns
+        if images is not None:
+            columns["images"][position] = self._place_images(position, images)
+
+        layout = tuple(steps)
+        number = self._layout_numbers.get(layout)
+        if number is None:
+            number = self._layout_numbers[layout] = len(self._layouts)
+            self._layouts.append(layout)
+            self._layout_flags.append(carried)
+        columns["layout"][position] = number
+        columns["student"][position] = student
+        columns["date"][position] = date
+        columns["flags"][position] = flags
+        columns["id_high"][position] = high
+        columns["id_low"][position] = low
+        if verbatim:
+            self._verbatim[position] = verbatim
+            if isinstance(verbatim.get("id"), str):
+                self._named_ids[verbatim["id"]] = position
+
+    def _place_images(self, position: int, images: List[str]) -> int:
+        """Offset of the row's image URLs: its old slots when it is rewritten with as many, else new ones"""
+        if position < self._size:
+            for kind, _, argument in self._layouts[int(self._columns["layout"][position])]:
+                if kind == IMAGES and len(argument) == len(images):
+                    start = int(self._columns["images"][position])
+                    self._image_urls[start:start + len(images)] = images
+                    return start
+        start = len(self._image_urls)
+        self._image_urls.extend(images)
+        return start
+
+    def _record(self, position: int) -> Dict[str, Any]:
+        columns = self._columns
+        record: Dict[str, Any] = {}
+        for kind, key, argument in self._layouts[int(columns["layout"][position])]:
+            if kind == PACKED_ID:
+                record[key] = argument + IdGenerator.encode(int(columns["id_high"][position]) << 64 | int(columns["id_low"][position]))
+            elif kind == STUDENT:
+                record[key] = self.students[columns["student"][position]]
+            elif kind == DATE:
+                record[key] = self.dates[columns["date"][position]]
+            elif kind == FLAG:
+                record[key] = bool(columns["flags"][position] >> argument & 1)
+            elif kind == BLANK:
+                record[key] = dict.fromkeys(argument, "")
+            elif kind == TENANT:
+                record[key] = self.tenant_id
+            elif kind == IMAGES:
+                start = int(columns["images"][position])
+                record[key] = dict(zip(argument, self._image_urls[start:start + len(argument)]))
+            else:
+                record[key] = self._verbatim[position][key]
+        return record
+
+    # Lookups
+
+    def _keys(self, position: int) -> Tuple[int, ...]:
+        columns = self._columns
+        return tuple(int(columns[name][position]) for name in ("id_high", "id_low", "student", "date"))
+
+    def _remember(self, position: int):
+        columns, lookups = self._columns, self._lookups
+        if any(kind == PACKED_ID for kind, _, _ in self._layouts[int(columns["layout"][position])]):
+            lookups.recent_ids[(int(columns["id_high"][position]), int(columns["id_low"][position]))] = position
+        student, date = int(columns["student"][position]), int(columns["date"][position])
+        lookups.recent_cells.setdefault(student << 32 | date, []).append(position)
+        lookups.recent_students.setdefault(student, []).append(position)
+        lookups.recent_dates.setdefault(date, []).append(position)
+
+    def _refresh(self) -> Lookups:
+        """Current lookups, first folding the recent rows into the sorted arrays once there are enough of them"""
+        lookups = self._lookups
+        if lookups.rows and self._size - lookups.rows <= max(MIN_TAIL, lookups.rows // 8):
+            return lookups
+        with self._lookup_lock:
+            lookups = self._lookups
+            size = self._size
+            if lookups.rows and size - lookups.rows <= max(MIN_TAIL, lookups.rows // 8):
+                return lookups
+            columns = {name: column[:size] for name, column in self._columns.items()}
+            packed_layouts = np.array([any(kind == PACKED_ID for kind, _, _ in layout) for layout in self._layouts] or [False])
+            packed = np.nonzero(packed_layouts[columns["layout"]])[0]
+            id_order = packed[np.lexsort((columns["id_low"][packed], columns["id_high"][packed]))]
+            cells = columns["student"].astype(np.uint64) << np.uint64(32) | columns["date"].astype(np.uint64)
+            # Stable sorts keep each key's positions ascending
+            cell_order = np.argsort(cells, kind="stable")
+            date_order = np.argsort(columns["date"], kind="stable")
+            self._lookups = lookups = Lookups(
+                size,
+                columns["id_high"][id_order], columns["id_low"][id_order], id_order,
+                cells[cell_order], cell_order,
+                columns["date"][date_order], date_order,
+                {}, {}, {}, {},
+            )
+            return lookups
+
+    def position(self, record_id: str) -> Optional[int]:
+        """Position of the record with this ID, or None"""
+        named = self._named_ids.get(record_id)
+        if named is not None:
+            return named
+        parsed = parse_id(record_id)
+        if parsed is None:
+            return None
+        lookups = self._refresh()
+        high, low = parsed[1] >> 64, parsed[1] & LOW_64
+        recent = lookups.recent_ids.get((high, low))
+        if recent is not None:
+            return recent
+        first = np.searchsorted(lookups.id_high, np.uint64(high), "left")
+        last = np.searchsorted(lookups.id_high, np.uint64(high), "right")
+        at = first + np.searchsorted(lookups.id_low[first:last], np.uint64(low), "left")
+        if at < last and lookups.id_low[at] == low:
+            position = int(lookups.id_positions[at])
+            # Only a match if the record still has a generated ID with this prefix
+            if self._record_id(position) == record_id:
+                return position
+        return None
+
+    def _record_id(self, position: int) -> Optional[str]:
+        for kind, key, argument in self._layouts[int(self._columns["layout"][position])]:
+            if key == "id":
+                if kind == PACKED_ID:
+                    return argument + IdGenerator.encode(int(self._columns["id_high"][position]) << 64 | int(self._columns["id_low"][position]))
+                return self._verbatim[position]["id"]
+        return None
+
+    def positions(
+        self,
+        student_ids: Optional[Iterable[str]] = None,
+        date: Optional[str] = None,
+    ) -> Sequence[int]:
+        """Ascending positions of the records of these students (all when None) on `date` (any when None).
+
+        Each student or date is one range of a sorted lookup, so the cost
+        follows the number of students asked for and records returned, not
+        the size of the school.
+        """
+        if student_ids is None and not date:
+            return range(self._size)
+        date_number = self._date_numbers.get(date) if date else None
+        if date and date_number is None:
+            return []
+        if student_ids is None and date_number is not None:
+            lookups = self._refresh()
+            first = np.searchsorted(lookups.date_keys, date_number, "left")
+            last = np.searchsorted(lookups.date_keys, date_number, "right")
+            return lookups.date_positions[first:last].tolist() + lookups.recent_dates.get(date_number, [])
+        numbers = [self._student_numbers[s] for s in student_ids or () if s in self._student_numbers]
+        if not numbers:
+            return []
+        lookups = self._refresh()
+
+        starts = np.array(numbers, dtype=np.uint64) << np.uint64(32)
+        if date_number is None:
+            lows, highs = starts, starts | np.uint64(LOW_32)
+            recent = [lookups.recent_students.get(number, []) for number in numbers]
+        else:
+            lows = highs = starts | np.uint64(date_number)
+            recent = [lookups.recent_cells.get(number << 32 | date_number, []) for number in numbers]
+        firsts = np.searchsorted(lookups.cell_keys, lows, "left").tolist()
+        lasts = np.searchsorted(lookups.cell_keys, highs, "right").tolist()
+        ranges = [lookups.cell_positions[first:last] for first, last in zip(firsts, lasts) if first < last]
+        # Sorted rows all come before the recent ones
+        found = np.sort(np.concatenate(ranges)).tolist() if ranges else []
+        tail = [position for positions in recent for position in positions]
+        return found + (sorted(tail) if len(recent) > 1 else tail)
+
+    def frame(self) -> "AttendanceFrame":
+        """Copy of the columns for vectorized queries; take it under the writers' lock"""
+        return AttendanceFrame(self)
+
+    def nbytes(self) -> int:
+        """Approximate memory held for the rows: columns, lookups, image URLs and the sparse table's entries"""
+        arrays = list(self._columns.values()) + [a for a in self._lookups if isinstance(a, np.ndarray)]
+        return sum(a.nbytes for a in arrays) + 120 * len(self._image_urls) + 200 * len(self._verbatim)
+
+
+class AttendanceFrame:
+    """A point-in-time copy of AttendanceColumns for range queries"""
+
+    def __init__(self, store: AttendanceColumns):
+        size = len(store)
+        self.students = list(store.students)
+        self.dates = list(store.dates)
+        self.flags = list(store.flags)
+        self.student = store._columns["student"][:size].copy()
+        self.date = store._columns["date"][:size].copy()
+        self.present = store._columns["flags"][:size].copy()
+        # Flag bits each record carries; a slot a record has no value for is not counted in totals
+        self.marked = np.array(store._layout_flags or [0], dtype=np.uint8)[store._columns["layout"][:size]]
+        days = np.array(store._date_days + [-1], dtype=np.int32)
+        # NO_DATE rows read the trailing -1
+        self.day = days[np.minimum(self.date, len(store._date_days))]
+
+    def select(self, start: Optional[str] = None, end: Optional[str] = None,
+               student_ids: Optional[Iterable[str]] = None) -> np.ndarray:
+        """Boolean mask of the dated records in [start, end] for the given students (all when None)"""
+        keep = self.day >= 0
+        if start:
+            keep &= self.day >= day_number(start)
+        if end:
+            keep &= self.day <= day_number(end)
+        if student_ids is not None:
+            student_ids = set(student_ids)
+            wanted = np.fromiter((s in student_ids for s in self.students), dtype=bool, count=len(self.students))
+            # NO_STUDENT rows read the trailing False
+            keep &= np.append(wanted, False)[np.minimum(self.student, len(self.students))]
+        return keep
+
+    def presence(self, keep: np.ndarray, time_slots: Sequence[str]) -> Dict[str, Tuple[int, int]]:
+        """(present, total) per time slot over the selected records"""
+        present, marked = self.present[keep], self.marked[keep]
+        counts = {}
+        for slot in time_slots:
+            if slot not in self.flags:
+                counts[slot] = (0, 0)
+                continue
+            bit = self.flags.index(slot)
+            counts[slot] = (int(np.count_nonzero(present >> bit & 1)), int(np.count_nonzero(marked >> bit & 1)))
+        return counts
+
+    def grid(self, keep: np.ndarray, student_ids: Sequence[str],
+             time_slots: Sequence[str]) -> Tuple[List[str], np.ndarray]:
+        """Sorted dates and a students × dates matrix of slot masks in `time_slots` bit order, -1 where unmarked.
+
+        With several records for one student and day the last one written wins.
+        """
+        rows = np.nonzero(keep)[0]
+        dates = sorted({self.dates[number] for number in np.unique(self.date[rows]).tolist()})
+        column_of = {date: column for column, date in enumerate(dates)}
+        date_column = np.array([column_of.get(date, -1) for date in self.dates] + [-1], dtype=np.int64)
+        row_of = {student: row for row, student in enumerate(student_ids)}
+        student_row = np.array([row_of.get(student, -1) for student in self.students] + [-1], dtype=np.int64)
+
+        present = self.present[rows].astype(np.int16)
+        masks = np.zeros(len(rows), dtype=np.int16)
+        for bit, slot in enumerate(time_slots):
+            if slot in self.flags:
+                masks |= (present >> self.flags.index(slot) & 1) << bit
+        target_row = student_row[np.minimum(self.student[rows], len(self.students))]
+        target_column = date_column[np.minimum(self.date[rows], len(self.dates))]
+        listed = (target_row >= 0) & (target_column >= 0)
+        grid = np.full((len(student_ids), len(dates)), -1, dtype=np.int16)
+        # Repeated cells are assigned in row order, so the latest record wins
+        grid[target_row[listed], target_column[listed]] = masks[listed]
+        return dates, grid
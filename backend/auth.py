@@ -0,0 +1,117 @@
+import hashlib
+import heapq
+import logging
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from jose import JWTError, jwt
+
+logger = logging.getLogger(__name__)
+
+JWT_ALGORITHM = "HS256"
+DEFAULT_TOKEN_TTL = 12 * 60 * 60
+DEFAULT_TOKEN_CACHE_SIZE = 10000
+
+
+class InvalidToken(Exception):
+    pass
+
+
+class TokenCache:
+    """Bounded LRU of verified token claims keyed by SHA-256 of the token.
+
+    Entries also leave the cache when the token expires, so a cached hit is
+    always as valid as a fresh signature check would be.
+    """
+
+    def __init__(self, maxsize: int = DEFAULT_TOKEN_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._entries: "OrderedDict[bytes, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        # (expiry, key) min-heap used to drop expired entries without scanning
+        self._expiries: List[Tuple[float, bytes]] = []
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(token: str) -> bytes:
+        return hashlib.sha256(token.encode()).digest()
+
+    def get(self, key: bytes, now: float) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, claims = entry
+            if expires <= now:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return claims
+
+    def put(self, key: bytes, expires: float, claims: Dict[str, Any], now: float):
+        with self._lock:
+            while self._expiries and self._expiries[0][0] <= now:
+                expired_at, expired_key = heapq.heappop(self._expiries)
+                entry = self._entries.get(expired_key)
+                if entry is not None and entry[0] == expired_at:
+                    del self._entries[expired_key]
+            self._entries[key] = (expires, claims)
+            self._entries.move_to_end(key)
+            heapq.heappush(self._expiries, (expires, key))
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+            # Evicted keys leave stale heap items behind; rebuild before the heap outgrows the cache
+            if len(self._expiries) > 2 * self.maxsize:
+                self._expiries = [(e, k) for k, (e, _) in self._entries.items()]
+                heapq.heapify(self._expiries)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class TokenService:
+    """Issues and verifies signed access tokens carrying user id, role and tenant"""
+
+    def __init__(self, secret_key: str, ttl: int = DEFAULT_TOKEN_TTL, cache_size: int = DEFAULT_TOKEN_CACHE_SIZE):
+        self.secret_key = secret_key
+        self.ttl = ttl
+        self.cache = TokenCache(cache_size)
+
+    def issue(self, user_id: str, role: str, tenant_id: str) -> Tuple[str, int]:
+        """Return (token, expiry as a unix timestamp)"""
+        now = int(time.time())
+        expires = now + self.ttl
+        claims = {"sub": user_id, "role": role, "tenant": tenant_id, "iat": now, "exp": expires}
+        return jwt.encode(claims, self.secret_key, algorithm=JWT_ALGORITHM), expires
+
+    def verify(self, token: str) -> Dict[str, Any]:
+        now = time.time()
+        key = TokenCache.key(token)
+        claims = self.cache.get(key, now)
+        if claims is not None:
+            return claims
+        try:
+            # Checks the signature and exp
+            claims = jwt.decode(token, self.secret_key, algorithms=[JWT_ALGORITHM])
+        except JWTError as exc:
+            raise InvalidToken(str(exc))
+        if not all(isinstance(claims.get(c), str) for c in ("sub", "role", "tenant")) or "exp" not in claims:
+            raise InvalidToken("Token is missing required claims")
+        self.cache.put(key, float(claims["exp"]), claims, now)
+        return claims
+
+
+def create_token_service() -> TokenService:
+    secret_key = os.getenv("SECRET_KEY")
+    if not secret_key:
+        # Tokens then only verify in this process; set SECRET_KEY when running several workers
+        logger.warning("SECRET_KEY is not set; using a random key for this process")
+        secret_key = secrets.token_urlsafe(32)
+    return TokenService(
+        secret_key,
+        ttl=int(os.getenv("ACCESS_TOKEN_TTL", str(DEFAULT_TOKEN_TTL))),
+        cache_size=int(os.getenv("TOKEN_CACHE_SIZE", str(DEFAULT_TOKEN_CACHE_SIZE))),
+    )
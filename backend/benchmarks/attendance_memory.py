@@ -0,0 +1,133 @@
+"""Memory and query time of in-memory attendance: dict records vs AttendanceColumns.
+
+Generates one synthetic school, whose present records carry a captured
+morning image URL, and measures, with tracemalloc:
+
+  dicts    - the attendance records as a list of dicts plus the TenantIndex
+             entries over them (the store before AttendanceColumns)
+  columns  - the same records as AttendanceColumns, which index themselves
+
+then times a school-wide presence count, a one-month class presence count
+and a one-month class register grid on the columns, against the equivalent
+loop over the dict records.
+
+Run from the backend directory: python benchmarks/attendance_memory.py [--students 2000] [--days 200]
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from attendancestore import AttendanceColumns
+from indexes import TenantIndex
+from synthetic import TIME_SLOTS, generate
+
+
+def measure(build):
+    """(result, bytes still allocated by build())"""
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    result = build()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, after - before
+
+
+def best_ms(run, repeat: int) -> float:
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        run()
+        times.append((time.perf_counter() - started) * 1000)
+    return statistics.median(times)
+
+
+def loop_presence(records, start, end, students):
+    counts = {slot: [0, 0] for slot in TIME_SLOTS}
+    for record in records:
+        if start <= record["date"] <= end and (students is None or record["student_id"] in students):
+            for slot in TIME_SLOTS:
+                if slot in record:
+                    counts[slot][1] += 1
+                    counts[slot][0] += record[slot] is True
+    return counts
+
+
+def loop_grid(records, start, end, students):
+    grid = {}
+    for record in records:
+        if start <= record["date"] <= end and record["student_id"] in students:
+            grid[(record["student_id"], record["date"])] = sum(
+                1 << bit for bit, slot in enumerate(TIME_SLOTS) if record.get(slot)
+            )
+    return grid
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--students", type=int, default=2000)
+    parser.add_argument("--days", type=int, default=200)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    data = generate(schools=1, students=args.students, days=args.days)
+    tenant = data["tenants"]["bench1"]
+    source = tenant.pop("attendance")
+    students = tenant["students"]
+    print(f"{len(source)} attendance records, {len(students)} students, {args.days} days")
+
+    def build_dicts():
+        # Fresh dicts, so the measurement holds the records themselves and not just the list
+        records = [dict(record, captured_images=dict(record["captured_images"])) for record in source]
+        return records, TenantIndex({"students": students, "attendance": records})
+
+    def build_columns():
+        columns = AttendanceColumns("bench1", source)
+        return columns, TenantIndex({"students": students, "attendance": columns})
+
+    (records, dict_index), dict_bytes = measure(build_dicts)
+    (columns, column_index), column_bytes = measure(build_columns)
+    print(f"dicts    {dict_bytes / 2 ** 20:8.1f} MiB")
+    print(f"columns  {column_bytes / 2 ** 20:8.1f} MiB  ({dict_bytes / column_bytes:.1f}x smaller)")
+
+    dates = sorted({record["date"] for record in source})
+    # About a month of school days, or every day when fewer were generated
+    start, end = dates[-min(22, len(dates))], dates[-1]
+    first = students[0]
+    roster = {s["id"] for s in students if (s["class"], s["section"]) == (first["class"], first["section"])}
+    ordered = sorted(roster)
+
+    def columns_presence(start, end, student_ids):
+        frame = columns.frame()
+        return frame.presence(frame.select(start, end, student_ids), TIME_SLOTS)
+
+    def columns_grid():
+        frame = columns.frame()
+        return frame.grid(frame.select(start, end, roster), ordered, TIME_SLOTS)
+
+    cases = [
+        ("school presence, all days", lambda: loop_presence(records, dates[0], dates[-1], None),
+         lambda: columns_presence(None, None, None)),
+        ("class presence, one month", lambda: loop_presence(records, start, end, roster),
+         lambda: columns_presence(start, end, roster)),
+        ("class grid, one month", lambda: loop_grid(records, start, end, roster), columns_grid),
+    ]
+    for name, filters in [
+        ("indexed class, one day", dict(class_name=first["class"], section=first["section"], date=end)),
+        ("indexed student history", dict(student_id=first["id"])),
+        ("indexed school, one day", dict(date=end)),
+    ]:
+        cases.append((name, lambda filters=filters: list(dict_index.positions("attendance", **filters)),
+                      lambda filters=filters: list(column_index.positions("attendance", **filters))))
+    print(f"\n{'query':28} {'dicts ms':>10} {'columns ms':>11}")
+    for name, on_dicts, on_columns in cases:
+        print(f"{name:28} {best_ms(on_dicts, args.repeat):10.2f} {best_ms(on_columns, args.repeat):11.2f}")
+
+
+if __name__ == "__main__":
+    main()
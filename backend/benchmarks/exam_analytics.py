@@ -0,0 +1,80 @@
+"""Latency of the exam reports on one synthetic school.
+
+Times, against the in-memory store:
+
+  build      - loading every exam's score matrix from the repository (first query, or after another worker's write)
+  record     - applying one new result in place, as POST /api/exam-results does
+  rankings   - school-wide and one-class rankings of the latest annual exam
+  subjects   - subject statistics, school-wide with the per-class breakdown
+  trends     - per-exam means of one class and one student's scores
+
+Run from the backend directory: python benchmarks/exam_analytics.py [--students 5000] [--repeat 20]
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from examstats import ExamStats, rankings, subject_stats, trends
+from repository import MemoryRepository
+from synthetic import generate
+
+
+def median_ms(run, repeat: int) -> float:
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        run()
+        times.append((time.perf_counter() - started) * 1000)
+    return statistics.median(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--students", type=int, default=5000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    data = generate(schools=1, students=args.students, days=1)
+    repo = MemoryRepository(data)
+    student = data["tenants"]["bench1"]["students"][0]
+    class_name, section = student["class"], student["section"]
+    print(f"{len(data['tenants']['bench1']['exam_results'])} exam results, {args.students} students")
+
+    def build():
+        ExamStats(repo).exams("bench1")
+
+    stats = ExamStats(repo)
+
+    def annual():
+        found = stats.frame("bench1", "annual")
+        assert found is not None, "the synthetic school has annual results"
+        return found
+
+    (_, day), _ = annual()
+    result = {"id": "bench-result", "student_id": student["id"], "exam_type": "annual", "date": day,
+              "scores": {"math": 91, "english": 84, "science": 77}, "school_id": "bench1"}
+
+    def record():
+        repo.add("bench1", "exam_results", result)
+        stats.record("bench1", result)
+
+    cases = [
+        ("build", build),
+        ("record", record),
+        ("rankings, school", lambda: rankings(annual()[1])),
+        ("rankings, one class", lambda: rankings(annual()[1], class_name, section)),
+        ("subjects, school", lambda: subject_stats(annual()[1])),
+        ("trends, one class", lambda: trends(stats.frames("bench1"), class_name=class_name, section=section)),
+        ("trends, one student", lambda: trends(stats.frames("bench1"), student_id=student["id"])),
+    ]
+    for name, run in cases:
+        print(f"{name:22} {median_ms(run, args.repeat):8.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""Per-request latency of large list responses: default FastAPI encoding vs FastJSONResponse.
+
+Builds fee records (with installments) and attendance records for tenants of
+1k, 10k and 100k rows and times one GET per route through the ASGI app:
+
+  default  - the route returns the list; FastAPI runs jsonable_encoder, then json.dumps
+  fast     - the route returns FastJSONResponse (orjson when installed)
+  fallback - FastJSONResponse with orjson disabled (stdlib json, no encoder walk)
+
+Run from the backend directory: python benchmarks/json_encoding.py [--rows 1000,10000] [--repeat 5]
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import jsonresponse
+from jsonresponse import FastJSONResponse
+
+
+def fee_rows(count: int):
+    return [
+        {
+            "id": f"fee{i}", "student_id": f"student{i % 2000}", "academic_year": "2024-2025",
+            "total_amount": 50000, "paid_amount": 30000, "remaining_amount": 20000,
+            "due_date": "2024-12-31", "status": "partial", "school_id": "school1",
+            "installments": [
+                {"id": f"inst{i}-{n}", "amount": 12500, "due_date": f"2024-{3 * n + 3:02d}-30",
+                 "paid_date": "2024-06-15" if n < 2 else None, "status": "paid" if n < 2 else "pending"}
+                for n in range(4)
+            ],
+        }
+        for i in range(count)
+    ]
+
+
+def attendance_rows(count: int):
+    return [
+        {"id": f"att{i}", "student_id": f"student{i % 2000}", "date": f"2024-{i % 12 + 1:02d}-{i % 28 + 1:02d}",
+         "morning": True, "afternoon": i % 3 != 0, "captured_images": {"morning": "", "afternoon": ""},
+         "school_id": "school1"}
+        for i in range(count)
+    ]
+
+
+def build_app(data):
+    app = FastAPI()
+
+    @app.get("/default/{name}")
+    async def default(name: str):
+        return data[name]
+
+    @app.get("/fast/{name}", response_class=FastJSONResponse)
+    async def fast(name: str):
+        return FastJSONResponse(data[name])
+
+    return app
+
+
+def timed(client: TestClient, path: str, repeat: int) -> float:
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        response = client.get(path)
+        samples.append(time.perf_counter() - started)
+        assert response.status_code == 200
+    return statistics.median(samples) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", default="1000,10000,100000")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    orjson = jsonresponse.orjson
+    results = []
+    for rows in (int(r) for r in args.rows.split(",")):
+        data = {"fees": fee_rows(rows), "attendance": attendance_rows(rows)}
+        client = TestClient(build_app(data))
+        for name in data:
+            # Identical documents either way
+            assert json.loads(client.get(f"/default/{name}").content) == json.loads(client.get(f"/fast/{name}").content)
+            result = {"rows": rows, "route": name, "default_ms": timed(client, f"/default/{name}", args.repeat)}
+            if orjson is not None:
+                result["fast_ms"] = timed(client, f"/fast/{name}", args.repeat)
+            jsonresponse.orjson = None
+            result["fallback_ms"] = timed(client, f"/fast/{name}", args.repeat)
+            jsonresponse.orjson = orjson
+            result["speedup"] = round(result["default_ms"] / result.get("fast_ms", result["fallback_ms"]), 1)
+            results.append(result)
+            print(f"{rows:>7} {name:<10} " + "  ".join(
+                f"{k}={v:.1f}" for k, v in result.items() if k.endswith("_ms")
+            ) + f"  x{result['speedup']}")
+    return results
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,309 @@
+"""In-process load test: synthetic schools, scripted scenarios, JSON latency report.
+
+Requests go straight to the ASGI app over httpx (no network, no server), with
+`--concurrency` requests in flight. Scenarios:
+
+  morning_rush    every teacher submits their class (bitmap batch or one POST per
+                  student), then reloads the class list for the day
+  reports         admins pull attendance reports for every scope/period and a CSV export
+  fee_day         admins list overdue dues and record payments; parents check their fees
+  parent_polling  every parent polls attendance, exam results and fees `--rounds` times,
+                  sending If-None-Match like a browser does
+
+Run from the backend directory:
+
+  python benchmarks/load.py --schools 3 --students 500 --output results.json
+  python benchmarks/load.py --backend sql --scenarios morning_rush,fee_day
+
+The report has, per scenario and per route: request count, errors, p50/p95/p99
+and max latency in milliseconds, and throughput in requests per second.
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from typing import Any, Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+import httpx
+
+from synthetic import TIME_SLOTS, generate
+
+SCENARIOS = ("morning_rush", "reports", "fee_day", "parent_polling")
+
+
+class Call(NamedTuple):
+    route: str
+    method: str
+    url: str
+    headers: Dict[str, str]
+    json: Optional[Any] = None
+    # Receives the response, e.g. to remember an ETag
+    after: Optional[Callable[[httpx.Response], None]] = None
+
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    """Nearest-rank percentile of an ascending list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, int(round(fraction * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[rank]
+
+
+def summarize(latencies: List[float], errors: int, duration: float) -> Dict[str, Any]:
+    ordered = sorted(latencies)
+    return {
+        "requests": len(ordered),
+        "errors": errors,
+        "throughput_rps": round(len(ordered) / duration, 1) if duration else 0.0,
+        "latency_ms": {
+            "p50": round(percentile(ordered, 0.50) * 1000, 2),
+            "p95": round(percentile(ordered, 0.95) * 1000, 2),
+            "p99": round(percentile(ordered, 0.99) * 1000, 2),
+            "max": round(ordered[-1] * 1000, 2) if ordered else 0.0,
+            "mean": round(statistics.fmean(ordered) * 1000, 2) if ordered else 0.0,
+        },
+    }
+
+
+async def run_phases(client: httpx.AsyncClient, phases: List[Iterable[Call]], concurrency: int) -> Dict[str, Any]:
+    """Run each phase's calls `concurrency` at a time; a phase starts when the previous one is done"""
+    latencies: Dict[str, List[float]] = defaultdict(list)
+    errors: Dict[str, int] = defaultdict(int)
+
+    async def worker(calls: Iterator[Call]):
+        for call in calls:
+            started = time.perf_counter()
+            response = await client.request(call.method, call.url, headers=call.headers, json=call.json)
+            await response.aread()
+            latencies[call.route].append(time.perf_counter() - started)
+            if response.status_code >= 400:
+                errors[call.route] += 1
+            if call.after is not None:
+                call.after(response)
+
+    started = time.perf_counter()
+    for phase in phases:
+        # Workers share one iterator, so each call is made exactly once
+        calls = iter(phase)
+        await asyncio.gather(*[worker(calls) for _ in range(concurrency)])
+    duration = time.perf_counter() - started
+
+    everything = [latency for values in latencies.values() for latency in values]
+    result = summarize(everything, sum(errors.values()), duration)
+    result["duration_s"] = round(duration, 3)
+    result["routes"] = {route: summarize(values, errors[route], duration) for route, values in sorted(latencies.items())}
+    return result
+
+
+class Workload:
+    """Users and tokens of the generated schools, and the scenario scripts"""
+
+    def __init__(self, main, data: Dict[str, Any], today: str):
+        self.data = data
+        self.today = today
+        self.sessions: Dict[str, Dict[str, Dict[str, str]]] = {}
+        for school in data["schools"]:
+            tenant_id = school["id"]
+            by_role: Dict[str, Dict[str, str]] = {}
+            for user in data["tenants"][tenant_id]["users"]:
+                # Tokens are issued directly: logins (bcrypt) are not what these scenarios measure
+                token, _ = main.tokens.issue(user["id"], user["role"], tenant_id)
+                by_role[user["id"]] = {"Authorization": f"Bearer {token}", "X-School-Domain": school["domain"]}
+            self.sessions[tenant_id] = by_role
+
+    def headers(self, tenant_id: str, user_id: str) -> Dict[str, str]:
+        return self.sessions[tenant_id][user_id]
+
+    def tenants(self):
+        for school in self.data["schools"]:
+            yield school["id"], self.data["tenants"][school["id"]]
+
+    def morning_rush(self) -> List[Iterable[Call]]:
+        return [self._submit_attendance(), self._class_lists()]
+
+    def _submit_attendance(self) -> Iterator[Call]:
+        for tenant_id, tenant in self.tenants():
+            roster: Dict[tuple, List[str]] = defaultdict(list)
+            for student in tenant["students"]:
+                roster[(student["class"], student["section"])].append(student["id"])
+            for number, teacher in enumerate(tenant["teachers"]):
+                headers = self.headers(tenant_id, f"user-{teacher['id']}")
+                students = roster[(teacher["class"], teacher["section"])]
+                if number % 4 == 3:
+                    # Some classes are captured one student at a time from a phone
+                    for student_id in students:
+                        yield Call("POST /api/attendance", "POST", "/api/attendance", headers, {
+                            "student_id": student_id, "date": self.today, "morning": True,
+                        })
+                else:
+                    yield Call("POST /api/attendance/batch", "POST", "/api/attendance/batch", headers, {"bitmap": {
+                        "date": self.today, "time_slots": TIME_SLOTS[:1], "class_name": teacher["class"],
+                        "section": teacher["section"], "marks": {s: 1 for s in students},
+                    }})
+
+    def _class_lists(self) -> Iterator[Call]:
+        for tenant_id, tenant in self.tenants():
+            for teacher in tenant["teachers"]:
+                headers = self.headers(tenant_id, f"user-{teacher['id']}")
+                yield Call("GET /api/attendance?class", "GET",
+                           f"/api/attendance?class_name={teacher['class']}&section={teacher['section']}&date={self.today}",
+                           headers)
+
+    def reports(self) -> List[Iterable[Call]]:
+        return [self._reports()]
+
+    def _reports(self) -> Iterator[Call]:
+        for tenant_id, tenant in self.tenants():
+            headers = self.headers(tenant_id, "user-admin")
+            for period in ("day", "week", "month"):
+                yield Call("GET /api/reports/attendance?scope=school", "GET",
+                           f"/api/reports/attendance?scope=school&period={period}", headers)
+                yield Call("GET /api/reports/attendance?scope=class", "GET",
+                           f"/api/reports/attendance?scope=class&period={period}", headers)
+            for student in tenant["students"][:50]:
+                yield Call("GET /api/reports/attendance?scope=student", "GET",
+                           f"/api/reports/attendance?scope=student&period=month&student_id={student['id']}", headers)
+            first = tenant["teachers"][0]
+            yield Call("GET /api/exports/attendance", "GET",
+                       f"/api/exports/attendance?class_name={first['class']}&section={first['section']}", headers)
+
+    def fee_day(self) -> List[Iterable[Call]]:
+        dues: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+
+        def lookups() -> Iterator[Call]:
+            for tenant_id, _ in self.tenants():
+                yield Call("GET /api/fees/dues", "GET", "/api/fees/dues?kind=overdue&limit=200",
+                           self.headers(tenant_id, "user-admin"),
+                           after=lambda response, tenant_id=tenant_id: dues[tenant_id].extend(response.json()))
+
+        return [lookups(), self._collect(dues)]
+
+    def _collect(self, dues: Dict[str, List[Dict[str, Any]]]) -> Iterator[Call]:
+        for tenant_id, tenant in self.tenants():
+            admin = self.headers(tenant_id, "user-admin")
+            for due in dues[tenant_id]:
+                yield Call("POST /api/fees/{id}/installments/{id}/pay", "POST",
+                           f"/api/fees/{due['fee_id']}/installments/{due['installment_id']}/pay", admin,
+                           {"paid_date": self.today, "payment_method": "cash"})
+            yield Call("GET /api/fees/summary", "GET", "/api/fees/summary?scope=year", admin)
+            for student in tenant["students"]:
+                parent = self.headers(tenant_id, f"user-{student['parent_id']}")
+                yield Call("GET /api/fees?student_id", "GET", f"/api/fees?student_id={student['id']}", parent)
+
+    def parent_polling(self, rounds: int) -> List[Iterable[Call]]:
+        etags: Dict[tuple, str] = {}
+
+        def remember(key):
+            def after(response: httpx.Response):
+                if "etag" in response.headers:
+                    etags[key] = response.headers["etag"]
+            return after
+
+        def poll() -> Iterator[Call]:
+            for tenant_id, tenant in self.tenants():
+                for student in tenant["students"]:
+                    headers = self.headers(tenant_id, f"user-{student['parent_id']}")
+                    for path in ("/api/attendance", "/api/exam-results", "/api/fees"):
+                        key = (tenant_id, student["id"], path)
+                        conditional = {**headers, "If-None-Match": etags[key]} if key in etags else headers
+                        yield Call(f"GET {path}?student_id", "GET", f"{path}?student_id={student['id']}",
+                                   conditional, after=remember(key))
+
+        # Each round is a phase, so later rounds see the ETags of earlier ones
+        return [poll() for _ in range(rounds)]
+
+
+def load_app(data: Dict[str, Any], backend: str, database_url: Optional[str]):
+    """Import the app and swap its store for one holding `data`"""
+    # The demo seed that main builds on import is replaced right after
+    os.environ["STORAGE_BACKEND"] = "memory"
+    os.environ.pop("MEMORY_JOURNAL_DIR", None)
+    # Measures the handlers themselves; the scenarios would otherwise be shed at the rate limits
+    os.environ.setdefault("RATE_LIMIT_ENABLED", "false")
+    import main
+    from database import create_db_engine
+    from httpcache import create_response_cache
+    from repository import MemoryRepository, SQLRepository
+    from schools import SchoolRegistry
+
+    if backend == "sql":
+        repo = SQLRepository(create_db_engine(database_url))
+        repo.init_schema(data)
+    else:
+        repo = MemoryRepository(data)
+    main.repo = repo
+    main.schools = SchoolRegistry(repo)
+    main.response_cache = create_response_cache()
+    return main
+
+
+def main():
+    parser = argparse.ArgumentParser(description="In-process load test with synthetic schools")
+    parser.add_argument("--schools", type=int, default=3)
+    parser.add_argument("--students", type=int, default=500, help="students per school")
+    parser.add_argument("--days", type=int, default=60, help="school days of attendance history")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--backend", choices=("memory", "sql"), default="memory")
+    parser.add_argument("--database-url", help="SQL backend only; defaults to a fresh SQLite file")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--rounds", type=int, default=3, help="parent polling rounds")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    args = parser.parse_args()
+
+    scenarios = [s.strip() for s in args.scenarios.split(",") if s.strip()]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+
+    output = os.path.abspath(args.output) if args.output else None
+    workdir = tempfile.mkdtemp(prefix="load-")
+    # main writes uploads/ relative to the working directory
+    os.chdir(workdir)
+    database_url = args.database_url or f"sqlite:///{os.path.join(workdir, 'load.db')}"
+
+    started = time.perf_counter()
+    data = generate(args.schools, args.students, args.days, args.seed)
+    app_module = load_app(data, args.backend, database_url)
+    today = "2024-12-02"
+    workload = Workload(app_module, data, today)
+    setup = time.perf_counter() - started
+    print(f"Loaded {args.schools} schools x {args.students} students in {setup:.1f}s", file=sys.stderr)
+
+    async def run_all() -> Dict[str, Any]:
+        transport = httpx.ASGITransport(app=app_module.app)
+        results = {}
+        async with httpx.AsyncClient(transport=transport, base_url="http://load") as client:
+            for name in scenarios:
+                phases = workload.parent_polling(args.rounds) if name == "parent_polling" else getattr(workload, name)()
+                results[name] = await run_phases(client, phases, args.concurrency)
+                summary = results[name]
+                print(f"{name:<15} {summary['requests']:>6} req  {summary['errors']:>4} err  "
+                      f"{summary['throughput_rps']:>8} req/s  p50 {summary['latency_ms']['p50']} ms  "
+                      f"p95 {summary['latency_ms']['p95']} ms  p99 {summary['latency_ms']['p99']} ms", file=sys.stderr)
+        return results
+
+    report = {
+        "config": {k: v for k, v in vars(args).items() if k not in ("output", "database_url")},
+        "setup_s": round(setup, 2),
+        "scenarios": asyncio.run(run_all()),
+    }
+    app_module.repo.close()
+    text = json.dumps(report, indent=2)
+    if output:
+        with open(output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
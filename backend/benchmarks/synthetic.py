@@ -0,0 +1,142 @@
+"""Seeded synthetic tenants in the mock_data shape, for benchmarks and load tests.
+
+    data = generate(schools=3, students=500, days=60, seed=7)
+
+The same arguments always produce the same data. Logins use plaintext demo
+passwords like the seed ("admin123", "teacher123", "parent123").
+"""
+import hashlib
+import random
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, Dict, List
+
+from blobstore import blob_url
+from ids import IdGenerator
+
+TIME_SLOTS = ["morning", "afternoon", "evening"]
+SUBJECTS = ["math", "english", "science", "history", "geography"]
+EXAM_TYPES = ["quarterly", "half-yearly", "annual"]
+SECTIONS = ["A", "B", "C", "D"]
+FIRST_NAMES = ["Aarav", "Maya", "Liam", "Zara", "Noah", "Ivy", "Omar", "Lena", "Ravi", "Emma", "Kai", "Sofia"]
+LAST_NAMES = ["Patel", "Smith", "Khan", "Garcia", "Chen", "Okafor", "Silva", "Novak", "Brown", "Ito"]
+
+
+def school_days(end: date, days: int) -> List[str]:
+    """The last `days` weekdays up to and including `end`, oldest first"""
+    result = []
+    current = end
+    while len(result) < days:
+        if current.weekday() < 5:
+            result.append(current.isoformat())
+        current -= timedelta(days=1)
+    return result[::-1]
+
+
+def generate_tenant(school_id: str, domain: str, students: int, days: int, rng: random.Random,
+                    end: date) -> Dict[str, List[Dict[str, Any]]]:
+    classes = [str(c) for c in range(1, 13)]
+    class_sections = [(c, s) for c in classes for s in SECTIONS]
+    per_class = max(1, students // len(class_sections))
+
+    tenant: Dict[str, List[Dict[str, Any]]] = {
+        "users": [], "students": [], "teachers": [], "parents": [],
+        "attendance": [], "exam_results": [], "queries": [], "fees": [],
+    }
+    users = tenant["users"]
+    users.append({"id": "user-admin", "email": f"admin@{domain}.edu", "name": "Admin User", "role": "admin",
+                  "password": "admin123", "school_id": school_id})
+
+    for number in range(1, students + 1):
+        class_name, section = class_sections[min((number - 1) // per_class, len(class_sections) - 1)]
+        last = rng.choice(LAST_NAMES)
+        student_id, parent_id = f"student{number}", f"parent{number}"
+        tenant["students"].append({
+            "id": student_id, "name": f"{rng.choice(FIRST_NAMES)} {last}", "class": class_name,
+            "section": section, "photo_url": "", "parent_id": parent_id, "school_id": school_id,
+        })
+        tenant["parents"].append({
+            "id": parent_id, "father_name": f"{rng.choice(FIRST_NAMES)} {last}",
+            "mother_name": f"{rng.choice(FIRST_NAMES)} {last}", "children_ids": [student_id],
+            "phone": f"555{number:07d}", "school_id": school_id,
+        })
+        users.append({"id": f"user-{parent_id}", "email": f"{parent_id}@{domain}.edu", "name": f"Parent {number}",
+                      "role": "parent", "children": [student_id], "password": "parent123", "school_id": school_id})
+
+    used_classes = sorted({(s["class"], s["section"]) for s in tenant["students"]}, key=lambda cs: (int(cs[0]), cs[1]))
+    for number, (class_name, section) in enumerate(used_classes, 1):
+        teacher_id = f"teacher{number}"
+        tenant["teachers"].append({
+            "id": teacher_id, "name": f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}", "class": class_name,
+            "section": section, "phone": f"444{number:07d}", "photo_url": "", "school_id": school_id,
+        })
+        users.append({"id": f"user-{teacher_id}", "email": f"{teacher_id}@{domain}.edu", "name": f"Teacher {number}",
+                      "role": "teacher", "class": class_name, "section": section, "password": "teacher123",
+                      "school_id": school_id})
+
+    attendance = tenant["attendance"]
+    for day in school_days(end, days):
+        # Marked at 09:00 UTC; the same ULID shape as new_id("att"), but seeded
+        marked_ms = int(datetime.fromisoformat(day).replace(hour=9, tzinfo=timezone.utc).timestamp() * 1000)
+        for student in tenant["students"]:
+            present = rng.random() < 0.92
+            attendance_id = "att" + IdGenerator.encode(marked_ms << 80 | rng.getrandbits(80))
+            # Students marked present were photographed in the morning; a digest of the ID stands in for the image's
+            capture = blob_url(hashlib.sha256(attendance_id.encode()).hexdigest(), "jpg") if present else ""
+            attendance.append({
+                "id": attendance_id, "student_id": student["id"], "date": day,
+                "morning": present, "afternoon": present and rng.random() < 0.97, "evening": present and rng.random() < 0.9,
+                "captured_images": {"morning": capture, "afternoon": ""}, "school_id": school_id,
+            })
+
+    for term, exam_type in enumerate(EXAM_TYPES):
+        exam_date = (end - timedelta(days=120 - 40 * term)).isoformat()
+        for student in tenant["students"]:
+            ability = rng.randint(55, 90)
+            tenant["exam_results"].append({
+                "id": f"exam-{student['id']}-{exam_type}", "student_id": student["id"], "exam_type": exam_type,
+                "scores": {s: max(0, min(100, int(rng.gauss(ability, 10)))) for s in SUBJECTS},
+                "date": exam_date, "school_id": school_id,
+            })
+
+    year = f"{end.year}-{end.year + 1}"
+    for student in tenant["students"]:
+        installments = []
+        for n in range(4):
+            due = end + timedelta(days=90 * n - 120)
+            paid = due < end and rng.random() < 0.8
+            installments.append({
+                "id": f"inst-{student['id']}-{n + 1}", "amount": 12500, "due_date": due.isoformat(),
+                "paid_date": due.isoformat() if paid else None, "status": "paid" if paid else "pending",
+            })
+        paid_amount = sum(i["amount"] for i in installments if i["status"] == "paid")
+        tenant["fees"].append({
+            "id": f"fee-{student['id']}", "student_id": student["id"], "academic_year": year,
+            "total_amount": 50000, "paid_amount": paid_amount, "remaining_amount": 50000 - paid_amount,
+            "due_date": installments[-1]["due_date"],
+            "status": "paid" if paid_amount == 50000 else "partial" if paid_amount else "unpaid",
+            "school_id": school_id, "installments": installments,
+        })
+        if rng.random() < 0.05:
+            tenant["queries"].append({
+                "id": f"query-{student['id']}", "parent_id": student["parent_id"], "student_id": student["id"],
+                "message": "Could we schedule a meeting?", "status": "pending",
+                "date": end.isoformat(), "school_id": school_id,
+            })
+    return tenant
+
+
+def generate(schools: int = 3, students: int = 500, days: int = 60, seed: int = 7,
+             end: date = date(2024, 11, 29)) -> Dict[str, Any]:
+    """`schools` tenants with `students` students each and `days` school days of attendance ending at `end`"""
+    rng = random.Random(seed)
+    data: Dict[str, Any] = {"schools": [], "tenants": {}}
+    for number in range(1, schools + 1):
+        school_id, domain = f"bench{number}", f"bench{number}"
+        data["schools"].append({
+            "id": school_id, "name": f"Benchmark School {number}", "domain": domain,
+            "address": f"{number} Benchmark Road", "phone": f"555-{number:04d}", "email": f"admin@{domain}.edu",
+            "logo_url": "", "settings": {"time_slots": list(TIME_SLOTS), "classes": [str(c) for c in range(1, 13)],
+                                         "sections": list(SECTIONS)},
+        })
+        data["tenants"][school_id] = generate_tenant(school_id, domain, students, days, rng, end)
+    return data
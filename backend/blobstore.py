@@ -0,0 +1,71 @@
+import base64
+import binascii
+import hashlib
+import os
+import tempfile
+from typing import Dict, Optional
+
+# Blobs live under uploads/, which is served as static files at /uploads
+BLOB_DIR = os.path.join("uploads", "blobs")
+BLOB_URL_PREFIX = "/uploads/blobs"
+
+IMAGE_EXTENSIONS = {
+    "image/jpeg": "jpg",
+    "image/jpg": "jpg",
+    "image/png": "png",
+    "image/webp": "webp",
+    "image/gif": "gif",
+}
+
+
+def blob_path(digest: str, extension: str) -> str:
+    # Two-level fan-out keeps directories small on busy tenants
+    return os.path.join(BLOB_DIR, digest[:2], f"{digest}.{extension}")
+
+
+def blob_url(digest: str, extension: str) -> str:
+    return f"{BLOB_URL_PREFIX}/{digest[:2]}/{digest}.{extension}"
+
+
+def put_bytes(data: bytes, extension: str = "jpg") -> str:
+    """Store bytes under their SHA-256 and return the public URL; identical content is written once"""
+    digest = hashlib.sha256(data).hexdigest()
+    path = blob_path(digest, extension)
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write to a temp file and rename so readers never see a partial blob
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+    return blob_url(digest, extension)
+
+
+def decode_data_url(value: str):
+    """Split a base64 data URL into (bytes, extension)"""
+    header, _, payload = value.partition(",")
+    mime = header[len("data:"):].split(";")[0].lower()
+    extension = IMAGE_EXTENSIONS.get(mime)
+    if extension is None or ";base64" not in header or not payload:
+        raise ValueError(f"Unsupported image data ({mime or 'unknown type'})")
+    try:
+        return base64.b64decode(payload, validate=True), extension
+    except (binascii.Error, ValueError):
+        raise ValueError("Invalid base64 image data")
+
+
+def store_image(value: Optional[str]) -> str:
+    """Move an inline data URL into the blob store; URLs and empty values pass through unchanged"""
+    if not value or not value.startswith("data:"):
+        return value or ""
+    data, extension = decode_data_url(value)
+    return put_bytes(data, extension)
+
+
+def store_images(images: Dict[str, str]) -> Dict[str, str]:
+    return {slot: store_image(value) for slot, value in images.items()}
@@ -0,0 +1,325 @@
+import asyncio
+import json
+import logging
+import os
+from collections import deque
+from typing import Any, AsyncIterator, Callable, Deque, Dict, Iterable, List, Optional, Set
+
+from ids import new_id
+from jsonresponse import dumps
+
+try:
+    import redis.asyncio as redis_asyncio  # pyright: ignore[reportMissingImports]
+except ImportError:  # Only needed for CHANGE_FEED_BACKEND=redis
+    redis_asyncio = None
+
+logger = logging.getLogger(__name__)
+
+# The few fields of each collection an event carries; clients re-fetch the record if they need more.
+# Users are left out: nothing on the client watches them and their records hold password hashes.
+FEED_FIELDS = {
+    "attendance": ("student_id", "date"),
+    "queries": ("student_id", "parent_id", "status"),
+    "fees": ("student_id", "status"),
+    "exam_results": ("student_id", "exam_type"),
+    "students": ("class", "section"),
+    "teachers": ("class", "section"),
+    "parents": ("children_ids",),
+}
+FEED_COLLECTIONS = tuple(FEED_FIELDS)
+
+DEFAULT_QUEUE_SIZE = 256
+DEFAULT_HISTORY = 1000
+DEFAULT_HEARTBEAT = 20.0
+DEFAULT_MAX_AGE = 300.0
+RECONNECT_MS = 3000
+
+Deliver = Callable[[str, List[Dict[str, Any]]], None]
+
+
+def change_event(collection: str, op: str, record: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Compact event for one written record, or None for collections the feed skips"""
+    fields = FEED_FIELDS.get(collection)
+    if fields is None:
+        return None
+    event = {"id": new_id(), "collection": collection, "op": op, "record_id": record.get("id")}
+    for field in fields:
+        if record.get(field) is not None:
+            event[field] = record[field]
+    return event
+
+
+def format_event(event: Dict[str, Any]) -> bytes:
+    return b"id: " + event["id"].encode() + b"\nevent: change\ndata: " + dumps(event) + b"\n\n"
+
+
+# Events were dropped (slow reader, or Last-Event-ID too old): the client re-fetches its lists
+RESET = b"event: reset\ndata: {}\n\n"
+HEARTBEAT = b": keepalive\n\n"
+
+
+class Subscription:
+    """One connected client: its filter and a bounded buffer of events not yet sent.
+
+    A reader that falls `queue_size` events behind has its buffer dropped and
+    gets a single reset instead, so one stalled connection never holds more
+    than that in memory or slows delivery to the others.
+    """
+
+    def __init__(self, tenant_id: str, collections: Optional[Set[str]] = None,
+                 student_ids: Optional[Set[str]] = None, class_name: Optional[str] = None,
+                 section: Optional[str] = None, queue_size: int = DEFAULT_QUEUE_SIZE):
+        self.tenant_id = tenant_id
+        self.collections = collections
+        # None: every student; for a class filter the roster at subscribe time, kept current from student events
+        self.student_ids = student_ids
+        self.class_name = class_name
+        self.section = section
+        self.queue_size = queue_size
+        self.lagged = False
+        self._pending: Deque[Dict[str, Any]] = deque()
+        self._ready = asyncio.Event()
+
+    def accepts(self, event: Dict[str, Any]) -> bool:
+        collection = event["collection"]
+        if self.collections is not None and collection not in self.collections:
+            return False
+        if self.student_ids is None:
+            return True
+        if collection == "students":
+            if self.class_name is None:
+                return event["record_id"] in self.student_ids
+            if event.get("class") == self.class_name and event.get("section") == self.section:
+                self.student_ids.add(event["record_id"])
+                return True
+            if event["record_id"] in self.student_ids:
+                # Moved to another class: this last event is still of interest
+                self.student_ids.discard(event["record_id"])
+                return True
+            return False
+        if collection == "teachers":
+            return self.class_name is not None and event.get("class") == self.class_name and event.get("section") == self.section
+        if collection == "parents":
+            return not self.student_ids.isdisjoint(event.get("children_ids") or ())
+        return event.get("student_id") in self.student_ids
+
+    def push(self, event: Dict[str, Any]):
+        if self.lagged:
+            # The reset about to be sent covers this event too
+            return
+        if len(self._pending) >= self.queue_size:
+            self._pending.clear()
+            self.lagged = True
+        else:
+            self._pending.append(event)
+        self._ready.set()
+
+    async def next(self, timeout: float) -> List[Dict[str, Any]]:
+        """Events buffered so far, waiting up to `timeout` seconds for the first; [] on timeout"""
+        if not self._pending and not self.lagged:
+            try:
+                await asyncio.wait_for(self._ready.wait(), timeout)
+            except asyncio.TimeoutError:
+                return []
+        self._ready.clear()
+        events = list(self._pending)
+        self._pending.clear()
+        return events
+
+
+class LocalBroadcast:
+    """Delivers to this process only: enough for one worker or the memory store"""
+
+    def __init__(self):
+        self._deliver: Optional[Deliver] = None
+
+    async def start(self, deliver: Deliver):
+        self._deliver = deliver
+
+    def publish(self, tenant_id: str, events: List[Dict[str, Any]]):
+        if self._deliver is not None:
+            self._deliver(tenant_id, events)
+
+    async def stop(self):
+        self._deliver = None
+
+
+class RedisBroadcast:
+    """Relays events through one Redis pub/sub channel so every worker's clients see every write.
+
+    Writes are delivered when they come back from Redis, including to the
+    worker that published them, so all workers see the same order.
+    """
+
+    def __init__(self, url: str, channel: str = "changefeed"):
+        if redis_asyncio is None:
+            raise RuntimeError("CHANGE_FEED_BACKEND=redis requires the redis package")
+        self.url = url
+        self.channel = channel
+        self._client = None
+        self._listener: Optional[asyncio.Task] = None
+        self._publishing: Set[asyncio.Task] = set()
+
+    async def start(self, deliver: Deliver):
+        assert redis_asyncio is not None  # checked in __init__
+        self._client = redis_asyncio.from_url(self.url)
+        pubsub = self._client.pubsub()
+        await pubsub.subscribe(self.channel)
+        self._listener = asyncio.create_task(self._listen(pubsub, deliver))
+
+    async def _listen(self, pubsub, deliver: Deliver):
+        try:
+            while True:
+                try:
+                    async for message in pubsub.listen():
+                        if message["type"] == "message":
+                            payload = json.loads(message["data"])
+                            deliver(payload["tenant"], payload["events"])
+                except asyncio.CancelledError:
+                    raise
+                except Exception:
+                    # pubsub resubscribes when it reconnects; events published meanwhile are lost
+                    logger.exception("Change feed subscription failed, retrying")
+                    await asyncio.sleep(1)
+        finally:
+            await pubsub.close()
+
+    def publish(self, tenant_id: str, events: List[Dict[str, Any]]):
+        if self._client is None:
+            raise RuntimeError("RedisBroadcast.publish called before start()")
+        task = asyncio.ensure_future(self._client.publish(self.channel, dumps({"tenant": tenant_id, "events": events})))
+        self._publishing.add(task)
+        task.add_done_callback(self._published)
+
+    def _published(self, task: asyncio.Task):
+        self._publishing.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error("Change feed publish failed: %s", task.exception())
+
+    async def stop(self):
+        if self._listener is not None:
+            self._listener.cancel()
+            await asyncio.gather(self._listener, return_exceptions=True)
+        if self._client is not None:
+            await self._client.close()
+
+
+class ChangeHub:
+    """Fans out repository writes to the subscribed clients of each school.
+
+    Repositories call `record_changed` from any thread after a write commits;
+    events go through the broadcast backend and come back to `deliver` on the
+    event loop, which appends them to a short per-school history (for
+    Last-Event-ID resumes) and to every matching subscription's buffer. An
+    idle connection is one parked coroutine plus a keepalive every `heartbeat`
+    seconds.
+    """
+
+    def __init__(self, broadcast=None, queue_size: int = DEFAULT_QUEUE_SIZE, history: int = DEFAULT_HISTORY,
+                 heartbeat: float = DEFAULT_HEARTBEAT, max_age: float = DEFAULT_MAX_AGE):
+        self.broadcast = broadcast or LocalBroadcast()
+        self.queue_size = queue_size
+        self.history = history
+        self.heartbeat = heartbeat
+        self.max_age = max_age
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self._subscriptions: Dict[str, Set[Subscription]] = {}
+        self._history: Dict[str, Deque[Dict[str, Any]]] = {}
+
+    async def start(self):
+        self.loop = asyncio.get_running_loop()
+        await self.broadcast.start(self.deliver)
+
+    async def stop(self):
+        await self.broadcast.stop()
+        self.loop = None
+
+    @property
+    def subscribers(self) -> int:
+        return sum(len(subscriptions) for subscriptions in self._subscriptions.values())
+
+    def record_changed(self, tenant_id: str, collection: str, op: str, records: Iterable[Dict[str, Any]]):
+        """Repository hook: publish events for records that were just written"""
+        loop = self.loop
+        if loop is None or collection not in FEED_FIELDS:
+            return
+        events = [event for event in (change_event(collection, op, record) for record in records) if event is not None]
+        if not events:
+            return
+        try:
+            on_loop = asyncio.get_running_loop() is loop
+        except RuntimeError:
+            on_loop = False
+        if on_loop:
+            self.broadcast.publish(tenant_id, events)
+        else:
+            # Background tasks and threadpool writes
+            loop.call_soon_threadsafe(self.broadcast.publish, tenant_id, events)
+
+    def deliver(self, tenant_id: str, events: List[Dict[str, Any]]):
+        """Broadcast backend callback, on the event loop"""
+        history = self._history.get(tenant_id)
+        if history is None:
+            history = self._history[tenant_id] = deque(maxlen=self.history)
+        history.extend(events)
+        for subscription in self._subscriptions.get(tenant_id, ()):
+            for event in events:
+                if subscription.accepts(event):
+                    subscription.push(event)
+
+    def _since(self, tenant_id: str, last_event_id: str) -> Optional[List[Dict[str, Any]]]:
+        """Events after `last_event_id`, or None when it is no longer in the history"""
+        history = list(self._history.get(tenant_id, ()))
+        for position in range(len(history) - 1, -1, -1):
+            if history[position]["id"] == last_event_id:
+                return history[position + 1:]
+        return None
+
+    async def stream(self, subscription: Subscription, last_event_id: Optional[str] = None) -> AsyncIterator[bytes]:
+        """Server-sent events for one subscription until the client leaves or `max_age` passes"""
+        # Registered and caught up in one step, so no event is missed or sent twice
+        self._subscriptions.setdefault(subscription.tenant_id, set()).add(subscription)
+        missed = self._since(subscription.tenant_id, last_event_id) if last_event_id else []
+        try:
+            yield b"retry: %d\n\n" % RECONNECT_MS
+            if missed is None:
+                yield RESET
+            else:
+                for event in missed:
+                    if subscription.accepts(event):
+                        yield format_event(event)
+            # Streams end now and then so clients spread over restarted or added workers
+            loop = asyncio.get_running_loop()
+            deadline = loop.time() + self.max_age
+            while loop.time() < deadline:
+                events = await subscription.next(min(self.heartbeat, max(0.0, deadline - loop.time())))
+                if subscription.lagged:
+                    subscription.lagged = False
+                    yield RESET
+                elif events:
+                    yield b"".join(format_event(event) for event in events)
+                else:
+                    yield HEARTBEAT
+        finally:
+            subscriptions = self._subscriptions.get(subscription.tenant_id)
+            if subscriptions is not None:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self._subscriptions[subscription.tenant_id]
+
+
+def create_change_hub() -> ChangeHub:
+    backend = os.getenv("CHANGE_FEED_BACKEND", "local")
+    if backend == "redis":
+        broadcast = RedisBroadcast(os.getenv("REDIS_URL", "redis://localhost:6379/0"))
+    elif backend == "local":
+        broadcast = LocalBroadcast()
+    else:
+        raise ValueError(f"Unknown CHANGE_FEED_BACKEND: {backend}")
+    return ChangeHub(
+        broadcast,
+        queue_size=int(os.getenv("CHANGE_FEED_QUEUE_SIZE", str(DEFAULT_QUEUE_SIZE))),
+        history=int(os.getenv("CHANGE_FEED_HISTORY", str(DEFAULT_HISTORY))),
+        heartbeat=float(os.getenv("CHANGE_FEED_HEARTBEAT", str(DEFAULT_HEARTBEAT))),
+        max_age=float(os.getenv("CHANGE_FEED_MAX_AGE", str(DEFAULT_MAX_AGE))),
+    )
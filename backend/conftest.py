@@ -0,0 +1,56 @@
+"""Shared fixtures: the app imported fresh against either storage backend.
+
+main builds its store, job queue and limiter from the environment at import
+time, so each test gets its own import inside a temporary working directory.
+"""
+import os
+import sys
+from typing import Dict
+
+import pytest
+from fastapi.testclient import TestClient
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKENDS = ("memory", "sql")
+
+
+@pytest.fixture
+def load_main(tmp_path, monkeypatch):
+    """Returns load(backend="memory", **env) -> freshly imported main module"""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.syspath_prepend(BACKEND_DIR)
+    for name in ("DATABASE_URL", "MEMORY_JOURNAL_DIR", "CHANGE_FEED_BACKEND", "RATE_LIMIT_BACKEND"):
+        monkeypatch.delenv(name, raising=False)
+    loaded = []
+
+    def load(backend: str = "memory", **env: str):
+        monkeypatch.setenv("STORAGE_BACKEND", backend)
+        monkeypatch.setenv("JOBS_DATABASE", str(tmp_path / "jobs.db"))
+        # Tests send bursts no client would; test_ratelimit.py turns the limiter back on
+        monkeypatch.setenv("RATE_LIMIT_ENABLED", "false")
+        if backend == "sql":
+            monkeypatch.setenv("DATABASE_URL", f"sqlite:///{tmp_path / 'school.db'}")
+        for name, value in env.items():
+            monkeypatch.setenv(name, value)
+        sys.modules.pop("main", None)
+        import main
+        loaded.append(main)
+        return main
+
+    yield load
+    for main in loaded:
+        main.jobs.store.close()
+        main.repo.close()
+    sys.modules.pop("main", None)
+
+
+@pytest.fixture
+def login():
+    """Returns login(client, domain="stmarys") -> headers of the school's admin"""
+    def login(client: TestClient, domain: str = "stmarys") -> Dict[str, str]:
+        response = client.post("/api/login", json={
+            "email": f"admin@{domain}.edu", "password": "admin123", "school_domain": domain
+        })
+        assert response.status_code == 200, response.text
+        return {"Authorization": f"Bearer {response.json()['token']}", "X-School-Domain": domain}
+    return login
@@ -0,0 +1,345 @@
+import os
+from decimal import Decimal
+from typing import Any, Dict, Optional
+
+from sqlalchemy import (
+    JSON,
+    Boolean,
+    ForeignKey,
+    ForeignKeyConstraint,
+    Index,
+    Integer,
+    Numeric,
+    String,
+    Text,
+    UniqueConstraint,
+    create_engine,
+    event,
+)
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import DeclarativeBase, Mapped, declared_attr, mapped_column, relationship
+from sqlalchemy.pool import StaticPool
+
+from ledger import money_json
+
+
+def _sqlite_on_connect(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    # WAL lets readers in other workers proceed while one worker writes
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute("PRAGMA foreign_keys=ON")
+    cursor.execute("PRAGMA busy_timeout=5000")
+    cursor.close()
+
+
+def create_db_engine(url: Optional[str] = None) -> Engine:
+    url = url or os.getenv("DATABASE_URL", "sqlite:///./school_attendance.db")
+    options: Dict[str, Any] = {"echo": os.getenv("DB_ECHO", "false").lower() == "true"}
+
+    # Connection pool settings (ignored for in-memory SQLite)
+    pool = {
+        "pool_size": int(os.getenv("DB_POOL_SIZE", "5")),
+        "max_overflow": int(os.getenv("DB_MAX_OVERFLOW", "10")),
+        "pool_timeout": int(os.getenv("DB_POOL_TIMEOUT", "30")),
+    }
+
+    if url.startswith("sqlite"):
+        options["connect_args"] = {"check_same_thread": False}
+        if url in ("sqlite://", "sqlite:///:memory:"):
+            # A single shared connection, otherwise every checkout sees an empty database
+            options["poolclass"] = StaticPool
+        else:
+            options.update(pool)
+    else:
+        options.update(pool, pool_recycle=int(os.getenv("DB_POOL_RECYCLE", "1800")), pool_pre_ping=True)
+
+    engine = create_engine(url, **options)
+    if engine.dialect.name == "sqlite":
+        event.listen(engine, "connect", _sqlite_on_connect)
+    return engine
+
+
+class Base(DeclarativeBase):
+    # Columns that never appear in API responses
+    __internal__ = ("seq", "extra")
+    # Columns serialized as null instead of being omitted when empty
+    __keep_null__: tuple = ()
+
+    seq: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    # Fields without a dedicated column, so records keep the exact JSON shape they were written with
+    extra: Mapped[Optional[Dict[str, Any]]] = mapped_column(JSON, nullable=True)
+
+    @classmethod
+    def fields(cls) -> Dict[str, str]:
+        """Map JSON keys to mapped attribute names (e.g. "class" -> class_name)"""
+        # str() because orjson rejects str subclasses such as quoted_name as keys
+        fields = {
+            str(column.name): attr
+            for attr, column in cls.__mapper__.columns.items()
+            if attr not in cls.__internal__
+        }
+        # Keep "id" first like the hand-written records
+        return {**({"id": fields.pop("id")} if "id" in fields else {}), **fields}
+
+    def to_dict(self) -> Dict[str, Any]:
+        data: Dict[str, Any] = {}
+        for name, attr in self.fields().items():
+            value = getattr(self, attr)
+            if value is None and attr not in self.__keep_null__:
+                continue
+            # Same JSON numbers as the memory store: 50000, not 50000.0 or "50000.00"
+            data[name] = money_json(value) if isinstance(value, Decimal) else value
+        if self.extra:
+            data.update(self.extra)
+        return data
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any], **fixed: Any):
+        columns = cls.fields()
+        values = {columns[k]: v for k, v in data.items() if k in columns}
+        extra = {k: v for k, v in data.items() if k not in columns and k not in fixed}
+        values.update(fixed)
+        return cls(**values, extra=extra or None)
+
+
+class TenantMixin:
+    """Common columns of every tenant-scoped table"""
+
+    id: Mapped[str] = mapped_column(String(64), nullable=False)
+
+    @declared_attr
+    def school_id(cls) -> Mapped[str]:
+        return mapped_column(String(64), ForeignKey("schools.id"), nullable=False)
+
+
+class School(Base):
+    __tablename__ = "schools"
+
+    id: Mapped[str] = mapped_column(String(64), unique=True, nullable=False)
+    name: Mapped[str] = mapped_column(String(255))
+    domain: Mapped[str] = mapped_column(String(255), unique=True, index=True)
+    address: Mapped[Optional[str]] = mapped_column(Text)
+    phone: Mapped[Optional[str]] = mapped_column(String(32))
+    email: Mapped[Optional[str]] = mapped_column(String(255))
+    logo_url: Mapped[Optional[str]] = mapped_column(Text)
+    settings: Mapped[Optional[Dict[str, Any]]] = mapped_column(JSON)
+
+
+class User(TenantMixin, Base):
+    """Login accounts; role-specific fields (class, section, children) live in `extra`"""
+
+    __tablename__ = "users"
+    __table_args__ = (
+        UniqueConstraint("school_id", "id"),
+        UniqueConstraint("school_id", "email", name="uq_users_school_email"),
+    )
+
+    email: Mapped[str] = mapped_column(String(255), nullable=False)
+    name: Mapped[str] = mapped_column(String(255))
+    role: Mapped[str] = mapped_column(String(32))
+    password: Mapped[Optional[str]] = mapped_column(String(255))
+
+
+class Student(TenantMixin, Base):
+    __tablename__ = "students"
+    __table_args__ = (
+        UniqueConstraint("school_id", "id"),
+        Index("ix_students_class_section", "school_id", "class", "section"),
+        Index("ix_students_parent", "school_id", "parent_id"),
+    )
+
+    name: Mapped[str] = mapped_column(String(255))
+    class_name: Mapped[str] = mapped_column("class", String(32))
+    section: Mapped[str] = mapped_column(String(32))
+    photo_url: Mapped[Optional[str]] = mapped_column(Text)
+    email: Mapped[Optional[str]] = mapped_column(String(255))
+    phone: Mapped[Optional[str]] = mapped_column(String(32))
+    address: Mapped[Optional[str]] = mapped_column(Text)
+    date_of_birth: Mapped[Optional[str]] = mapped_column(String(10))
+    parent_id: Mapped[Optional[str]] = mapped_column(String(64))
+
+
+class Teacher(TenantMixin, Base):
+    __tablename__ = "teachers"
+    __table_args__ = (
+        UniqueConstraint("school_id", "id"),
+        Index("ix_teachers_class_section", "school_id", "class", "section"),
+    )
+
+    name: Mapped[str] = mapped_column(String(255))
+    class_name: Mapped[str] = mapped_column("class", String(32))
+    section: Mapped[str] = mapped_column(String(32))
+    phone: Mapped[Optional[str]] = mapped_column(String(32))
+    photo_url: Mapped[Optional[str]] = mapped_column(Text)
+
+
+class Parent(TenantMixin, Base):
+    __tablename__ = "parents"
+    __table_args__ = (UniqueConstraint("school_id", "id"),)
+
+    father_name: Mapped[str] = mapped_column(String(255))
+    mother_name: Mapped[str] = mapped_column(String(255))
+    father_phone: Mapped[Optional[str]] = mapped_column(String(32))
+    mother_phone: Mapped[Optional[str]] = mapped_column(String(32))
+    father_email: Mapped[Optional[str]] = mapped_column(String(255))
+    mother_email: Mapped[Optional[str]] = mapped_column(String(255))
+    address: Mapped[Optional[str]] = mapped_column(Text)
+    emergency_contact: Mapped[Optional[str]] = mapped_column(String(255))
+    emergency_phone: Mapped[Optional[str]] = mapped_column(String(32))
+    children_ids: Mapped[Optional[list]] = mapped_column(JSON)
+    phone: Mapped[Optional[str]] = mapped_column(String(32))
+
+
+class Attendance(TenantMixin, Base):
+    __tablename__ = "attendance"
+    __table_args__ = (
+        UniqueConstraint("school_id", "id"),
+        Index("ix_attendance_student_date", "school_id", "student_id", "date"),
+        Index("ix_attendance_date", "school_id", "date"),
+    )
+
+    student_id: Mapped[str] = mapped_column(String(64))
+    date: Mapped[str] = mapped_column(String(10))
+    morning: Mapped[Optional[bool]] = mapped_column(Boolean)
+    afternoon: Mapped[Optional[bool]] = mapped_column(Boolean)
+    evening: Mapped[Optional[bool]] = mapped_column(Boolean)
+    captured_images: Mapped[Optional[Dict[str, str]]] = mapped_column(JSON)
+
+
+class ExamResult(TenantMixin, Base):
+    __tablename__ = "exam_results"
+    __table_args__ = (
+        UniqueConstraint("school_id", "id"),
+        Index("ix_exam_results_student_date", "school_id", "student_id", "date"),
+    )
+
+    student_id: Mapped[str] = mapped_column(String(64))
+    exam_type: Mapped[str] = mapped_column(String(64))
+    scores: Mapped[Dict[str, int]] = mapped_column(JSON)
+    date: Mapped[str] = mapped_column(String(10))
+
+
+class Query(TenantMixin, Base):
+    __tablename__ = "queries"
+    __table_args__ = (
+        UniqueConstraint("school_id", "id"),
+        Index("ix_queries_student_date", "school_id", "student_id", "date"),
+    )
+
+    parent_id: Mapped[str] = mapped_column(String(64))
+    student_id: Mapped[str] = mapped_column(String(64))
+    message: Mapped[str] = mapped_column(Text)
+    status: Mapped[str] = mapped_column(String(32))
+    date: Mapped[str] = mapped_column(String(10))
+
+
+class Fee(TenantMixin, Base):
+    __tablename__ = "fees"
+    __table_args__ = (
+        UniqueConstraint("school_id", "id"),
+        Index("ix_fees_student", "school_id", "student_id", "academic_year"),
+    )
+
+    student_id: Mapped[str] = mapped_column(String(64))
+    academic_year: Mapped[str] = mapped_column(String(16))
+    # Exact like the ledger totals; read back as Decimal and turned into JSON numbers by to_dict()
+    total_amount: Mapped[Decimal] = mapped_column(Numeric(14, 2))
+    paid_amount: Mapped[Decimal] = mapped_column(Numeric(14, 2))
+    remaining_amount: Mapped[Decimal] = mapped_column(Numeric(14, 2))
+    due_date: Mapped[str] = mapped_column(String(10))
+    status: Mapped[str] = mapped_column(String(32))
+    installments: Mapped[list] = relationship(
+        "Installment",
+        order_by="Installment.seq",
+        cascade="all, delete-orphan",
+        lazy="selectin",
+    )
+
+    def to_dict(self) -> Dict[str, Any]:
+        data = super().to_dict()
+        data["installments"] = [i.to_dict() for i in self.installments]
+        return data
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any], **fixed: Any):
+        fee = super().from_dict({k: v for k, v in data.items() if k != "installments"}, **fixed)
+        fee.installments = [Installment.from_dict(i) for i in data.get("installments") or []]
+        return fee
+
+
+class Installment(Base):
+    __tablename__ = "installments"
+    __internal__ = ("seq", "extra", "school_id", "fee_id")
+    __keep_null__ = ("paid_date",)
+    __table_args__ = (
+        ForeignKeyConstraint(["school_id", "fee_id"], ["fees.school_id", "fees.id"], ondelete="CASCADE"),
+        Index("ix_installments_due", "school_id", "status", "due_date"),
+    )
+
+    school_id: Mapped[str] = mapped_column(String(64))
+    fee_id: Mapped[str] = mapped_column(String(64))
+    id: Mapped[Optional[str]] = mapped_column(String(64))
+    amount: Mapped[Optional[Decimal]] = mapped_column(Numeric(14, 2))
+    due_date: Mapped[Optional[str]] = mapped_column(String(10))
+    paid_date: Mapped[Optional[str]] = mapped_column(String(10))
+    status: Mapped[Optional[str]] = mapped_column(String(32))
+
+
+class AttendanceRollup(Base):
+    """Attendance counters per scope (school/class/student), period bucket and time slot"""
+
+    __tablename__ = "attendance_rollups"
+    __table_args__ = (
+        UniqueConstraint("school_id", "scope", "period", "scope_key", "bucket", "slot", name="uq_attendance_rollups"),
+    )
+
+    school_id: Mapped[str] = mapped_column(String(64), ForeignKey("schools.id"), nullable=False)
+    scope: Mapped[str] = mapped_column(String(16))
+    period: Mapped[str] = mapped_column(String(8))
+    scope_key: Mapped[str] = mapped_column(String(160))
+    bucket: Mapped[str] = mapped_column(String(10))
+    slot: Mapped[str] = mapped_column(String(16))
+    present: Mapped[int] = mapped_column(Integer, default=0)
+    total: Mapped[int] = mapped_column(Integer, default=0)
+
+
+class FeeLedgerTotal(Base):
+    """Running fee totals per student or academic year, kept exact in cents"""
+
+    __tablename__ = "fee_ledger_totals"
+    __table_args__ = (
+        UniqueConstraint("school_id", "scope", "scope_key", name="uq_fee_ledger_totals"),
+    )
+
+    school_id: Mapped[str] = mapped_column(String(64), ForeignKey("schools.id"), nullable=False)
+    scope: Mapped[str] = mapped_column(String(16))
+    scope_key: Mapped[str] = mapped_column(String(64))
+    billed: Mapped[Decimal] = mapped_column(Numeric(14, 2), default=0)
+    paid: Mapped[Decimal] = mapped_column(Numeric(14, 2), default=0)
+
+
+class CollectionVersion(Base):
+    """Write counter per tenant collection, used to validate cached list responses"""
+
+    __tablename__ = "collection_versions"
+    __table_args__ = (
+        UniqueConstraint("school_id", "collection", name="uq_collection_versions"),
+    )
+
+    school_id: Mapped[str] = mapped_column(String(64), ForeignKey("schools.id"), nullable=False)
+    collection: Mapped[str] = mapped_column(String(32))
+    version: Mapped[int] = mapped_column(Integer, default=0)
+
+
+# Tenant collection name -> table
+TENANT_MODELS = {
+    "users": User,
+    "students": Student,
+    "teachers": Teacher,
+    "parents": Parent,
+    "attendance": Attendance,
+    "exam_results": ExamResult,
+    "queries": Query,
+    "fees": Fee,
+}
@@ -0,0 +1,363 @@
+import math
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from exports import iter_records
+
+# An exam is one sitting: results share an exam_type and a date
+ExamKey = Tuple[str, str]
+# student_id -> (name, class, section)
+Placement = Dict[str, Tuple[Optional[str], Optional[str], Optional[str]]]
+
+MIN_ROWS = 64
+# Subject columns of a score frame carry this prefix, so no subject name can clash with name, class or section
+SUBJECT = "subject:"
+
+
+def exam_key(result: Dict[str, Any]) -> ExamKey:
+    return (str(result.get("exam_type") or ""), str(result.get("date") or ""))
+
+
+def _number(value: Optional[float], digits: int = 2) -> Optional[float]:
+    """Rounded JSON number; NaN (no scores) becomes null"""
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return None
+    return round(float(value), digits)
+
+
+def _numbers(values: np.ndarray, digits: int = 2) -> List[Any]:
+    """_number over a whole array at once, as (nested) lists"""
+    rounded = np.round(values.astype(float), digits).astype(object)
+    rounded[np.isnan(values.astype(float))] = None
+    return rounded.tolist()
+
+
+class ScoreMatrix:
+    """Scores of one exam: a row per student, a column per subject, NaN where a subject has no score.
+
+    A student's later result for the same exam replaces their row, so adding
+    a result twice leaves the matrix as it was.
+    """
+
+    def __init__(self):
+        self.rows: Dict[str, int] = {}
+        self.student_ids: List[str] = []
+        self.subjects: List[str] = []
+        self._columns: Dict[str, int] = {}
+        self._scores = np.full((MIN_ROWS, 4), np.nan)
+        # frame() result, reused until the next add or a new placement
+        self._frame: Optional[pd.DataFrame] = None
+        self._placement: Optional[Placement] = None
+
+    def add(self, result: Dict[str, Any]):
+        scores = {}
+        for subject, score in (result.get("scores") or {}).items():
+            try:
+                scores[str(subject)] = float(score)
+            except (TypeError, ValueError):
+                continue
+        for subject in scores:
+            if subject not in self._columns:
+                self._add_subject(subject)
+
+        student_id = result["student_id"]
+        row = self.rows.get(student_id)
+        if row is None:
+            row = self.rows[student_id] = len(self.student_ids)
+            self.student_ids.append(student_id)
+            if row == len(self._scores):
+                grown = np.full((2 * row, self._scores.shape[1]), np.nan)
+                grown[:row] = self._scores
+                self._scores = grown
+        self._frame = None
+        self._scores[row] = np.nan
+        for subject, score in scores.items():
+            self._scores[row, self._columns[subject]] = score
+
+    def _add_subject(self, subject: str):
+        column = self._columns[subject] = len(self.subjects)
+        self.subjects.append(subject)
+        if column == self._scores.shape[1]:
+            grown = np.full((len(self._scores), 2 * column), np.nan)
+            grown[:, :column] = self._scores
+            self._scores = grown
+
+    @property
+    def scores(self) -> np.ndarray:
+        """students × subjects view, in `student_ids` and `subjects` order"""
+        return self._scores[:len(self.student_ids), :len(self.subjects)]
+
+    def frame(self, placement: Placement) -> pd.DataFrame:
+        """Scores indexed by student ID, with each student's current name, class and section.
+
+        Subject columns are named SUBJECT + subject; subject_columns() gives the subjects back.
+
+        The frame is shared between requests until the matrix changes, so callers must not modify it.
+        """
+        if self._frame is not None and self._placement is placement:
+            return self._frame
+        # Copied: later results must not change a frame a request is still reading
+        frame = pd.DataFrame(self.scores.copy(), index=pd.Index(self.student_ids, name="student_id"),
+                             columns=[SUBJECT + subject for subject in self.subjects])
+        unplaced = (None, None, None)
+        places = [placement.get(student_id, unplaced) for student_id in self.student_ids]
+        frame["name"] = [place[0] for place in places]
+        frame["class"] = [place[1] for place in places]
+        frame["section"] = [place[2] for place in places]
+        self._frame, self._placement = frame, placement
+        return frame
+
+
+class TenantExams:
+    __slots__ = ("version", "exams", "students_version", "placement")
+
+    def __init__(self, version: int):
+        self.version = version
+        self.exams: Dict[ExamKey, ScoreMatrix] = {}
+        self.students_version: Optional[int] = None
+        self.placement: Placement = {}
+
+
+class ExamStats:
+    """Per-school score matrices of every exam, kept in step with the exam_results collection.
+
+    Each school's matrices are tagged with the collection's write counter.
+    `record` applies a new result in place when it is the only write since
+    then; any other write (another worker, an import, a journal replay) makes
+    the next query rebuild that school from the repository.
+    """
+
+    def __init__(self, repo):
+        self.repo = repo
+        self._tenants: Dict[str, TenantExams] = {}
+        self._lock = threading.RLock()
+
+    def _version(self, tenant_id: str, collection: str) -> int:
+        return self.repo.versions(tenant_id, (collection,))[0]
+
+    def _load(self, tenant_id: str) -> TenantExams:
+        tenant = self._tenants.get(tenant_id)
+        version = self._version(tenant_id, "exam_results")
+        if tenant is None or tenant.version != version:
+            tenant = TenantExams(version)
+            for result in iter_records(self.repo, tenant_id, "exam_results"):
+                self._matrix(tenant, exam_key(result)).add(result)
+            self._tenants[tenant_id] = tenant
+        students_version = self._version(tenant_id, "students")
+        if tenant.students_version != students_version:
+            tenant.placement = {
+                student["id"]: (student.get("name"), student.get("class"), student.get("section"))
+                for student in iter_records(self.repo, tenant_id, "students")
+            }
+            tenant.students_version = students_version
+        return tenant
+
+    @staticmethod
+    def _matrix(tenant: TenantExams, key: ExamKey) -> ScoreMatrix:
+        matrix = tenant.exams.get(key)
+        if matrix is None:
+            matrix = tenant.exams[key] = ScoreMatrix()
+        return matrix
+
+    def record(self, tenant_id: str, result: Dict[str, Any]):
+        """Hook for a result the caller just added through the repository"""
+        with self._lock:
+            tenant = self._tenants.get(tenant_id)
+            if tenant is None:
+                return
+            version = self._version(tenant_id, "exam_results")
+            if version == tenant.version + 1:
+                self._matrix(tenant, exam_key(result)).add(result)
+                tenant.version = version
+            elif version != tenant.version:
+                # Other writes landed in between; rebuild on the next query
+                del self._tenants[tenant_id]
+
+    def exams(self, tenant_id: str) -> List[Dict[str, Any]]:
+        """Every exam of the school, oldest first"""
+        with self._lock:
+            tenant = self._load(tenant_id)
+            return [
+                {"exam_type": exam_type, "date": day, "students": len(matrix.student_ids), "subjects": list(matrix.subjects)}
+                for (exam_type, day), matrix in sorted(tenant.exams.items(), key=lambda item: (item[0][1], item[0][0]))
+            ]
+
+    def frame(self, tenant_id: str, exam_type: str, day: Optional[str] = None) -> Optional[Tuple[ExamKey, pd.DataFrame]]:
+        """The exam's score frame; without `day`, the latest sitting of `exam_type`. None if there is none"""
+        with self._lock:
+            tenant = self._load(tenant_id)
+            if day is None:
+                days = [key[1] for key in tenant.exams if key[0] == exam_type]
+                if not days:
+                    return None
+                day = max(days)
+            matrix = tenant.exams.get((exam_type, day))
+            if matrix is None:
+                return None
+            return (exam_type, day), matrix.frame(tenant.placement)
+
+    def frames(self, tenant_id: str, exam_type: Optional[str] = None) -> List[Tuple[ExamKey, pd.DataFrame]]:
+        """Score frames of every exam (of one type when given), oldest first"""
+        with self._lock:
+            tenant = self._load(tenant_id)
+            return [
+                (key, matrix.frame(tenant.placement))
+                for key, matrix in sorted(tenant.exams.items(), key=lambda item: (item[0][1], item[0][0]))
+                if exam_type is None or key[0] == exam_type
+            ]
+
+
+def score_columns(frame: pd.DataFrame) -> List[str]:
+    """The frame's subject columns, in subject order"""
+    return [column for column in frame.columns if column.startswith(SUBJECT)]
+
+
+def subject_columns(frame: pd.DataFrame) -> List[str]:
+    """The frame's subjects, in the order of score_columns()"""
+    return [column[len(SUBJECT):] for column in score_columns(frame)]
+
+
+def in_class(frame: pd.DataFrame, class_name: Optional[str], section: Optional[str]) -> pd.DataFrame:
+    if class_name and section:
+        return frame.loc[(frame["class"] == class_name) & (frame["section"] == section)]
+    return frame
+
+
+def rankings(frame: pd.DataFrame, class_name: Optional[str] = None, section: Optional[str] = None,
+             limit: Optional[int] = None) -> List[Dict[str, Any]]:
+    """Students by total score, best first, with school and class ranks and a percentile.
+
+    Each row's `scores` list follows subject_columns(frame), null where the
+    student has no score.
+
+    Missing subjects count as zero in the total. Tied totals share the better
+    rank (1, 2, 2, 4). The percentile is the share of the compared students
+    (the class when one is given, else the school) scoring below, counting
+    ties as half: (below + equal / 2) / n × 100.
+    """
+    scores = frame[score_columns(frame)]
+    table = pd.DataFrame({
+        "name": frame["name"],
+        "class": frame["class"],
+        "section": frame["section"],
+        "total": scores.sum(axis=1, min_count=1),
+        "average": scores.mean(axis=1),
+    }).dropna(subset=["total"])
+    table["school_rank"] = table["total"].rank(method="min", ascending=False)
+    table["class_rank"] = table.groupby(["class", "section"])["total"].rank(method="min", ascending=False)
+
+    table = in_class(table, class_name, section)
+    table = table.assign(percentile=(table["total"].rank(method="average") - 0.5) / max(len(table), 1) * 100)
+    table = table.sort_values(["total", "class", "section"], ascending=[False, True, True], kind="mergesort")
+    if limit is not None:
+        table = table.head(limit)
+
+    chosen = _numbers(scores.loc[table.index].to_numpy())
+    columns = zip(table.index.tolist(), table["name"].tolist(), table["class"].tolist(), table["section"].tolist(), _numbers(table["total"].to_numpy()),
+                  _numbers(table["average"].to_numpy()), table["school_rank"].astype(int).tolist(),
+                  _numbers(table["class_rank"].to_numpy(), 0), _numbers(table["percentile"].to_numpy(), 1), chosen)
+    return [
+        {
+            "student_id": student_id,
+            "name": name,
+            "class_name": class_name,
+            "section": section,
+            "total": total,
+            "average": average,
+            "school_rank": school_rank,
+            "class_rank": None if class_rank is None else int(class_rank),
+            "percentile": percentile,
+            "scores": values,
+        }
+        for student_id, name, class_name, section, total, average, school_rank, class_rank, percentile, values in columns
+    ]
+
+
+STATISTICS = ("count", "mean", "std", "min", "median", "max")
+
+
+def _describe(stats: Dict[str, List[List[Any]]], subjects: List[str], group: int) -> Dict[str, Dict[str, Any]]:
+    """{subject: {statistic: value}} for one row of per-group statistic tables; unscored subjects are left out"""
+    return {
+        subject: {name: stats[name][group][column] for name in STATISTICS}
+        for column, subject in enumerate(subjects)
+        if stats["count"][group][column]
+    }
+
+
+def subject_stats(frame: pd.DataFrame, class_name: Optional[str] = None,
+                  section: Optional[str] = None) -> Dict[str, Any]:
+    """Count, mean, population std, min, median and max of each subject, for the school or one class.
+
+    School-wide, the same statistics follow per class.
+    """
+    columns, subjects = score_columns(frame), subject_columns(frame)
+    scoped = in_class(frame, class_name, section)
+    # One row of statistics for the whole scope, computed like the per-class rows below
+    overall = scoped[columns].groupby(np.zeros(len(scoped), dtype=np.int8))
+    summary: Dict[str, Any] = {"students": len(scoped), "subjects": _describe(_statistics(overall), subjects, 0)}
+    if not (class_name and section):
+        groups = frame.dropna(subset=["class", "section"]).groupby(["class", "section"], sort=True)[columns]
+        stats = _statistics(groups)
+        sizes = groups.size()
+        placed = zip(sizes.index.get_level_values("class"), sizes.index.get_level_values("section"), sizes.to_numpy().tolist())
+        summary["classes"] = [
+            {"class_name": class_name, "section": section, "students": int(size), "subjects": _describe(stats, subjects, group)}
+            for group, (class_name, section, size) in enumerate(placed)
+        ]
+    return summary
+
+
+def _statistics(groups) -> Dict[str, List[List[Any]]]:
+    """STATISTICS of every group and subject as JSON-ready nested lists, one cythonized pass each"""
+    return {
+        "count": groups.count().to_numpy().tolist(),
+        "mean": _numbers(groups.mean().to_numpy()),
+        "std": _numbers(groups.std(ddof=0).to_numpy()),
+        "min": _numbers(groups.min().to_numpy()),
+        "median": _numbers(groups.median().to_numpy()),
+        "max": _numbers(groups.max().to_numpy()),
+    }
+
+
+def _column_means(scores: np.ndarray) -> np.ndarray:
+    """Mean of each column over its scores; NaN for a column without any"""
+    counts = np.count_nonzero(~np.isnan(scores), axis=0)
+    return np.where(counts > 0, np.nansum(scores, axis=0) / np.maximum(counts, 1), np.nan)
+
+
+def trends(frames: Iterable[Tuple[ExamKey, pd.DataFrame]], student_id: Optional[str] = None,
+           class_name: Optional[str] = None, section: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Subject means (or one student's scores) per exam, oldest first, with the change since the previous exam"""
+    points: List[Dict[str, Any]] = []
+    previous: Dict[str, float] = {}
+    for (exam_type, day), frame in frames:
+        columns = score_columns(frame)
+        if student_id is not None:
+            if student_id not in frame.index:
+                continue
+            means = frame.loc[[student_id], columns].to_numpy(dtype=float)[0]
+            students = 1
+        else:
+            scoped = in_class(frame, class_name, section)[columns]
+            if scoped.empty:
+                continue
+            means = _column_means(scoped.to_numpy(dtype=float))
+            students = len(scoped)
+        values = {subject: float(value) for subject, value in zip(subject_columns(frame), means.tolist()) if not math.isnan(value)}
+        if not values:
+            continue
+        values["average"] = sum(values.values()) / len(values)
+        points.append({
+            "exam_type": exam_type,
+            "date": day,
+            "students": students,
+            "scores": {subject: _number(value) for subject, value in values.items()},
+            # Only subjects present in both exams get a delta
+            "delta": {subject: _number(value - previous[subject]) for subject, value in values.items() if subject in previous},
+        })
+        previous = values
+    return points
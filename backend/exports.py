@@ -0,0 +1,147 @@
+import csv
+import io
+import os
+import tempfile
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
+
+from openpyxl import Workbook
+
+EXPORT_FORMATS = ("csv", "xlsx")
+EXPORT_PAGE_SIZE = 1000
+XLSX_CHUNK_SIZE = 64 * 1024
+
+MEDIA_TYPES = {
+    "csv": "text/csv",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+}
+
+
+def iter_records(repo, tenant_id: str, collection: str, **filters: Optional[str]) -> Iterator[Dict[str, Any]]:
+    """Walk a tenant collection page by page so the whole list is never held at once"""
+    after = None
+    while True:
+        records, after = repo.page(tenant_id, collection, after=after, limit=EXPORT_PAGE_SIZE, **filters)
+        yield from records
+        if after is None:
+            return
+
+
+def _student_columns(students: Dict[str, Dict[str, Any]], student_id: str) -> List[Any]:
+    student = students.get(student_id) or {}
+    return [student_id, student.get("name", ""), student.get("class", ""), student.get("section", "")]
+
+
+def attendance_table(
+    records: Callable[[], Iterable[Dict[str, Any]]],
+    students: Dict[str, Dict[str, Any]],
+    time_slots: List[str],
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+) -> Iterator[List[Any]]:
+    yield ["id", "date", "student_id", "student_name", "class", "section", *time_slots]
+    for record in records():
+        day = record.get("date", "")
+        if (start and day < start) or (end and day > end):
+            continue
+        slots = ["" if record.get(slot) is None else ("present" if record[slot] else "absent") for slot in time_slots]
+        yield [record["id"], day, *_student_columns(students, record["student_id"]), *slots]
+
+
+def exam_results_table(
+    records: Callable[[], Iterable[Dict[str, Any]]],
+    students: Dict[str, Dict[str, Any]],
+    exam_type: Optional[str] = None,
+) -> Iterator[List[Any]]:
+    """One row per result with `scores` flattened into a column per subject"""
+    # First pass only collects subject names, so columns are known before any row is written
+    subjects = sorted({
+        subject
+        for record in records()
+        if not exam_type or record.get("exam_type") == exam_type
+        for subject in (record.get("scores") or {})
+    })
+    yield ["id", "date", "exam_type", "student_id", "student_name", "class", "section", *subjects, "total"]
+    for record in records():
+        if exam_type and record.get("exam_type") != exam_type:
+            continue
+        scores = record.get("scores") or {}
+        yield [
+            record["id"],
+            record.get("date", ""),
+            record.get("exam_type", ""),
+            *_student_columns(students, record["student_id"]),
+            *[scores.get(subject, "") for subject in subjects],
+            sum(v for v in scores.values() if isinstance(v, (int, float))),
+        ]
+
+
+def fees_table(
+    records: Callable[[], Iterable[Dict[str, Any]]],
+    students: Dict[str, Dict[str, Any]],
+    academic_year: Optional[str] = None,
+) -> Iterator[List[Any]]:
+    """Fee ledger: one row per installment, fee totals repeated on each row"""
+    yield [
+        "fee_id", "student_id", "student_name", "class", "section", "academic_year",
+        "total_amount", "paid_amount", "remaining_amount", "due_date", "status",
+        "installment_id", "installment_amount", "installment_due_date", "installment_paid_date", "installment_status",
+    ]
+    for fee in records():
+        if academic_year and fee.get("academic_year") != academic_year:
+            continue
+        fee_columns = [
+            fee["id"],
+            *_student_columns(students, fee["student_id"]),
+            fee.get("academic_year", ""),
+            fee.get("total_amount", ""),
+            fee.get("paid_amount", ""),
+            fee.get("remaining_amount", ""),
+            fee.get("due_date", ""),
+            fee.get("status", ""),
+        ]
+        installments = fee.get("installments") or [{}]
+        for inst in installments:
+            yield fee_columns + [
+                inst.get("id", ""),
+                inst.get("amount", ""),
+                inst.get("due_date", ""),
+                inst.get("paid_date") or "",
+                inst.get("status", ""),
+            ]
+
+
+def stream_csv(rows: Iterable[List[Any]], batch_rows: int = 500) -> Iterator[bytes]:
+    """Encode rows as CSV, yielding a chunk every `batch_rows` rows"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    # BOM so Excel opens UTF-8 names correctly
+    buffer.write("\ufeff")
+    for count, row in enumerate(rows, 1):
+        writer.writerow(row)
+        if count % batch_rows == 0:
+            yield buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode("utf-8")
+
+
+def stream_xlsx(rows: Iterable[List[Any]], sheet_title: str) -> Iterator[bytes]:
+    """Write rows with openpyxl in write-only mode to a temp file, then stream the file"""
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet(title=sheet_title[:31])
+    for row in rows:
+        sheet.append(row)
+
+    fd, path = tempfile.mkstemp(suffix=".xlsx")
+    os.close(fd)
+    try:
+        workbook.save(path)
+        with open(path, "rb") as f:
+            while True:
+                chunk = f.read(XLSX_CHUNK_SIZE)
+                if not chunk:
+                    break
+                yield chunk
+    finally:
+        os.remove(path)
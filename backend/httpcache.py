@@ -0,0 +1,88 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+DEFAULT_CACHE_ENTRIES = 2048
+DEFAULT_CACHE_BYTES = 64 * 1024 * 1024
+CACHE_CONTROL = "private, no-cache"
+
+
+def make_etag(*parts: Any) -> str:
+    """Strong ETag for a response fully determined by `parts`"""
+    digest = hashlib.blake2b(repr(parts).encode(), digest_size=16).hexdigest()
+    return f'"{digest}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match comparison (weak, as RFC 9110 prescribes for this header)"""
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == "*" or candidate == etag:
+            return True
+    return False
+
+
+class CachedResponse:
+    __slots__ = ("body", "etag", "headers")
+
+    def __init__(self, body: bytes, etag: str, headers: Dict[str, str]):
+        self.body = body
+        self.etag = etag
+        self.headers = headers
+
+
+class ResponseCache:
+    """Bounded LRU of serialized response bodies.
+
+    Keys carry the collection versions the body was built from, so a write
+    never has to find and evict entries: later requests simply use a new key
+    and the old entries age out. Bounded by entry count and by total bytes.
+    """
+
+    def __init__(self, max_entries: int = DEFAULT_CACHE_ENTRIES, max_bytes: int = DEFAULT_CACHE_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries: "OrderedDict[Hashable, CachedResponse]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[CachedResponse]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key: Hashable, entry: CachedResponse):
+        if len(entry.body) > self.max_bytes // 4:
+            # One huge list would push out everything else
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.size -= len(previous.body)
+            self._entries[key] = entry
+            self.size += len(entry.body)
+            while len(self._entries) > self.max_entries or self.size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.size -= len(evicted.body)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+def cache_key(tenant_id: str, path: str, query: Tuple[Tuple[str, str], ...], versions: Tuple[int, ...]) -> Tuple:
+    return (tenant_id, path, tuple(sorted(query)), versions)
+
+
+def create_response_cache() -> ResponseCache:
+    return ResponseCache(
+        max_entries=int(os.getenv("RESPONSE_CACHE_ENTRIES", str(DEFAULT_CACHE_ENTRIES))),
+        max_bytes=int(os.getenv("RESPONSE_CACHE_BYTES", str(DEFAULT_CACHE_BYTES))),
+    )
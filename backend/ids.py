@@ -0,0 +1,108 @@
+import base64
+import os
+import re
+import threading
+import time
+from typing import List, Optional, Tuple
+
+# Crockford base32 in ASCII order, so encoded IDs sort like the integers they encode
+CROCKFORD = b"0123456789ABCDEFGHJKMNPQRSTVWXYZ"
+_FROM_RFC4648 = bytes.maketrans(b"ABCDEFGHIJKLMNOPQRSTUVWXYZ234567", CROCKFORD)
+
+RANDOM_BITS = 80
+RANDOM_MAX = (1 << RANDOM_BITS) - 1
+ENCODED_LENGTH = 26
+# What encode() can produce: 26 Crockford characters of a 128-bit value
+_ENCODED = re.compile(r"[0-7][0-9A-HJKMNP-TV-Z]{25}")
+# int(..., 32) reads the base32hex alphabet, which is Crockford's with the same digit values
+_TO_BASE32HEX = str.maketrans(CROCKFORD.decode(), "0123456789ABCDEFGHIJKLMNOPQRSTUV")
+
+
+class IdGenerator:
+    """ULID-style IDs: 48-bit millisecond timestamp + 80 random bits, 26 sortable characters.
+
+    Within one process IDs are strictly increasing: in the same millisecond the
+    random part is incremented instead of redrawn. Each process (and each forked
+    worker) draws its own random starting point, so concurrent workers do not
+    collide in practice. Sorting IDs of one prefix sorts them by creation time.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._reseed()
+
+    def _reseed(self):
+        self._last_ms = 0
+        self._random = 0
+
+    def _next(self) -> int:
+        now = time.time_ns() // 1_000_000
+        with self._lock:
+            if now > self._last_ms:
+                self._last_ms = now
+                self._random = int.from_bytes(os.urandom(10), "big") >> 1  # leave headroom to increment
+            else:
+                # Same millisecond (or the clock stepped back): stay monotonic
+                self._random += 1
+                if self._random > RANDOM_MAX:
+                    self._last_ms += 1
+                    self._random = 0
+            return (self._last_ms << RANDOM_BITS) | self._random
+
+    @staticmethod
+    def encode(value: int) -> str:
+        # 26 characters hold 130 bits: shift so the 128-bit value ends exactly at the 26th, as in ULID
+        return base64.b32encode((value << 6).to_bytes(17, "big")).translate(_FROM_RFC4648)[:ENCODED_LENGTH].decode()
+
+    def new(self, prefix: str = "") -> str:
+        return prefix + self.encode(self._next())
+
+    def many(self, prefix: str, count: int) -> List[str]:
+        """`count` increasing IDs for a bulk insert, drawn under one lock acquisition"""
+        if count <= 0:
+            return []
+        now = time.time_ns() // 1_000_000
+        with self._lock:
+            if now > self._last_ms:
+                self._last_ms = now
+                self._random = int.from_bytes(os.urandom(10), "big") >> 1
+            else:
+                self._random += 1
+            first = (self._last_ms << RANDOM_BITS) | self._random
+            last = first + count - 1
+            # Continue after the block; overflow of the random part carries into the timestamp
+            self._last_ms, self._random = last >> RANDOM_BITS, last & RANDOM_MAX
+        return [prefix + self.encode(value) for value in range(first, last + 1)]
+
+
+def parse_id(record_id: str) -> Optional[Tuple[str, int]]:
+    """(prefix, 128-bit value) of an ID made by IdGenerator, or None for any other string.
+
+    prefix + IdGenerator.encode(value) gives back exactly `record_id`.
+    """
+    encoded = record_id[-ENCODED_LENGTH:]
+    if len(encoded) != ENCODED_LENGTH or not _ENCODED.fullmatch(encoded):
+        return None
+    return record_id[:-ENCODED_LENGTH], int(encoded.translate(_TO_BASE32HEX), 32)
+
+
+def id_timestamp(record_id: str) -> float:
+    """Creation time (unix seconds) of an ID made by IdGenerator, prefix included"""
+    parsed = parse_id(record_id)
+    if parsed is None:
+        raise ValueError(f"Not a generated ID: {record_id}")
+    return (parsed[1] >> RANDOM_BITS) / 1000
+
+
+_generator = IdGenerator()
+# A worker forked from a preloaded master must not continue the master's sequence
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_generator._reseed)
+
+
+def new_id(prefix: str = "") -> str:
+    return _generator.new(prefix)
+
+
+def new_ids(prefix: str, count: int) -> List[str]:
+    return _generator.many(prefix, count)
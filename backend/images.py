@@ -0,0 +1,127 @@
+import base64
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
+from typing import BinaryIO, Dict, Optional
+
+from PIL import Image, ImageOps, features
+
+from blobstore import BLOB_URL_PREFIX
+
+PHOTO_DIR = os.path.join("uploads", "student_photos")
+PHOTO_URL_PREFIX = "/uploads/student_photos"
+# Uploads wait here, outside the publicly served uploads/, until their metadata is stripped
+STAGING_DIR = os.path.join(tempfile.gettempdir(), "student_photos")
+
+CHUNK_SIZE = 1024 * 1024
+# Base64 is decoded in slices that are a multiple of 4 characters
+BASE64_CHUNK = 4 * 256 * 1024
+
+ALLOWED_EXTENSIONS = {"jpg", "jpeg", "png", "webp", "gif"}
+
+# Variant name -> longest edge in pixels. "thumb" is for roster lists, "medium" for profiles.
+PHOTO_VARIANTS = {"thumb": 128, "medium": 512}
+# Originals are re-encoded without metadata and capped at this size
+MAX_ORIGINAL_EDGE = 2048
+# Formats originals are published in; anything else Pillow reads (MPO, GIF, TIFF...) becomes JPEG
+PUBLISHED_FORMATS = {"JPEG": "jpg", "PNG": "png", "WEBP": "webp"}
+
+VARIANT_FORMAT = "WEBP" if features.check("webp") else "JPEG"
+VARIANT_EXTENSION = "webp" if VARIANT_FORMAT == "WEBP" else "jpg"
+
+
+def photo_extension(filename: Optional[str]) -> str:
+    extension = filename.rsplit(".", 1)[-1].lower() if filename and "." in filename else "jpg"
+    return extension if extension in ALLOWED_EXTENSIONS else "jpg"
+
+
+def photo_path(student_id: str, extension: str) -> str:
+    return os.path.join(PHOTO_DIR, f"student_{student_id}.{extension}")
+
+
+def staging_path(student_id: str, extension: str) -> str:
+    return os.path.join(STAGING_DIR, f"student_{student_id}.{extension}")
+
+
+def photo_url(path: str) -> str:
+    return f"{PHOTO_URL_PREFIX}/{os.path.basename(path)}"
+
+
+def is_hosted_photo(url: str) -> bool:
+    """True for URLs this app serves photos from: uploaded student photos and blob-store images"""
+    if ".." in url.split("/"):
+        return False
+    return any(url.startswith(prefix + "/") for prefix in (PHOTO_URL_PREFIX, BLOB_URL_PREFIX))
+
+
+@contextmanager
+def atomic_write(path: str):
+    """Write to a temp file beside `path` and rename it into place, so readers never see partial files"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as target:
+            yield target
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def copy_stream(source: BinaryIO, path: str) -> int:
+    """Copy a file-like object to `path` in fixed-size chunks; returns bytes written"""
+    with atomic_write(path) as target:
+        shutil.copyfileobj(source, target, CHUNK_SIZE)
+        return target.tell()
+
+
+def write_base64(data: str, path: str) -> int:
+    """Decode a base64 string (optionally a data URL) to `path` slice by slice"""
+    if data.startswith("data:"):
+        data = data.split(",", 1)[1]
+    data = "".join(data.split())
+    with atomic_write(path) as target:
+        for start in range(0, len(data), BASE64_CHUNK):
+            target.write(base64.b64decode(data[start:start + BASE64_CHUNK], validate=True))
+        return target.tell()
+
+
+def _save_image(image: Image.Image, path: str, image_format: str):
+    if image_format == "JPEG" and image.mode not in ("RGB", "L"):
+        image = image.convert("RGB")
+    with atomic_write(path) as target:
+        # No exif=/icc_profile= arguments, so camera metadata (GPS etc.) is dropped
+        image.save(target, image_format, quality=82, optimize=True)
+
+
+def publish_photo(source: str, student_id: str) -> Dict[str, str]:
+    """Strip metadata from a staged upload, publish it and write resized variants next to it.
+
+    Returns the public URL of the original as photo_url and of each variant as
+    photo_<variant>_url. Runs in a background worker, never on the request path.
+    """
+    with Image.open(source) as opened:
+        source_format = opened.format
+        image = ImageOps.exif_transpose(opened)
+        assert image is not None  # only None with in_place=True
+        image.load()
+    # The rest of the EXIF block (GPS etc.) stays in info after transposing; drop it all
+    image.info = {}
+
+    image_format = source_format if source_format in PUBLISHED_FORMATS else "JPEG"
+    path = photo_path(student_id, PUBLISHED_FORMATS[image_format])
+    original = image.copy()
+    original.thumbnail((MAX_ORIGINAL_EDGE, MAX_ORIGINAL_EDGE))
+    _save_image(original, path, image_format)
+
+    stem, _ = os.path.splitext(path)
+    urls = {"photo_url": photo_url(path)}
+    for name, edge in PHOTO_VARIANTS.items():
+        variant = image.copy()
+        variant.thumbnail((edge, edge))
+        variant_path = f"{stem}_{name}.{VARIANT_EXTENSION}"
+        _save_image(variant, variant_path, VARIANT_FORMAT)
+        urls[f"photo_{name}_url"] = photo_url(variant_path)
+    return urls
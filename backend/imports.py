@@ -0,0 +1,308 @@
+import csv
+import hashlib
+import logging
+import os
+import re
+import threading
+from datetime import date, datetime
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from openpyxl import load_workbook
+from pydantic import ValidationError
+
+from ids import new_id
+from images import is_hosted_photo
+
+logger = logging.getLogger(__name__)
+
+IMPORT_FORMATS = ("csv", "xlsx")
+# Parents are committed first so students can point at them
+ROSTER_KINDS = ("parents", "students", "teachers")
+IMPORT_BATCH_SIZE = 500
+# Per-job error list is capped; `failed` still counts every bad row
+MAX_REPORTED_ERRORS = 1000
+
+ID_PREFIXES = {"parents": "parent", "students": "student", "teachers": "teacher"}
+HEADER_ALIASES = {"class": "class_name", "type": "kind", "sheet": "kind"}
+LIST_SPLIT = re.compile(r"[;,]")
+
+# (sheet kind, spreadsheet row number, cleaned cells)
+Row = Tuple[str, int, Dict[str, str]]
+
+
+def import_format(filename: Optional[str]) -> Optional[str]:
+    extension = filename.rsplit(".", 1)[-1].lower() if filename and "." in filename else ""
+    return extension if extension in IMPORT_FORMATS else None
+
+
+def file_digest(path: str) -> str:
+    """SHA-256 of a stored upload, so submitting the same file twice queues one import"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _header(name: Any) -> str:
+    key = re.sub(r"\s+", "_", str(name or "").strip().lower())
+    return HEADER_ALIASES.get(key, key)
+
+
+def _cell(value: Any) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, float) and value.is_integer():
+        # Phone numbers typed into Excel come back as floats
+        return str(int(value))
+    if isinstance(value, datetime):
+        return value.date().isoformat() if value.time() == datetime.min.time() else value.isoformat()
+    if isinstance(value, date):
+        return value.isoformat()
+    return str(value).strip()
+
+
+def _sheet_kind(name: Optional[str], default: Optional[str]) -> Optional[str]:
+    kind = _header(name)
+    return kind if kind in ROSTER_KINDS else default
+
+
+def _rows(header: List[str], values: Iterable[Iterable[Any]], kind: Optional[str], first_row: int) -> Iterator[Row]:
+    for number, cells in enumerate(values, first_row):
+        row = {key: _cell(value) for key, value in zip(header, cells) if key}
+        if not any(row.values()):
+            continue
+        yield _sheet_kind(row.pop("kind", None), kind) or "", number, row
+
+
+def read_rows(path: str, extension: str, default_kind: Optional[str] = None) -> Iterator[Row]:
+    """Stream rows from a CSV or XLSX file without loading it whole.
+
+    XLSX sheets named after a roster kind (parents/students/teachers) are read as
+    that kind; a `kind` column overrides the sheet or `default_kind` per row.
+    """
+    if extension == "csv":
+        with open(path, newline="", encoding="utf-8-sig") as f:
+            reader = csv.reader(f)
+            header = [_header(h) for h in next(reader, [])]
+            yield from _rows(header, reader, default_kind, 2)
+        return
+
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        for sheet in workbook.worksheets:
+            values = sheet.iter_rows(values_only=True)
+            header = [_header(h) for h in next(values, ())]
+            yield from _rows(header, values, _sheet_kind(sheet.title, default_kind), 2)
+    finally:
+        workbook.close()
+
+
+def _model_input(kind: str, row: Dict[str, str]) -> Dict[str, Any]:
+    data: Dict[str, Any] = {k: v for k, v in row.items() if v != ""}
+    if kind == "parents":
+        data["children_ids"] = [c.strip() for c in LIST_SPLIT.split(row.get("children_ids", "")) if c.strip()]
+    return data
+
+
+def _errors(exc: ValidationError) -> List[Dict[str, str]]:
+    return [{"field": ".".join(str(p) for p in e["loc"]), "message": e["msg"]} for e in exc.errors()]
+
+
+def photo_error(kind: str, model: Any) -> Optional[Dict[str, str]]:
+    """Row error for a student photo_url this app does not host, as create_student rejects it"""
+    if kind == "students" and model.photo_url and not is_hosted_photo(model.photo_url):
+        return {"field": "photo_url", "message": "must be a photo uploaded to this school (/uploads/...)"}
+    return None
+
+
+def build_record(kind: str, model: Any, record_id: str, tenant_id: str) -> Dict[str, Any]:
+    """Same shape as the single-record create routes produce"""
+    if kind == "students":
+        return {
+            "id": record_id,
+            "name": model.name,
+            "class": model.class_name,
+            "section": model.section,
+            # Checked by photo_error: empty, or a photo this app already hosts
+            "photo_url": model.photo_url or "",
+            "email": model.email or "",
+            "phone": model.phone or "",
+            "address": model.address or "",
+            "date_of_birth": model.date_of_birth or "",
+            "parent_id": model.parent_id,
+            "school_id": tenant_id,
+        }
+    if kind == "teachers":
+        return {
+            "id": record_id,
+            "name": model.name,
+            "class": model.class_name,
+            "section": model.section,
+            "phone": model.phone,
+            "photo_url": "",
+            "school_id": tenant_id,
+        }
+    return {"id": record_id, **model.dict(), "school_id": tenant_id}
+
+
+class ImportJob:
+    """Progress of one roster import, published as its queue job's progress"""
+
+    def __init__(self, tenant_id: str, filename: str, job_id: Optional[str] = None):
+        self.id = job_id or new_id("import")
+        self.tenant_id = tenant_id
+        self.filename = filename
+        self.status = "queued"
+        self.rows = 0
+        self.processed = 0
+        self.failed = 0
+        self.created = {kind: 0 for kind in ROSTER_KINDS}
+        self.errors: List[Dict[str, Any]] = []
+        self.detail = ""
+        self.created_at = datetime.now().isoformat()
+        self.finished_at: Optional[str] = None
+        self._lock = threading.Lock()
+
+    def fail_row(self, kind: str, row: int, errors: List[Dict[str, str]]):
+        with self._lock:
+            self.failed += 1
+            self.processed += 1
+            if len(self.errors) < MAX_REPORTED_ERRORS:
+                self.errors.append({"sheet": kind, "row": row, "errors": errors})
+
+    def commit_rows(self, kind: str, count: int):
+        with self._lock:
+            self.created[kind] += count
+            self.processed += count
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "id": self.id,
+                "filename": self.filename,
+                "status": self.status,
+                "rows": self.rows,
+                "processed": self.processed,
+                "failed": self.failed,
+                "created": dict(self.created),
+                "errors": list(self.errors),
+                "errors_truncated": self.failed > len(self.errors),
+                "detail": self.detail,
+                "created_at": self.created_at,
+                "finished_at": self.finished_at,
+            }
+
+
+def _existing(repo, tenant_id: str, collection: str, ids: Set[str]) -> Set[str]:
+    found: Set[str] = set()
+    ids_list = list(ids)
+    for start in range(0, len(ids_list), IMPORT_BATCH_SIZE):
+        found |= repo.existing_ids(tenant_id, collection, ids_list[start:start + IMPORT_BATCH_SIZE])
+    return found
+
+
+def run_import(repo, models: Dict[str, Any], job: ImportJob, path: str, extension: str,
+               default_kind: Optional[str] = None, report: Callable[[ImportJob], None] = lambda job: None):
+    """Validate, link and commit a roster file. Runs on a job worker, off the event loop.
+
+    `report(job)` is called as the import moves through its phases and after each committed batch.
+    """
+    tenant_id = job.tenant_id
+    try:
+        job.status = "parsing"
+        report(job)
+        # kind -> [(row number, record, file-local ref)]
+        valid: Dict[str, List[Tuple[int, Dict[str, Any], str]]] = {kind: [] for kind in ROSTER_KINDS}
+        refs: Dict[str, Dict[str, str]] = {kind: {} for kind in ROSTER_KINDS}
+        for kind, number, row in read_rows(path, extension, default_kind):
+            job.rows += 1
+            if kind not in ROSTER_KINDS:
+                job.fail_row(kind, number, [{"field": "kind", "message": f"must be one of {', '.join(ROSTER_KINDS)}"}])
+                continue
+            record_id = new_id(ID_PREFIXES[kind])
+            # `ref` lets rows of the same file point at each other before ids exist
+            ref = row.pop("ref", "")
+            if ref:
+                refs[kind][ref] = record_id
+            try:
+                model = models[kind](**_model_input(kind, row))
+            except ValidationError as exc:
+                job.fail_row(kind, number, _errors(exc))
+                continue
+            error = photo_error(kind, model)
+            if error is not None:
+                job.fail_row(kind, number, [error])
+                continue
+            valid[kind].append((number, build_record(kind, model, record_id, tenant_id), ref))
+
+        job.status = "importing"
+        report(job)
+        parent_refs, student_refs = refs["parents"], refs["students"]
+
+        # Children not defined in this file must already exist
+        outside = {c for _, p, _ in valid["parents"] for c in p["children_ids"] if c not in student_refs}
+        known_students = _existing(repo, tenant_id, "students", outside)
+        parents = []
+        for number, parent, _ in valid["parents"]:
+            unknown = [c for c in parent["children_ids"] if c not in student_refs and c not in known_students]
+            if unknown:
+                job.fail_row("parents", number, [{"field": "children_ids", "message": f"Unknown students: {', '.join(unknown)}"}])
+                continue
+            parent["children_ids"] = [student_refs.get(c, c) for c in parent["children_ids"]]
+            parents.append(parent)
+        parents_by_id = {p["id"]: p for p in parents}
+
+        outside = {s["parent_id"] for _, s, _ in valid["students"] if s["parent_id"] not in parent_refs}
+        known_parents = _existing(repo, tenant_id, "parents", outside)
+        students = []
+        existing_links: Dict[str, List[str]] = {}
+        for number, student, _ in valid["students"]:
+            parent_id = parent_refs.get(student["parent_id"], student["parent_id"])
+            if parent_id in parents_by_id:
+                children = parents_by_id[parent_id]["children_ids"]
+            elif parent_id in known_parents:
+                children = existing_links.setdefault(parent_id, [])
+            else:
+                job.fail_row("students", number, [{"field": "parent_id", "message": f"Unknown parent: {student['parent_id']}"}])
+                continue
+            student["parent_id"] = parent_id
+            if student["id"] not in children:
+                children.append(student["id"])
+            students.append(student)
+
+        # Parents may list children whose rows failed; drop those links
+        created_students = {s["id"] for s in students}
+        for parent in parents:
+            parent["children_ids"] = [
+                c for c in parent["children_ids"] if c in created_students or c in known_students
+            ]
+
+        for kind, records in (("parents", parents), ("students", students), ("teachers", [r for _, r, _ in valid["teachers"]])):
+            for start in range(0, len(records), IMPORT_BATCH_SIZE):
+                batch = records[start:start + IMPORT_BATCH_SIZE]
+                repo.add_many(tenant_id, kind, batch)
+                job.commit_rows(kind, len(batch))
+                report(job)
+
+        linked = []
+        for parent_id, children in existing_links.items():
+            parent = repo.get(tenant_id, "parents", parent_id)
+            if parent is not None:
+                parent["children_ids"] = list(parent.get("children_ids") or []) + [
+                    c for c in children if c not in (parent.get("children_ids") or [])
+                ]
+                linked.append(parent)
+        if linked:
+            repo.update_many(tenant_id, "parents", linked)
+
+        job.status = "completed"
+    except Exception as exc:
+        logger.exception("Roster import failed", extra={"job_id": job.id, "tenant": tenant_id})
+        job.status = "failed"
+        job.detail = str(exc)
+    finally:
+        job.finished_at = datetime.now().isoformat()
+        if os.path.exists(path):
+            os.remove(path)
+        report(job)
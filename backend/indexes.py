@@ -0,0 +1,181 @@
+import bisect
+import heapq
+import itertools
+from collections import defaultdict
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Union
+
+from attendancestore import AttendanceColumns
+
+# Fields each tenant collection is indexed on. Index entries are positions in
+# the tenant list, so lookups preserve insertion order exactly like the old
+# list comprehensions did.
+INDEXED_KEYS: Dict[str, Tuple[Tuple[str, ...], ...]] = {
+    "attendance": (("student_id",), ("date",), ("student_id", "date")),
+    "exam_results": (("student_id",),),
+    "queries": (("student_id",),),
+    "fees": (("student_id",),),
+}
+
+# A tenant collection: a list of dicts, or AttendanceColumns, which answers its own lookups
+Records = Union[List[Dict[str, Any]], AttendanceColumns]
+
+
+class TenantIndex:
+    """Secondary indexes over one tenant's record lists"""
+
+    def __init__(self, tenant: Dict[str, Records]):
+        self.tenant = tenant
+        self.rebuild()
+
+    def rebuild(self):
+        """Rebuild every index from the tenant lists"""
+        self._keys: Dict[str, Dict[Tuple[str, ...], Dict[Tuple, List[int]]]] = {
+            collection: {fields: defaultdict(list) for fields in keys}
+            for collection, keys in INDEXED_KEYS.items()
+        }
+        self._rosters: Dict[Tuple[str, str], set] = defaultdict(set)
+        self._ids: Dict[str, Dict[str, int]] = defaultdict(dict)
+
+        for student in self.tenant.get("students", []):
+            self.add_student(student)
+        for collection, records in self.tenant.items():
+            if isinstance(records, AttendanceColumns):
+                continue
+            for position, record in enumerate(records):
+                self._ids[collection][record["id"]] = position
+        for collection in INDEXED_KEYS:
+            if isinstance(self.tenant.get(collection), AttendanceColumns):
+                continue
+            for position, record in enumerate(self.tenant.get(collection, [])):
+                self._index(collection, position, record)
+
+    def add_student(self, student: Dict[str, Any]):
+        self._rosters[(student["class"], student["section"])].add(student["id"])
+
+    def add(self, collection: str, record: Dict[str, Any]):
+        """Index a record that was just appended to the tenant list"""
+        if isinstance(self.tenant[collection], AttendanceColumns):
+            return
+        self._ids[collection][record["id"]] = len(self.tenant[collection]) - 1
+        if collection == "students":
+            self.add_student(record)
+        elif collection in INDEXED_KEYS:
+            self._index(collection, len(self.tenant[collection]) - 1, record)
+
+    def _index(self, collection: str, position: int, record: Dict[str, Any]):
+        for fields, index in self._keys[collection].items():
+            index[tuple(record.get(field) for field in fields)].append(position)
+
+    def update(self, collection: str, position: int, before: Dict[str, Any]):
+        """Re-key a record in place after its indexed fields changed from `before`"""
+        if collection not in INDEXED_KEYS or isinstance(self.tenant[collection], AttendanceColumns):
+            return
+        record = self.tenant[collection][position]
+        for fields, index in self._keys[collection].items():
+            old_key = tuple(before.get(field) for field in fields)
+            new_key = tuple(record.get(field) for field in fields)
+            if old_key == new_key:
+                continue
+            positions = index[old_key]
+            positions.pop(bisect.bisect_left(positions, position))
+            if not positions:
+                del index[old_key]
+            bisect.insort(index[new_key], position)
+
+    def position(self, collection: str, record_id: str) -> Optional[int]:
+        records = self.tenant.get(collection)
+        if isinstance(records, AttendanceColumns):
+            return records.position(record_id)
+        return self._ids[collection].get(record_id)
+
+    def roster(self, class_name: str, section: str) -> set:
+        return self._rosters.get((class_name, section), set())
+
+    def _lookup(self, collection: str, fields: Tuple[str, ...], value: Tuple) -> Optional[List[int]]:
+        index = self._keys.get(collection, {}).get(fields)
+        if index is None:
+            return None
+        return index.get(value, [])
+
+    def positions(
+        self,
+        collection: str,
+        student_id: Optional[str] = None,
+        date: Optional[str] = None,
+        class_name: Optional[str] = None,
+        section: Optional[str] = None,
+    ) -> Iterable[int]:
+        """Ascending list positions of the records matching the filters"""
+        records = self.tenant[collection]
+
+        student_ids: Optional[Iterable[str]] = None
+        if class_name and section:
+            roster = self.roster(class_name, section)
+            if student_id:
+                student_ids = [student_id] if student_id in roster else []
+            else:
+                student_ids = sorted(roster)
+        elif student_id:
+            student_ids = [student_id]
+
+        if isinstance(records, AttendanceColumns):
+            return records.positions(student_ids, date)
+
+        if student_ids is None:
+            if not date:
+                return range(len(records))
+            positions = self._lookup(collection, ("date",), (date,))
+            if positions is None:
+                return [i for i, r in enumerate(records) if r.get("date") == date]
+            return positions
+
+        if date:
+            lists = [self._lookup(collection, ("student_id", "date"), (sid, date)) for sid in student_ids]
+        else:
+            lists = [self._lookup(collection, ("student_id",), (sid,)) for sid in student_ids]
+
+        found = [positions for positions in lists if positions is not None]
+        if len(found) < len(lists):
+            wanted = set(student_ids)
+            return [
+                i for i, r in enumerate(records)
+                if r.get("student_id") in wanted and (not date or r.get("date") == date)
+            ]
+        if len(found) == 1:
+            return found[0]
+        return heapq.merge(*found)
+
+    def select(self, collection: str, **filters: Optional[str]) -> List[Dict[str, Any]]:
+        """Return records matching the filters, in insertion order"""
+        records = self.tenant[collection]
+        positions = self.positions(collection, **filters)
+        if isinstance(positions, range):
+            return list(records)
+        return [records[i] for i in positions]
+
+    def page(
+        self,
+        collection: str,
+        after: Optional[int] = None,
+        limit: int = 100,
+        **filters: Optional[str],
+    ) -> Tuple[List[Dict[str, Any]], Optional[int]]:
+        """Return up to `limit` matching records after position `after`, plus the position to resume from"""
+        records = self.tenant[collection]
+        positions = self.positions(collection, **filters)
+        start = 0 if after is None else after + 1
+
+        window: Iterable[int]
+        if isinstance(positions, range):
+            window = range(max(start, positions.start), positions.stop)
+        elif isinstance(positions, list):
+            window = itertools.islice(positions, bisect.bisect_left(positions, start), None)
+        else:
+            window = itertools.dropwhile(lambda i: i < start, positions)
+
+        chosen = list(itertools.islice(window, limit + 1))
+        next_after = chosen[limit - 1] if len(chosen) > limit else None
+        return [records[i] for i in chosen[:limit]], next_after
+
+def build_indexes(tenants: Dict[str, Dict[str, Records]]) -> Dict[str, TenantIndex]:
+    return {tenant_id: TenantIndex(tenant) for tenant_id, tenant in tenants.items()}
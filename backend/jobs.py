@@ -0,0 +1,449 @@
+import json
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+from multiprocessing import get_context
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from ids import new_id
+
+logger = logging.getLogger(__name__)
+
+JOB_STATUSES = ("queued", "running", "succeeded", "failed", "cancelled")
+
+DEFAULT_WORKERS = 2
+DEFAULT_PROCESSES = 0
+DEFAULT_POLL_INTERVAL = 1.0
+DEFAULT_LEASE = 300.0
+DEFAULT_BACKOFF = 2.0
+DEFAULT_BACKOFF_MAX = 300.0
+DEFAULT_RETENTION_DAYS = 7
+PRUNE_INTERVAL = 600.0
+# Inserts retried when a deduplicated job finishes between the insert and the lookup of it
+ENQUEUE_ATTEMPTS = 3
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    tenant_id TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL,
+    priority INTEGER NOT NULL DEFAULT 0,
+    dedup_key TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL,
+    run_at REAL NOT NULL,
+    lease_until REAL,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL,
+    error TEXT,
+    progress TEXT,
+    result TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_ready ON jobs (status, priority DESC, run_at);
+CREATE INDEX IF NOT EXISTS jobs_tenant ON jobs (tenant_id, created_at);
+-- At most one queued or running job per key; finished jobs free the key
+CREATE UNIQUE INDEX IF NOT EXISTS jobs_dedup ON jobs (tenant_id, kind, dedup_key)
+    WHERE dedup_key IS NOT NULL AND status IN ('queued', 'running');
+"""
+
+
+def _timestamp(value: Optional[float]) -> Optional[str]:
+    return None if value is None else datetime.fromtimestamp(value).isoformat()
+
+
+def _loads(value: Optional[str]) -> Any:
+    return None if value is None else json.loads(value)
+
+
+def job_dict(row: sqlite3.Row) -> Dict[str, Any]:
+    """API view of a job row; the payload stays internal (it can hold server paths)"""
+    return {
+        "id": row["id"],
+        "kind": row["kind"],
+        "status": row["status"],
+        "priority": row["priority"],
+        "dedup_key": row["dedup_key"],
+        "attempts": row["attempts"],
+        "max_attempts": row["max_attempts"],
+        "created_at": _timestamp(row["created_at"]),
+        "run_at": _timestamp(row["run_at"]),
+        "started_at": _timestamp(row["started_at"]),
+        "finished_at": _timestamp(row["finished_at"]),
+        "error": row["error"],
+        "progress": _loads(row["progress"]),
+        "result": _loads(row["result"]),
+    }
+
+
+class JobStore:
+    """Jobs in one SQLite file, shared by every worker process that opens it.
+
+    Claims run in an IMMEDIATE transaction, so two processes never take the
+    same job. A claimed job carries a lease; if its worker dies, the job is
+    requeued (or failed, when out of attempts) once the lease runs out.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self._lock:
+            if path != ":memory:":
+                self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(SCHEMA)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def _row(self, job_id: str) -> Optional[sqlite3.Row]:
+        return self._conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+
+    def enqueue(self, tenant_id: str, kind: str, payload: Dict[str, Any], priority: int = 0,
+                dedup_key: Optional[str] = None, max_attempts: int = 3, delay: float = 0.0,
+                progress: Any = None, job_id: Optional[str] = None) -> Tuple[Dict[str, Any], bool]:
+        """(job, created); with a `dedup_key` that is already queued or running, that job and False"""
+        now = time.time()
+        job_id = job_id or new_id("job")
+        attempts = 0
+        with self._lock:
+            while True:
+                attempts += 1
+                try:
+                    self._conn.execute(
+                        "INSERT INTO jobs (id, tenant_id, kind, payload, status, priority, dedup_key, max_attempts,"
+                        " run_at, created_at, progress) VALUES (?, ?, ?, ?, 'queued', ?, ?, ?, ?, ?, ?)",
+                        (job_id, tenant_id, kind, json.dumps(payload), priority, dedup_key, max_attempts, now + delay,
+                         now, None if progress is None else json.dumps(progress)),
+                    )
+                except sqlite3.IntegrityError:
+                    # A taken job_id is the caller's error, whatever the dedup key
+                    if dedup_key is None or self._row(job_id) is not None:
+                        raise
+                    row = self._conn.execute(
+                        "SELECT * FROM jobs WHERE tenant_id = ? AND kind = ? AND dedup_key = ?"
+                        " AND status IN ('queued', 'running')",
+                        (tenant_id, kind, dedup_key),
+                    ).fetchone()
+                    if row is not None:
+                        return job_dict(row), False
+                    if attempts >= ENQUEUE_ATTEMPTS:
+                        raise
+                    # The other job finished in between, freeing the key: insert again
+                    continue
+                row = self._row(job_id)
+                if row is None:
+                    raise RuntimeError(f"Job {job_id} vanished right after it was queued")
+                return job_dict(row), True
+
+    def claim(self, lease: float) -> Optional[sqlite3.Row]:
+        """Take the most urgent due job: highest priority first, then earliest run_at"""
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute(
+                    "UPDATE jobs SET status = CASE WHEN attempts >= max_attempts THEN 'failed' ELSE 'queued' END,"
+                    " finished_at = CASE WHEN attempts >= max_attempts THEN ? END,"
+                    " error = 'Worker stopped before the job finished', lease_until = NULL"
+                    " WHERE status = 'running' AND lease_until < ?",
+                    (now, now),
+                )
+                row = self._conn.execute(
+                    "SELECT id FROM jobs WHERE status = 'queued' AND run_at <= ?"
+                    " ORDER BY priority DESC, run_at, created_at LIMIT 1",
+                    (now,),
+                ).fetchone()
+                if row is not None:
+                    self._conn.execute(
+                        "UPDATE jobs SET status = 'running', attempts = attempts + 1, started_at = ?, lease_until = ?"
+                        " WHERE id = ?",
+                        (now, now + lease, row["id"]),
+                    )
+                    row = self._row(row["id"])
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return row
+
+    def next_run_at(self) -> Optional[float]:
+        with self._lock:
+            row = self._conn.execute("SELECT MIN(run_at) FROM jobs WHERE status = 'queued'").fetchone()
+        return row[0]
+
+    def report(self, job_id: str, progress: Any, lease: float):
+        """Record progress of a running job and extend its lease"""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET progress = ?, lease_until = ? WHERE id = ? AND status = 'running'",
+                (json.dumps(progress), time.time() + lease, job_id),
+            )
+
+    def succeed(self, job_id: str, result: Any):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = 'succeeded', result = ?, error = NULL, finished_at = ?, lease_until = NULL"
+                " WHERE id = ? AND status = 'running'",
+                (json.dumps(result), time.time(), job_id),
+            )
+
+    def fail(self, job_id: str, error: str, retry_in: Optional[float]):
+        """Requeue after `retry_in` seconds, or fail for good when it is None"""
+        now = time.time()
+        with self._lock:
+            if retry_in is None:
+                self._conn.execute(
+                    "UPDATE jobs SET status = 'failed', error = ?, finished_at = ?, lease_until = NULL"
+                    " WHERE id = ? AND status = 'running'",
+                    (error, now, job_id),
+                )
+            else:
+                self._conn.execute(
+                    "UPDATE jobs SET status = 'queued', error = ?, run_at = ?, lease_until = NULL"
+                    " WHERE id = ? AND status = 'running'",
+                    (error, now + retry_in, job_id),
+                )
+
+    def get(self, tenant_id: str, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._row(job_id)
+        return job_dict(row) if row is not None and row["tenant_id"] == tenant_id else None
+
+    def list(self, tenant_id: str, status: Optional[str] = None, kind: Optional[str] = None,
+             limit: int = 100) -> List[Dict[str, Any]]:
+        """The school's jobs, newest first"""
+        query = "SELECT * FROM jobs WHERE tenant_id = ?"
+        params: List[Any] = [tenant_id]
+        if status:
+            query += " AND status = ?"
+            params.append(status)
+        if kind:
+            query += " AND kind = ?"
+            params.append(kind)
+        query += " ORDER BY created_at DESC LIMIT ?"
+        params.append(limit)
+        with self._lock:
+            return [job_dict(row) for row in self._conn.execute(query, params)]
+
+    def cancel(self, tenant_id: str, job_id: str) -> Optional[Dict[str, Any]]:
+        """Cancel a queued job; running and finished jobs are returned unchanged. None if there is no such job"""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = 'cancelled', finished_at = ? WHERE id = ? AND tenant_id = ? AND status = 'queued'",
+                (time.time(), job_id, tenant_id),
+            )
+            row = self._row(job_id)
+        return job_dict(row) if row is not None and row["tenant_id"] == tenant_id else None
+
+    def counts(self) -> Dict[str, int]:
+        with self._lock:
+            found = dict(self._conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+        return {status: found.get(status, 0) for status in JOB_STATUSES}
+
+    def prune(self, before: float) -> int:
+        """Delete jobs that finished before `before`"""
+        with self._lock:
+            return self._conn.execute(
+                "DELETE FROM jobs WHERE status IN ('succeeded', 'failed', 'cancelled') AND finished_at < ?", (before,),
+            ).rowcount
+
+
+class JobContext:
+    """What a handler sees of its job"""
+
+    def __init__(self, queue: "JobQueue", row: sqlite3.Row):
+        self.queue = queue
+        self.id = row["id"]
+        self.tenant_id = row["tenant_id"]
+        self.kind = row["kind"]
+        self.attempt = row["attempts"]
+        self.payload: Dict[str, Any] = json.loads(row["payload"])
+
+    def report(self, progress: Any):
+        """Publish progress for the status endpoint; also keeps the job's lease alive"""
+        self.queue.store.report(self.id, progress, self.queue.lease)
+
+    def compute(self, function: Callable[..., Any], *args: Any) -> Any:
+        """Run CPU-bound `function(*args)` in the process pool, off this process's GIL.
+
+        `function` must be a module-level function and its arguments and result
+        picklable. Without a pool (JOB_PROCESSES=0, the default) it runs in the
+        worker thread, which suits work like Pillow's that releases the GIL.
+        """
+        return self.queue.compute(function, *args)
+
+
+class Handler:
+    __slots__ = ("run", "priority", "max_attempts")
+
+    def __init__(self, run: Callable[[JobContext], Any], priority: int, max_attempts: int):
+        self.run = run
+        self.priority = priority
+        self.max_attempts = max_attempts
+
+
+class JobQueue:
+    """Persistent job queue plus this process's worker threads.
+
+    Routes enqueue and return; `workers` threads claim due jobs in priority
+    order and run their handler. A failing job is retried after an
+    exponential, jittered backoff until it runs out of attempts. Jobs
+    enqueued here wake the local workers at once; jobs from other processes
+    and retries are found by polling every `poll_interval` seconds.
+    """
+
+    def __init__(self, store: JobStore, workers: int = DEFAULT_WORKERS, processes: int = DEFAULT_PROCESSES,
+                 poll_interval: float = DEFAULT_POLL_INTERVAL, lease: float = DEFAULT_LEASE,
+                 backoff: float = DEFAULT_BACKOFF, backoff_max: float = DEFAULT_BACKOFF_MAX,
+                 retention_days: float = DEFAULT_RETENTION_DAYS):
+        self.store = store
+        self.workers = workers
+        self.processes = processes
+        self.poll_interval = poll_interval
+        self.lease = lease
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+        self.retention_days = retention_days
+        self._handlers: Dict[str, Handler] = {}
+        self._threads: List[threading.Thread] = []
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._pool_lock = threading.Lock()
+        self._pruned_at = 0.0
+
+    def register(self, kind: str, run: Callable[[JobContext], Any], priority: int = 0, max_attempts: int = 3):
+        """Handle jobs of `kind` with `run(job)`; its return value (JSON data) becomes the job's result"""
+        self._handlers[kind] = Handler(run, priority, max_attempts)
+
+    def enqueue(self, tenant_id: str, kind: str, payload: Dict[str, Any], dedup_key: Optional[str] = None,
+                priority: Optional[int] = None, delay: float = 0.0, progress: Any = None,
+                job_id: Optional[str] = None) -> Dict[str, Any]:
+        """Queue a job and return it; an active job with the same `dedup_key` is returned instead"""
+        handler = self._handlers[kind]
+        job, created = self.store.enqueue(
+            tenant_id, kind, payload,
+            priority=handler.priority if priority is None else priority,
+            dedup_key=dedup_key,
+            max_attempts=handler.max_attempts,
+            delay=delay,
+            progress=progress,
+            job_id=job_id,
+        )
+        if created:
+            self._wake.set()
+        return job
+
+    def start(self):
+        self._stopping.clear()
+        for number in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f"job-worker-{number}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout: float = 10.0):
+        """Let running jobs finish (up to `timeout`); unfinished ones are requeued when their lease expires"""
+        self._stopping.set()
+        self._wake.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+        with self._pool_lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=False)
+                self._pool = None
+
+    def compute(self, function: Callable[..., Any], *args: Any) -> Any:
+        if self.processes <= 0:
+            return function(*args)
+        with self._pool_lock:
+            if self._pool is None:
+                # spawn, not fork: forking a process that runs threads can deadlock the child.
+                # Spawned processes import __main__ again, so serve through uvicorn/gunicorn, not `python main.py`
+                self._pool = ProcessPoolExecutor(self.processes, mp_context=get_context("spawn"))
+            pool = self._pool
+        try:
+            return pool.submit(function, *args).result()
+        except BrokenProcessPool:
+            with self._pool_lock:
+                if self._pool is pool:
+                    self._pool = None
+            raise
+
+    def retry_delay(self, attempt: int) -> float:
+        """Seconds before attempt `attempt + 1`: backoff × 2^(attempt-1), capped, with ±50% jitter"""
+        return min(self.backoff_max, self.backoff * 2 ** (attempt - 1)) * random.uniform(0.5, 1.5)
+
+    def run_once(self) -> bool:
+        """Claim and run one due job; False when none was due"""
+        row = self.store.claim(self.lease)
+        if row is None:
+            return False
+        job = JobContext(self, row)
+        handler = self._handlers.get(job.kind)
+        if handler is None:
+            self.store.fail(job.id, f"No handler for job kind {job.kind}", None)
+            return True
+        started = time.perf_counter()
+        try:
+            result = handler.run(job)
+        except Exception as exc:
+            retry_in = self.retry_delay(job.attempt) if job.attempt < row["max_attempts"] else None
+            logger.warning(
+                "Job %s failed (attempt %d of %d)", job.kind, job.attempt, row["max_attempts"],
+                exc_info=True, extra={"job_id": job.id, "tenant": job.tenant_id, "retry_in": retry_in},
+            )
+            self.store.fail(job.id, f"{type(exc).__name__}: {exc}", retry_in)
+        else:
+            self.store.succeed(job.id, result)
+            logger.debug("Job %s finished", job.kind, extra={
+                "job_id": job.id, "tenant": job.tenant_id, "seconds": round(time.perf_counter() - started, 3),
+            })
+        return True
+
+    def _work(self):
+        while not self._stopping.is_set():
+            try:
+                if self.run_once():
+                    continue
+                self._prune()
+                next_run = self.store.next_run_at()
+            except Exception:
+                logger.exception("Job worker error")
+                next_run = None
+            wait = self.poll_interval if next_run is None else min(self.poll_interval, max(0.0, next_run - time.time()))
+            if self._wake.wait(wait):
+                self._wake.clear()
+
+    def _prune(self):
+        now = time.time()
+        if now - self._pruned_at < PRUNE_INTERVAL:
+            return
+        self._pruned_at = now
+        removed = self.store.prune(now - self.retention_days * 86400)
+        if removed:
+            logger.info("Pruned %d finished jobs", removed)
+
+
+def create_job_queue() -> JobQueue:
+    return JobQueue(
+        JobStore(os.getenv("JOBS_DATABASE", "jobs.db")),
+        workers=int(os.getenv("JOB_WORKERS", str(DEFAULT_WORKERS))),
+        processes=int(os.getenv("JOB_PROCESSES", str(DEFAULT_PROCESSES))),
+        poll_interval=float(os.getenv("JOB_POLL_INTERVAL", str(DEFAULT_POLL_INTERVAL))),
+        lease=float(os.getenv("JOB_LEASE", str(DEFAULT_LEASE))),
+        backoff=float(os.getenv("JOB_BACKOFF", str(DEFAULT_BACKOFF))),
+        backoff_max=float(os.getenv("JOB_BACKOFF_MAX", str(DEFAULT_BACKOFF_MAX))),
+        retention_days=float(os.getenv("JOB_RETENTION_DAYS", str(DEFAULT_RETENTION_DAYS))),
+    )
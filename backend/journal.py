@@ -0,0 +1,292 @@
+import copy
+import json
+import logging
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows: no advisory locks, single process assumed
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+SEGMENT_PREFIX = "journal-"
+SEGMENT_SUFFIX = ".jsonl"
+SNAPSHOT_DIR = "snapshots"
+SCHOOLS_SNAPSHOT = "_schools"
+
+DEFAULT_FLUSH_INTERVAL = 0.05
+DEFAULT_SNAPSHOT_ENTRIES = 50000
+DEFAULT_SNAPSHOT_INTERVAL = 600.0
+
+
+def _dumps(value: Any) -> str:
+    return json.dumps(value, separators=(",", ":"), ensure_ascii=False)
+
+
+def _fsync_dir(path: str):
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def _write_jsonl(path: str, lines: List[Any]):
+    """Atomically replace `path` with one JSON document per line"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        for line in lines:
+            f.write(_dumps(line))
+            f.write("\n")
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def _read_jsonl(path: str) -> List[Any]:
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+class Journal:
+    """Append-only, group-committed mutation log plus per-tenant snapshots.
+
+    Layout of `directory`:
+      journal-<first seq>.jsonl   mutations, one JSON object per line, each with a global `seq`
+      snapshots/_schools.jsonl    {"seq": n} header, then one school per line
+      snapshots/<tenant>.jsonl    {"tenant": id, "seq": n} header, then {"c": collection, "r": record} lines
+
+    append() only buffers; a background thread writes and fsyncs the buffer every
+    `flush_interval` seconds, so a crash loses at most that window. Snapshots start
+    a new segment, dump every tenant, then delete the segments they cover.
+    """
+
+    def __init__(self, directory: str, flush_interval: float = DEFAULT_FLUSH_INTERVAL,
+                 snapshot_entries: int = DEFAULT_SNAPSHOT_ENTRIES,
+                 snapshot_interval: float = DEFAULT_SNAPSHOT_INTERVAL):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self.snapshot_entries = snapshot_entries
+        self.snapshot_interval = snapshot_interval
+        self.seq = 0
+        self.repo = None
+        self._buffer: List[str] = []
+        self._lock = threading.Lock()
+        # Serializes writes, rotation and snapshots
+        self._write_lock = threading.Lock()
+        self._segment = None
+        self._segment_path = ""
+        self._snapshotting = False
+        self._since_snapshot = 0
+        self._last_snapshot = time.monotonic()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+        os.makedirs(os.path.join(directory, SNAPSHOT_DIR), exist_ok=True)
+        self._lock_file = open(os.path.join(directory, "LOCK"), "w")
+        if fcntl is not None:
+            try:
+                fcntl.flock(self._lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                raise RuntimeError(f"Journal {directory} is in use by another process; run a single worker with STORAGE_BACKEND=memory")
+
+    # Loading
+
+    def segments(self) -> List[str]:
+        names = [n for n in os.listdir(self.directory) if n.startswith(SEGMENT_PREFIX) and n.endswith(SEGMENT_SUFFIX)]
+        return [os.path.join(self.directory, n) for n in sorted(names)]
+
+    def _snapshot_path(self, name: str) -> str:
+        return os.path.join(self.directory, SNAPSHOT_DIR, f"{name}.jsonl")
+
+    def load_snapshot(self) -> Tuple[Optional[Dict[str, Any]], Dict[str, int]]:
+        """Return (data in mock_data shape, snapshot seq per tenant and for schools); data is None without a snapshot"""
+        schools_path = self._snapshot_path(SCHOOLS_SNAPSHOT)
+        if not os.path.exists(schools_path):
+            return None, {}
+        header, *schools = _read_jsonl(schools_path)
+        seqs = {SCHOOLS_SNAPSHOT: header["seq"]}
+        data: Dict[str, Any] = {"schools": schools, "tenants": {}}
+        for school in schools:
+            tenant: Dict[str, List[Dict[str, Any]]] = {}
+            path = self._snapshot_path(school["id"])
+            if os.path.exists(path):
+                header, *rows = _read_jsonl(path)
+                seqs[school["id"]] = header["seq"]
+                for row in rows:
+                    tenant.setdefault(row["c"], []).append(row["r"])
+            data["tenants"][school["id"]] = tenant
+        return data, seqs
+
+    def replay(self, repo, seqs: Dict[str, int]) -> int:
+        """Apply journal entries newer than each tenant's snapshot; returns the number applied"""
+        applied = 0
+        self.seq = max(seqs.values(), default=0)
+        segments = self.segments()
+        for number, path in enumerate(segments):
+            with open(path, "r+b") as f:
+                good = 0
+                for line in iter(f.readline, b""):
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        if number == len(segments) - 1:
+                            # Torn write at the tail from a crash; cut it so later appends stay readable
+                            f.truncate(good)
+                            break
+                        raise RuntimeError(f"Corrupt journal segment {path}")
+                    good += len(line)
+                    if not line.endswith(b"\n"):
+                        # Complete entry whose newline never made it to disk
+                        f.write(b"\n")
+                    self.seq = max(self.seq, entry["seq"])
+                    scope = SCHOOLS_SNAPSHOT if entry["op"] == "add_school" else entry["tenant"]
+                    if entry["seq"] <= seqs.get(scope, 0):
+                        continue
+                    self._apply(repo, entry)
+                    applied += 1
+        return applied
+
+    @staticmethod
+    def _apply(repo, entry: Dict[str, Any]):
+        op = entry["op"]
+        if op == "add":
+            repo.add(entry["tenant"], entry["collection"], entry["record"])
+        elif op == "update":
+            repo.update(entry["tenant"], entry["collection"], entry["id"], entry["record"])
+        elif op == "add_school":
+            repo.add_school(entry["record"], entry.get("users", ()))
+
+    # Writing
+
+    def start(self, repo):
+        """Begin journaling `repo`'s mutations and run the flush/snapshot thread"""
+        self.repo = repo
+        self._open_segment()
+        self._thread = threading.Thread(target=self._run, name="journal-flush", daemon=True)
+        self._thread.start()
+
+    def _open_segment(self):
+        if self._segment is not None:
+            self._segment.close()
+        self._segment_path = os.path.join(self.directory, f"{SEGMENT_PREFIX}{self.seq + 1:012d}{SEGMENT_SUFFIX}")
+        self._segment = open(self._segment_path, "ab")
+        _fsync_dir(self.directory)
+
+    def append(self, entry: Dict[str, Any]) -> int:
+        """Buffer one mutation; it is durable after the next flush"""
+        with self._lock:
+            self.seq += 1
+            self._buffer.append(_dumps({"seq": self.seq, **entry}))
+            self._since_snapshot += 1
+            return self.seq
+
+    def flush(self):
+        with self._write_lock:
+            self._flush_locked()
+
+    def _flush_locked(self):
+        with self._lock:
+            lines, self._buffer = self._buffer, []
+        if not lines or self._segment is None:
+            return
+        self._segment.write(("\n".join(lines) + "\n").encode("utf-8"))
+        self._segment.flush()
+        os.fsync(self._segment.fileno())
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Journal flush failed")
+            if not self._snapshotting and self._since_snapshot and (
+                self._since_snapshot >= self.snapshot_entries
+                or time.monotonic() - self._last_snapshot >= self.snapshot_interval
+            ):
+                # Snapshots run on their own thread so flushes keep their cadence meanwhile
+                self._snapshotting = True
+                threading.Thread(target=self._background_snapshot, name="journal-snapshot", daemon=True).start()
+
+    def _background_snapshot(self):
+        try:
+            self.snapshot()
+        except Exception:
+            logger.exception("Journal snapshot failed")
+        finally:
+            self._snapshotting = False
+
+    def snapshot(self):
+        """Write every tenant to snapshots/ and drop the journal segments they replace"""
+        if self.repo is None or self._segment is None:
+            raise RuntimeError("Journal.snapshot called before start()")
+        with self._write_lock:
+            self._flush_locked()
+            if self._segment.tell():
+                covered = self.segments()
+                self._open_segment()
+            else:
+                # Nothing written since the last rotation; keep appending to the current segment
+                covered = [path for path in self.segments() if path != self._segment_path]
+            with self._lock:
+                self._since_snapshot = 0
+            self._last_snapshot = time.monotonic()
+
+        seq, schools = self.repo.snapshot_schools()
+        for school in schools:
+            tenant_seq, tenant = self.repo.snapshot_tenant(school["id"])
+            rows = [{"c": collection, "r": record} for collection, records in tenant.items() for record in records]
+            _write_jsonl(self._snapshot_path(school["id"]), [{"tenant": school["id"], "seq": tenant_seq}] + rows)
+        # Schools last: a school listed here always has a complete tenant snapshot
+        _write_jsonl(self._snapshot_path(SCHOOLS_SNAPSHOT), [{"seq": seq}] + schools)
+        _fsync_dir(os.path.join(self.directory, SNAPSHOT_DIR))
+
+        # Every entry in the old segments is at or below the snapshot seqs taken above
+        for path in covered:
+            os.remove(path)
+
+    def close(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.flush()
+        if self._segment is not None:
+            self._segment.close()
+            self._segment = None
+        self._lock_file.close()
+
+
+def open_journaled(directory: str, seed: Dict[str, Any], factory: Callable[[Dict[str, Any]], Any],
+                   **options: Any):
+    """Build a memory store from the latest snapshot (or `seed`) plus the journal, then journal it"""
+    journal = Journal(directory, **options)
+    started = time.perf_counter()
+    data, seqs = journal.load_snapshot()
+    fresh = data is None
+    repo = factory(copy.deepcopy(seed) if fresh else data)
+    applied = journal.replay(repo, seqs)
+    repo.journal = journal
+    journal.start(repo)
+    if fresh:
+        # Persist the seed so later starts never depend on it
+        journal.snapshot()
+    logger.info("Loaded memory store from %s: %d journal entries replayed in %.2fs",
+                directory, applied, time.perf_counter() - started)
+    return repo
+
+
+def create_journal_options() -> Dict[str, Any]:
+    return {
+        "flush_interval": float(os.getenv("JOURNAL_FLUSH_INTERVAL", str(DEFAULT_FLUSH_INTERVAL))),
+        "snapshot_entries": int(os.getenv("JOURNAL_SNAPSHOT_ENTRIES", str(DEFAULT_SNAPSHOT_ENTRIES))),
+        "snapshot_interval": float(os.getenv("JOURNAL_SNAPSHOT_INTERVAL", str(DEFAULT_SNAPSHOT_INTERVAL))),
+    }
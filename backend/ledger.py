@@ -0,0 +1,185 @@
+from bisect import bisect_left, bisect_right, insort
+from collections import defaultdict
+from decimal import Decimal
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Union
+
+LEDGER_SCOPES = ("student", "year")
+DUE_KINDS = ("overdue", "upcoming")
+CENT = Decimal("0.01")
+
+# (scope, scope_key) -> [billed, paid]
+LedgerKey = Tuple[str, str]
+# (due_date, fee_id, installment_id): sorts by due date first
+DueKey = Tuple[str, str, str]
+
+
+def money(value: Any) -> Decimal:
+    """Exact amount in cents; floats go through str() so 0.1 stays 0.1"""
+    if isinstance(value, Decimal):
+        return value.quantize(CENT)
+    return Decimal(str(value or 0)).quantize(CENT)
+
+
+def money_json(value: Decimal) -> Union[int, float]:
+    """JSON number for an amount; whole amounts stay ints like the seed data"""
+    return int(value) if value == value.to_integral_value() else float(value)
+
+
+def fee_status(paid: Decimal, total: Decimal) -> str:
+    if paid >= total and total > 0:
+        return "paid"
+    return "partial" if paid > 0 else "unpaid"
+
+
+def settle(fee: Dict[str, Any]) -> Dict[str, Any]:
+    """Set the fee's remaining amount and status from its total and paid amounts, all amounts as money_json"""
+    total, paid = money(fee.get("total_amount")), money(fee.get("paid_amount"))
+    fee["total_amount"], fee["paid_amount"] = money_json(total), money_json(paid)
+    fee["remaining_amount"] = money_json(total - paid)
+    fee["status"] = fee_status(paid, total)
+    return fee
+
+
+def add_installment(fee: Dict[str, Any], installment: Dict[str, Any]) -> Dict[str, Any]:
+    """Append a pending installment; the total grows only if the installments now exceed it"""
+    # Installments schedule the billed total, they never shrink it: a partial plan leaves the rest due
+    scheduled = sum((money(i.get("amount")) for i in fee["installments"]), money(0)) + money(installment["amount"])
+    fee["installments"].append(installment)
+    fee["total_amount"] = max(money(fee["total_amount"]), scheduled)
+    settle(fee)
+    return installment
+
+
+def pay_installment(fee: Dict[str, Any], installment_id: str, paid_date: str) -> Optional[Dict[str, Any]]:
+    """Mark one installment paid and move the fee's totals by its amount; None if it does not exist"""
+    installment = next((i for i in fee["installments"] if i.get("id") == installment_id), None)
+    if installment is None:
+        return None
+    if installment.get("status") != "paid":
+        fee["paid_amount"] = money(fee["paid_amount"]) + money(installment.get("amount"))
+        settle(fee)
+    installment["paid_date"] = paid_date
+    installment["status"] = "paid"
+    return installment
+
+
+def ledger_deltas(fee: Optional[Dict[str, Any]], sign: int) -> Dict[LedgerKey, List[Decimal]]:
+    """Total changes caused by adding (sign=1) or removing (sign=-1) one fee record"""
+    if not fee:
+        return {}
+    billed = money(fee.get("total_amount")) * sign
+    paid = money(fee.get("paid_amount")) * sign
+    return {
+        ("student", fee.get("student_id") or ""): [billed, paid],
+        ("year", fee.get("academic_year") or ""): [billed, paid],
+    }
+
+
+def merge_ledger(target: Dict[LedgerKey, List[Decimal]], deltas: Dict[LedgerKey, List[Decimal]]):
+    for key, (billed, paid) in deltas.items():
+        totals = target.setdefault(key, [Decimal(0), Decimal(0)])
+        totals[0] += billed
+        totals[1] += paid
+
+
+def pending_installments(fee: Optional[Dict[str, Any]]) -> Iterable[Tuple[DueKey, Dict[str, Any]]]:
+    if fee is None:
+        return
+    for installment in fee.get("installments") or []:
+        # Installments without an id cannot be paid through the API, so they are not listed as due
+        if installment.get("status") == "pending" and installment.get("due_date") and installment.get("id"):
+            yield (installment["due_date"], fee["id"], installment["id"]), {
+                "fee_id": fee["id"],
+                "installment_id": installment["id"],
+                "student_id": fee.get("student_id"),
+                "academic_year": fee.get("academic_year"),
+                "amount": installment.get("amount"),
+                "due_date": installment["due_date"],
+            }
+
+
+def build_summary(scope: str, rows: Iterable[Tuple[str, Decimal, Decimal]]) -> Dict[str, Any]:
+    """Shape (scope_key, billed, paid) rows into the summary response"""
+    key_field = "student_id" if scope == "student" else "academic_year"
+    return {
+        "scope": scope,
+        "totals": [
+            {key_field: key, "total_amount": money_json(billed), "paid_amount": money_json(paid),
+             "remaining_amount": money_json(billed - paid)}
+            for key, billed, paid in sorted(rows, key=lambda row: row[0])
+        ],
+    }
+
+
+class FeeLedger:
+    """In-process fee totals and pending-installment index for one tenant.
+
+    Totals per student and academic year are adjusted by deltas on every fee
+    write. Pending installments are kept in a list sorted by due date, so a due
+    date range is two bisects plus the matching entries.
+    """
+
+    def __init__(self):
+        self._totals: Dict[str, Dict[str, List[Decimal]]] = defaultdict(dict)
+        self._dues: List[DueKey] = []
+        self._entries: Dict[DueKey, Dict[str, Any]] = {}
+        self._by_student: Dict[str, set] = defaultdict(set)
+
+    def load(self, fees: Iterable[Dict[str, Any]]):
+        """Add many fees at once: totals summed first, the due index sorted once"""
+        deltas: Dict[LedgerKey, List[Decimal]] = {}
+        for fee in fees:
+            merge_ledger(deltas, ledger_deltas(fee, 1))
+            for key, entry in pending_installments(fee):
+                self._entries[key] = entry
+                self._by_student[entry["student_id"]].add(key)
+        self.apply(deltas)
+        self._dues = sorted(self._entries)
+
+    def apply(self, deltas: Dict[LedgerKey, List[Decimal]]):
+        for (scope, key), (billed, paid) in deltas.items():
+            totals = self._totals[scope].setdefault(key, [Decimal(0), Decimal(0)])
+            totals[0] += billed
+            totals[1] += paid
+
+    def track(self, before: Optional[Dict[str, Any]], after: Optional[Dict[str, Any]]):
+        """Move one fee's contribution from `before` to `after`"""
+        # Everything that can fail on a malformed record runs before the first change
+        deltas: Dict[LedgerKey, List[Decimal]] = {}
+        merge_ledger(deltas, ledger_deltas(before, -1))
+        merge_ledger(deltas, ledger_deltas(after, 1))
+        old = dict(pending_installments(before))
+        new = dict(pending_installments(after))
+        self.apply(deltas)
+        for key in old.keys() - new.keys():
+            del self._dues[bisect_left(self._dues, key)]
+            self._by_student[old[key]["student_id"]].discard(key)
+            del self._entries[key]
+        for key, entry in new.items():
+            if key not in old:
+                insort(self._dues, key)
+                self._by_student[entry["student_id"]].add(key)
+            self._entries[key] = entry
+
+    def rows(self, scope: str, key: Optional[str] = None) -> Iterable[Tuple[str, Decimal, Decimal]]:
+        totals = self._totals.get(scope, {})
+        keys = [key] if key is not None else list(totals)
+        for k in keys:
+            if k in totals:
+                billed, paid = totals[k]
+                yield k, billed, paid
+
+    def dues(self, start: Optional[str] = None, end: Optional[str] = None,
+             student_id: Optional[str] = None, limit: int = 100) -> List[Dict[str, Any]]:
+        """Pending installments due in [start, end], earliest first"""
+        if student_id is not None:
+            # A student has a handful of installments; no need for the global index
+            keys = [
+                k for k in sorted(self._by_student.get(student_id, ()))
+                if (not start or k[0] >= start) and (not end or k[0] <= end)
+            ]
+            return [self._entries[k] for k in keys[:limit]]
+        low = bisect_left(self._dues, (start,)) if start else 0
+        # "\uffff" sorts after any fee id, so every installment due on `end` is included
+        high = bisect_right(self._dues, (end, "\uffff")) if end else len(self._dues)
+        return [self._entries[k] for k in self._dues[low:min(high, low + limit)]]
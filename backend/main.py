@@ -1,19 +1,45 @@
-from fastapi import FastAPI, HTTPException, Depends, status, Header, File, UploadFile, Form
+from fastapi import FastAPI, HTTPException, Depends, status, Header, File, UploadFile, Form, BackgroundTasks, Query, Request
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import Response
+from fastapi.responses import Response, StreamingResponse
 from fastapi.staticfiles import StaticFiles
-from pydantic import BaseModel
-from typing import List, Optional, Dict, Any
+from pydantic import BaseModel, ValidationError
+from typing import List, Optional, Dict, Any, Tuple
 import uvicorn
-from datetime import datetime, date
+import re
+import secrets
+import tempfile
+from datetime import datetime, date, timedelta
 import json
+import logging
 import os
-import base64
 from dotenv import load_dotenv
+from auth import InvalidToken, create_token_service
+from passwords import LoginThrottled, create_password_hasher
+from blobstore import store_images
+from changefeed import FEED_COLLECTIONS, Subscription, create_change_hub
+from ids import new_id
+from jobs import JOB_STATUSES, JobContext, create_job_queue
+from images import copy_stream, is_hosted_photo, photo_extension, publish_photo, staging_path, write_base64
+from jsonresponse import FastJSONResponse, dumps
+from httpcache import CACHE_CONTROL, CachedResponse, cache_key, create_response_cache, etag_matches, make_etag
+from pagination import NEXT_CURSOR_HEADER, PageParams, encode_cursor, project
+from imports import ROSTER_KINDS, ImportJob, file_digest, import_format, run_import
+from examstats import ExamStats, rankings, subject_columns, subject_stats, trends
+from exports import EXPORT_FORMATS, MEDIA_TYPES, attendance_table, exam_results_table, fees_table, iter_records, stream_csv, stream_xlsx
+from repository import DEFAULT_TIME_SLOTS, create_repository
+from schools import create_school_registry
+from reports import PERIODS, SCOPES, bucket_for, build_report, scope_key, summarize
+from ledger import DUE_KINDS, LEDGER_SCOPES, add_installment as add_fee_installment, build_summary, money, pay_installment, settle
+from logs import configure_logging
+from metrics import PROMETHEUS_CONTENT_TYPE, MetricsMiddleware, RequestMetrics, create_profiler
+from ratelimit import RateLimitMiddleware, create_rate_limiter
 
 # Load environment variables
 load_dotenv()
+configure_logging()
+logger = logging.getLogger(__name__)
 
 # Create uploads directory if it doesn't exist
 os.makedirs("uploads/student_photos", exist_ok=True)
@@ -23,6 +49,26 @@ app = FastAPI(title="Multi-School Attendance API", version="2.0.0")
 # Serve static files (for uploaded images)
 app.mount("/uploads", StaticFiles(directory="uploads"), name="uploads")
 
+# Per-route/per-tenant request metrics served at /metrics; profiler toggled from /api/admin/profiler
+metrics = RequestMetrics()
+profiler = create_profiler()
+
+def metrics_tenant(domain: Optional[str]) -> str:
+    """School id label for a request's X-School-Domain header.
+
+    Runs on the event loop in middleware, so only this worker's domain table is
+    consulted: a domain it has not seen yet is "unknown" here and resolved from
+    the repository later, by get_tenant_id in the threadpool.
+    """
+    if not domain:
+        return "none"
+    school = schools.known(domain)
+    return school["id"] if school else "unknown"
+
+# Per-school token buckets and in-flight cap; added first so CORS headers reach its 429s and metrics count them
+rate_limiter = create_rate_limiter()
+app.add_middleware(RateLimitMiddleware, limiter=rate_limiter, tenant_of=metrics_tenant, on_shed=metrics.record_shed)
+
 # CORS middleware - allow all origins for debugging
 app.add_middleware(
     CORSMiddleware,
@@ -30,8 +76,11 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER, "ETag", "Retry-After"],
 )
 
+app.add_middleware(MetricsMiddleware, metrics=metrics, tenant_of=metrics_tenant)
+
 # Security
 security = HTTPBearer()
 
@@ -69,6 +118,11 @@ mock_data = {
     ],
     "tenants": {
         "school1": {
+            "users": [
+                {"id": "1", "email": "admin@stmarys.edu", "name": "Admin User", "role": "admin", "password": "admin123", "school_id": "school1"},
+                {"id": "2", "email": "teacher@stmarys.edu", "name": "John Teacher", "role": "teacher", "class": "10", "section": "A", "password": "teacher123", "school_id": "school1"},
+                {"id": "3", "email": "parent@stmarys.edu", "name": "Parent User", "role": "parent", "children": ["student1", "student2"], "password": "parent123", "school_id": "school1"}
+            ],
             "students": [
                 { "id": "student1", "name": "Alice Johnson", "class": "10", "section": "A", "photo_url": "", "parent_id": "parent1", "school_id": "school1" },
                 { "id": "student2", "name": "Bob Smith", "class": "10", "section": "A", "photo_url": "", "parent_id": "parent1", "school_id": "school1" },
@@ -131,6 +185,11 @@ mock_data = {
             ]
         },
         "school2": {
+            "users": [
+                {"id": "4", "email": "admin@brightfuture.edu", "name": "Admin User", "role": "admin", "password": "admin123", "school_id": "school2"},
+                {"id": "5", "email": "teacher@brightfuture.edu", "name": "Sarah Teacher", "role": "teacher", "class": "8", "section": "A", "password": "teacher123", "school_id": "school2"},
+                {"id": "6", "email": "parent@brightfuture.edu", "name": "Parent User", "role": "parent", "children": ["student4"], "password": "parent123", "school_id": "school2"}
+            ],
             "students": [
                 { "id": "student4", "name": "David Wilson", "class": "8", "section": "A", "photo_url": "", "parent_id": "parent3", "school_id": "school2" },
                 { "id": "student5", "name": "Emma Davis", "class": "9", "section": "B", "photo_url": "", "parent_id": "parent4", "school_id": "school2" }
@@ -176,6 +235,22 @@ mock_data = {
     }
 }
 
+# Tenant store (in-process or SQL, see STORAGE_BACKEND); mock_data seeds an empty store
+repo = create_repository(mock_data)
+tokens = create_token_service()
+# Domain -> school and (school, email) -> user lookups
+schools = create_school_registry(repo)
+passwords = create_password_hasher()
+# Serialized list responses keyed by tenant, route, query and collection versions
+response_cache = create_response_cache()
+# Server-sent change events, so clients need not poll whole lists
+changes = create_change_hub()
+repo.on_change = changes.record_changed
+# Score matrices per school and exam for the exam reports
+exam_stats = ExamStats(repo)
+# Persistent queue and worker pool for work that must not run on the request path
+jobs = create_job_queue()
+
 # Pydantic models
 class LoginRequest(BaseModel):
     email: str
@@ -188,6 +263,8 @@ class SchoolCreate(BaseModel):
     address: str
     phone: str
     email: str
+    # Creates an admin login for `email` when given
+    admin_password: Optional[str] = None
 
 class StudentCreate(BaseModel):
     name: str
@@ -226,6 +303,19 @@ class AttendanceCreate(BaseModel):
     evening: bool = False
     captured_images: Dict[str, str] = {}
 
+class AttendanceBitmap(BaseModel):
+    date: str
+    # Bit i of each mark is time_slots[i]
+    time_slots: List[str] = ["morning", "afternoon", "evening"]
+    marks: Dict[str, int]
+    class_name: Optional[str] = None
+    section: Optional[str] = None
+
+class AttendanceBatch(BaseModel):
+    # Rows are validated one by one against AttendanceCreate so a bad row fails alone
+    records: List[Dict[str, Any]] = []
+    bitmap: Optional[AttendanceBitmap] = None
+
 class ExamResultCreate(BaseModel):
     student_id: str
     exam_type: str
@@ -259,124 +349,186 @@ class PaymentRecord(BaseModel):
     payment_method: str
     receipt_number: Optional[str] = None
 
+ATTENDANCE_SLOTS = ("morning", "afternoon", "evening")
+MAX_ATTENDANCE_BATCH = 5000
+
 # Helper functions
 def get_tenant_id(school_domain: str = Header(..., alias="X-School-Domain")):
-    # In production, this would validate against a database
-    if school_domain == "stmarys":
-        return "school1"
-    elif school_domain == "brightfuture":
-        return "school2"
-    else:
+    school = schools.resolve(school_domain)
+    if school is None:
         raise HTTPException(status_code=400, detail="Invalid school domain")
+    return school["id"]
+
+def verify_platform_admin(admin_key: Optional[str] = Header(None, alias="X-Admin-Key")):
+    expected = os.getenv("PLATFORM_ADMIN_KEY")
+    if not expected:
+        raise HTTPException(status_code=403, detail="Platform admin endpoints are disabled")
+    if not admin_key or not secrets.compare_digest(admin_key, expected):
+        raise HTTPException(status_code=403, detail="Invalid admin key")
 
-def save_uploaded_image(file: UploadFile, student_id: str) -> str:
-    """Save uploaded image file and return the URL"""
+async def save_uploaded_image(file: UploadFile, student_id: str) -> str:
+    """Stream an uploaded image to its staging path off the event loop and return the path"""
     try:
-        # Generate filename with proper extension
-        file_extension = file.filename.split('.')[-1] if file.filename else 'jpg'
-        filename = f"student_{student_id}.{file_extension}"
-        filepath = f"uploads/student_photos/{filename}"
-
-        # Save the uploaded file
-        with open(filepath, "wb") as f:
-            content = file.file.read()
-            f.write(content)
-        
-        # Reset file position for potential future reads
+        filepath = staging_path(student_id, photo_extension(file.filename))
         file.file.seek(0)
-
-        # Return the URL
-        return f"/uploads/student_photos/{filename}"
-    except Exception as e:
-        print(f"Error saving uploaded image: {e}")
+        await run_in_threadpool(copy_stream, file.file, filepath)
+        return filepath
+    except Exception:
+        logger.exception("Error saving uploaded image", extra={"student_id": student_id})
         return ""
 
-def save_base64_image(base64_data: str, student_id: str) -> str:
-    """Save base64 image to file and return the URL"""
+async def save_base64_image(base64_data: str, student_id: str) -> str:
+    """Decode a base64 image to its staging path off the event loop and return the path"""
     try:
-        # Remove data URL prefix if present
-        if base64_data.startswith('data:image/'):
-            # Extract the base64 part after the comma
-            base64_data = base64_data.split(',')[1]
-
-        # Decode base64 data
-        image_data = base64.b64decode(base64_data)
-
-        # Generate filename
-        filename = f"student_{student_id}.jpg"
-        filepath = f"uploads/student_photos/{filename}"
-
-        # Save the image
-        with open(filepath, "wb") as f:
-            f.write(image_data)
-
-        # Return the URL
-        return f"/uploads/student_photos/{filename}"
-    except Exception as e:
-        print(f"Error saving image: {e}")
+        filepath = staging_path(student_id, "jpg")
+        await run_in_threadpool(write_base64, base64_data, filepath)
+        return filepath
+    except Exception:
+        logger.exception("Error saving image", extra={"student_id": student_id})
         return ""
 
-def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security)):
-    # Mock token verification - replace with real JWT verification
-    if not credentials.credentials:
-        raise HTTPException(status_code=401, detail="Invalid token")
-    return credentials.credentials
+def process_student_photo(job: JobContext):
+    """Strip metadata, publish the photo with thumbnail/medium variants and add their URLs to the student"""
+    student_id = job.payload["student_id"]
+    path = job.payload["path"]
+    urls = job.compute(publish_photo, path, student_id)
+    student = repo.get(job.tenant_id, "students", student_id)
+    if student:
+        repo.update(job.tenant_id, "students", student_id, {**student, **urls})
+    # Only once the student points at the published copy, so a retry can still read the upload
+    if os.path.exists(path):
+        os.remove(path)
+    return urls
+
+# Photos come first: a parent is looking at the new student while it runs
+jobs.register("student_photo", process_student_photo, priority=10)
+
+def list_records(request: Request, page: PageParams, tenant_id: str, collection: str, **filters) -> Response:
+    """List a tenant collection, paginated and projected when the client asks for it.
+
+    The body is cached under the collection's write counter: an unchanged list is
+    answered with 304 when the client's ETag matches, or from the cached bytes.
+    """
+    # The class filter goes through the student roster, so student writes change the result too
+    collections = (collection, "students") if filters.get("class_name") and collection != "students" else (collection,)
+    versions = repo.versions(tenant_id, collections)
+    key = cache_key(tenant_id, request.url.path, tuple(request.query_params.multi_items()), versions)
+    etag = make_etag(repo.version_epoch, *key)
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers={"ETag": etag, "Cache-Control": CACHE_CONTROL})
+
+    cached = response_cache.get(key)
+    if cached is None:
+        headers = {"ETag": etag, "Cache-Control": CACHE_CONTROL}
+        if not page.paginated:
+            records = repo.list(tenant_id, collection, **filters)
+        else:
+            records, next_key = repo.page(tenant_id, collection, after=page.after, limit=page.limit, **filters)
+            if next_key is not None:
+                headers[NEXT_CURSOR_HEADER] = encode_cursor(next_key)
+        cached = CachedResponse(dumps(project(records, page.fields)), etag, headers)
+        response_cache.put(key, cached)
+    return Response(content=cached.body, media_type="application/json", headers=cached.headers)
+
+async def verify_token(
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+    tenant_id: str = Depends(get_tenant_id)
+) -> Dict[str, Any]:
+    # Verified tokens are cached, so this is a dict lookup after the first request
+    try:
+        claims = tokens.verify(credentials.credentials)
+    except InvalidToken:
+        raise HTTPException(status_code=401, detail="Invalid token", headers={"WWW-Authenticate": "Bearer"})
+    if claims["tenant"] != tenant_id:
+        raise HTTPException(status_code=403, detail="Token is not valid for this school")
+    return claims
 
 # Routes
 @app.post("/api/login")
 async def login(request: LoginRequest):
-    # Get school by domain
-    school = next((s for s in mock_data["schools"] if s["domain"] == request.school_domain), None)
+    school = await run_in_threadpool(schools.resolve, request.school_domain)
     if not school:
         raise HTTPException(status_code=404, detail="School not found")
 
-    # Mock authentication with school-specific users
-    mock_users = {
-        "school1": {
-            "admin@stmarys.edu": {"id": "1", "name": "Admin User", "role": "admin", "password": "admin123", "school_id": "school1"},
-            "teacher@stmarys.edu": {"id": "2", "name": "John Teacher", "role": "teacher", "class": "10", "section": "A", "password": "teacher123", "school_id": "school1"},
-            "parent@stmarys.edu": {"id": "3", "name": "Parent User", "role": "parent", "children": ["student1", "student2"], "password": "parent123", "school_id": "school1"}
-        },
-        "school2": {
-            "admin@brightfuture.edu": {"id": "4", "name": "Admin User", "role": "admin", "password": "admin123", "school_id": "school2"},
-            "teacher@brightfuture.edu": {"id": "5", "name": "Sarah Teacher", "role": "teacher", "class": "8", "section": "A", "password": "teacher123", "school_id": "school2"},
-            "parent@brightfuture.edu": {"id": "6", "name": "Parent User", "role": "parent", "children": ["student4"], "password": "parent123", "school_id": "school2"}
-        }
-    }
-
-    school_users = mock_users.get(school["id"], {})
-    user = school_users.get(request.email)
+    user = await run_in_threadpool(schools.user, school["id"], request.email)
 
-    if user and user["password"] == request.password:
+    # bcrypt runs on the hasher's own pool; unknown emails are checked against a dummy hash
+    try:
+        valid, new_hash = await passwords.verify(school["id"], request.password, user["password"] if user else None)
+    except LoginThrottled:
+        raise HTTPException(status_code=429, detail="Too many sign-ins in progress, try again shortly", headers={"Retry-After": "5"})
+
+    if user and valid:
+        if new_hash:
+            # Stored hash used older parameters (or was a plaintext seed); replace it
+            user = await run_in_threadpool(schools.update_user, {**user, "password": new_hash})
+        token, expires_at = tokens.issue(user["id"], user["role"], school["id"])
         return {
             "success": True,
             "user": {k: v for k, v in user.items() if k != "password"},
             "school": {k: v for k, v in school.items() if k != "id"},
-            "token": "mock-jwt-token"
+            "token": token,
+            "expires_at": expires_at
         }
 
     raise HTTPException(status_code=401, detail="Invalid credentials")
 
 @app.get("/api/schools")
-async def get_schools():
-    return [{"id": s["id"], "name": s["name"], "domain": s["domain"]} for s in mock_data["schools"]]
+def get_schools():
+    return [{"id": s["id"], "name": s["name"], "domain": s["domain"]} for s in schools.schools()]
 
 @app.get("/api/schools/{school_domain}")
-async def get_school(school_domain: str):
-    school = next((s for s in mock_data["schools"] if s["domain"] == school_domain), None)
+def get_school(school_domain: str):
+    school = schools.resolve(school_domain)
     if not school:
         raise HTTPException(status_code=404, detail="School not found")
     return school
 
+@app.post("/api/schools", status_code=status.HTTP_201_CREATED, dependencies=[Depends(verify_platform_admin)])
+async def create_school(school: SchoolCreate):
+    domain = school.domain.strip().lower()
+    if not re.fullmatch(r"[a-z0-9][a-z0-9-]{1,62}", domain):
+        raise HTTPException(status_code=400, detail="Domain must be 2-63 lowercase letters, digits or hyphens")
+
+    new_school = {
+        "id": new_id("school"),
+        "name": school.name,
+        "domain": domain,
+        "address": school.address,
+        "phone": school.phone,
+        "email": school.email,
+        "logo_url": "",
+        "settings": {"time_slots": list(DEFAULT_TIME_SLOTS), "classes": [], "sections": []}
+    }
+    users = []
+    if school.admin_password:
+        users.append({
+            "id": new_id("user"),
+            "email": school.email,
+            "name": "Admin User",
+            "role": "admin",
+            "password": await passwords.hash(school.admin_password),
+            "school_id": new_school["id"]
+        })
+    try:
+        # One write: a school is never left without the admin it was created with
+        await run_in_threadpool(schools.add_school, new_school, users)
+    except ValueError:
+        raise HTTPException(status_code=409, detail="A school with this domain already exists")
+    return new_school
+
 @app.get("/api/students")
-async def get_students(
-    token: str = Depends(verify_token),
+def get_students(
+    request: Request,
+    page: PageParams = Depends(),
+    token: Dict[str, Any] = Depends(verify_token),
     tenant_id: str = Depends(get_tenant_id)
 ):
-    return mock_data["tenants"][tenant_id]["students"]
+    return list_records(request, page, tenant_id, "students")
 
 @app.post("/api/students")
 async def create_student(
+    background_tasks: BackgroundTasks,
     name: str = Form(...),
     class_name: str = Form(...),
     section: str = Form(...),
@@ -387,31 +539,33 @@ async def create_student(
     address: Optional[str] = Form(None),
     date_of_birth: Optional[str] = Form(None),
     file: Optional[UploadFile] = File(None),
-    token: str = Depends(verify_token),
+    token: Dict[str, Any] = Depends(verify_token),
     tenant_id: str = Depends(get_tenant_id)
 ):
-    print(f"Creating student with name={name}, class_name={class_name}, section={section}, parent_id={parent_id}")
-    print(f"File received: {file.filename if file else 'None'}")
-
     # Generate unique student ID using timestamp
-    import time
-    student_id = f"student{int(time.time() * 1000)}"
+    student_id = new_id("student")
 
     # Process photo if provided
     final_photo_url = ""
+    photo_filepath = ""
     if file:
-        final_photo_url = save_uploaded_image(file, student_id)
-        print(f"Saved uploaded image to: {final_photo_url}")
-    elif photo_url: # If photo_url was passed directly (e.g., for existing students)
-        final_photo_url = save_base64_image(photo_url, student_id)
-        print(f"Saved base64 image to: {final_photo_url}")
+        photo_filepath = await save_uploaded_image(file, student_id)
+        logger.debug("Saved uploaded image to %s", photo_filepath)
+    elif photo_url and is_hosted_photo(photo_url):
+        # Already hosted here (e.g. existing students), keep the URL as is
+        final_photo_url = photo_url
+    elif photo_url and photo_url.startswith(("/", "http://", "https://")):
+        raise HTTPException(status_code=400, detail="photo_url must be an uploaded photo or a base64 image")
+    elif photo_url:
+        photo_filepath = await save_base64_image(photo_url, student_id)
+        logger.debug("Saved base64 image to %s", photo_filepath)
 
     new_student = {
         "id": student_id,
         "name": name,
         "class": class_name,
         "section": section,
-        "photo_url": final_photo_url,  # Now contains the file URL
+        "photo_url": final_photo_url,  # Uploads get theirs from the photo job, once stripped
         "email": email or "",
         "phone": phone or "",
         "address": address or "",
@@ -420,27 +574,35 @@ async def create_student(
         "school_id": tenant_id
     }
 
-    print(f"Created student with photo_url: {new_student['photo_url']}")
-    print(f"Complete new student data: {new_student}")
+    logger.debug("Created student %s", new_student, extra={"tenant": tenant_id, "student_id": student_id})
+
+    await run_in_threadpool(repo.add, tenant_id, "students", new_student)
+
+    # A job worker strips and publishes uploads; photo_url and the variant URLs appear once ready
+    if photo_filepath:
+        background_tasks.add_task(
+            jobs.enqueue, tenant_id, "student_photo", {"student_id": student_id, "path": photo_filepath},
+            dedup_key=student_id,
+        )
 
-    mock_data["tenants"][tenant_id]["students"].append(new_student)
     return new_student
 
 @app.get("/api/teachers")
-async def get_teachers(
-    token: str = Depends(verify_token),
+def get_teachers(
+    request: Request,
+    page: PageParams = Depends(),
+    token: Dict[str, Any] = Depends(verify_token),
     tenant_id: str = Depends(get_tenant_id)
 ):
-    return mock_data["tenants"][tenant_id]["teachers"]
+    return list_records(request, page, tenant_id, "teachers")
 
 @app.post("/api/teachers")
-async def create_teacher(
+def create_teacher(
     teacher: TeacherCreate, 
-    token: str = Depends(verify_token),
+    token: Dict[str, Any] = Depends(verify_token),
     tenant_id: str = Depends(get_tenant_id)
 ):
-    import time
-    teacher_id = f"teacher{int(time.time() * 1000)}"
+    teacher_id = new_id("teacher")
 
     new_teacher = {
         "id": teacher_id,
@@ -451,24 +613,24 @@ async def create_teacher(
         "photo_url": "",
         "school_id": tenant_id
     }
-    mock_data["tenants"][tenant_id]["teachers"].append(new_teacher)
-    return new_teacher
+    return repo.add(tenant_id, "teachers", new_teacher)
 
 @app.get("/api/parents")
-async def get_parents(
-    token: str = Depends(verify_token),
+def get_parents(
+    request: Request,
+    page: PageParams = Depends(),
+    token: Dict[str, Any] = Depends(verify_token),
     tenant_id: str = Depends(get_tenant_id)
 ):
-    return mock_data["tenants"][tenant_id]["parents"]
+    return list_records(request, page, tenant_id, "parents")
 
 @app.post("/api/parents")
-async def create_parent(
+def create_parent(
     parent: ParentCreate, 
-    token: str = Depends(verify_token),
+    token: Dict[str, Any] = Depends(verify_token),
     tenant_id: str = Depends(get_tenant_id)
 ):
-    import time
-    parent_id = f"parent{int(time.time() * 1000)}"
+    parent_id = new_id("parent")
 
     new_parent = {
         "id": parent_id,
@@ -484,224 +646,772 @@ async def create_parent(
         "children_ids": parent.children_ids,
         "school_id": tenant_id
     }
-    mock_data["tenants"][tenant_id]["parents"].append(new_parent)
-    return new_parent
+    return repo.add(tenant_id, "parents", new_parent)
 
 @app.get("/api/attendance")
-async def get_attendance(
+def get_attendance(
+    request: Request,
     student_id: Optional[str] = None,
     class_name: Optional[str] = None,
     section: Optional[str] = None,
     date: Optional[str] = None,
-    token: str = Depends(verify_token),
+    page: PageParams = Depends(),
+    token: Dict[str, Any] = Depends(verify_token),
     tenant_id: str = Depends(get_tenant_id)
 ):
-    attendance = mock_data["tenants"][tenant_id]["attendance"]
-
-    if student_id:
-        attendance = [a for a in attendance if a["student_id"] == student_id]
-
-    if class_name and section:
-        # Get students in the class
-        class_students = [s["id"] for s in mock_data["tenants"][tenant_id]["students"] if s["class"] == class_name and s["section"] == section]
-        attendance = [a for a in attendance if a["student_id"] in class_students]
-
-    if date:
-        attendance = [a for a in attendance if a["date"] == date]
-
-    return attendance
+    return list_records(
+        request,
+        page,
+        tenant_id,
+        "attendance",
+        student_id=student_id,
+        date=date,
+        class_name=class_name,
+        section=section,
+    )
 
 @app.post("/api/attendance")
 async def create_attendance(
     attendance: AttendanceCreate, 
-    token: str = Depends(verify_token),
+    token: Dict[str, Any] = Depends(verify_token),
     tenant_id: str = Depends(get_tenant_id)
 ):
+    # Inline base64 captures go to the blob store; the record keeps only their URLs.
+    # Decoding, hashing and writing run in the threadpool so large captures don't stall the loop.
+    try:
+        captured_images = await run_in_threadpool(store_images, attendance.captured_images)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
     new_attendance = {
-        "id": f"att{len(mock_data['tenants'][tenant_id]['attendance']) + 1}",
+        "id": new_id("att"),
         **attendance.dict(),
+        "captured_images": captured_images,
         "school_id": tenant_id
     }
-    mock_data["tenants"][tenant_id]["attendance"].append(new_attendance)
-    return new_attendance
+    return await run_in_threadpool(repo.add, tenant_id, "attendance", new_attendance)
+
+@app.post("/api/attendance/batch")
+async def create_attendance_batch(
+    batch: AttendanceBatch,
+    token: Dict[str, Any] = Depends(verify_token),
+    tenant_id: str = Depends(get_tenant_id)
+):
+    rows: List[Dict[str, Any]] = list(batch.records)
+    if batch.bitmap:
+        bitmap = batch.bitmap
+        unknown_slots = [slot for slot in bitmap.time_slots if slot not in ATTENDANCE_SLOTS]
+        if unknown_slots:
+            raise HTTPException(status_code=400, detail=f"Unknown time slots: {', '.join(unknown_slots)}")
+        # A class alone names several sections; checking against one of them would be a guess
+        if bool(bitmap.class_name) != bool(bitmap.section):
+            raise HTTPException(status_code=400, detail="Give both class_name and section, or neither")
+        rows += [
+            {
+                "student_id": student_id,
+                "date": bitmap.date,
+                **{slot: bool(mask >> bit & 1) for bit, slot in enumerate(bitmap.time_slots)},
+            }
+            for student_id, mask in bitmap.marks.items()
+        ]
+
+    if len(rows) > MAX_ATTENDANCE_BATCH:
+        raise HTTPException(status_code=413, detail=f"At most {MAX_ATTENDANCE_BATCH} records per batch")
+
+    # Class membership is only checked for bitmap rows, which follow the explicit records
+    first_bitmap_row = len(batch.records)
+    roster = None
+    if batch.bitmap and batch.bitmap.class_name and batch.bitmap.section:
+        roster = await run_in_threadpool(repo.roster, tenant_id, batch.bitmap.class_name, batch.bitmap.section)
+    # Missing or non-string ids fail validation below; only real ids are looked up
+    student_ids = {student_id for student_id in (r.get("student_id") for r in rows) if isinstance(student_id, str)}
+    known_students = await run_in_threadpool(repo.existing_ids, tenant_id, "students", student_ids)
+
+    # Validate every row up front, then write the valid ones in one go
+    results: List[Dict[str, Any]] = [{} for _ in rows]
+    accepted: List[Tuple[int, AttendanceCreate]] = []
+    for position, row in enumerate(rows):
+        try:
+            attendance = AttendanceCreate(**row)
+            datetime.strptime(attendance.date, "%Y-%m-%d")
+        except (ValidationError, TypeError, ValueError) as e:
+            results[position] = {"index": position, "status": "error", "error": str(e)}
+            continue
+        if attendance.student_id not in known_students:
+            error = "Student not found"
+        elif roster is not None and position >= first_bitmap_row and attendance.student_id not in roster:
+            error = "Student is not in this class"
+        else:
+            accepted.append((position, attendance))
+            continue
+        results[position] = {"index": position, "status": "error", "student_id": attendance.student_id, "error": error}
+
+    # Images are stored only for rows that will be written, so rejected rows leave no blobs behind
+    valid_rows, valid_positions = [], []
+    for position, attendance in accepted:
+        if any(v.startswith("data:") for v in attendance.captured_images.values()):
+            try:
+                attendance.captured_images = await run_in_threadpool(store_images, attendance.captured_images)
+            except (TypeError, ValueError) as e:
+                results[position] = {"index": position, "status": "error", "student_id": attendance.student_id, "error": str(e)}
+                continue
+        valid_rows.append(attendance.dict(exclude_unset=True))
+        valid_positions.append(position)
+
+    def new_attendance(changes: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            "id": new_id("att"),
+            **AttendanceCreate(**changes).dict(),
+            "school_id": tenant_id
+        }
+
+    written = await run_in_threadpool(repo.upsert_attendance, tenant_id, valid_rows, new_attendance)
+    for position, (outcome, record) in zip(valid_positions, written):
+        results[position] = {"index": position, "status": outcome, "student_id": record["student_id"], "record": record}
+
+    return {
+        "results": results,
+        "created": sum(1 for r in results if r["status"] == "created"),
+        "updated": sum(1 for r in results if r["status"] == "updated"),
+        "failed": sum(1 for r in results if r["status"] == "error"),
+    }
+
+@app.get("/api/reports/attendance", response_class=FastJSONResponse)
+def get_attendance_report(
+    scope: str = "school",
+    period: str = "month",
+    class_name: Optional[str] = None,
+    section: Optional[str] = None,
+    student_id: Optional[str] = None,
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    token: Dict[str, Any] = Depends(verify_token),
+    tenant_id: str = Depends(get_tenant_id)
+):
+    if scope not in SCOPES:
+        raise HTTPException(status_code=400, detail=f"scope must be one of {', '.join(SCOPES)}")
+    if period not in PERIODS:
+        raise HTTPException(status_code=400, detail=f"period must be one of {', '.join(PERIODS)}")
+
+    # Without a class/student filter, every class/student of the scope is returned
+    key = None
+    if scope == "school":
+        key = scope_key("school")
+    elif scope == "class" and class_name and section:
+        key = scope_key("class", class_name, section)
+    elif scope == "student" and student_id:
+        key = scope_key("student", student_id=student_id)
+
+    try:
+        first = bucket_for(start, period) if start else None
+        last = bucket_for(end, period) if end else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="start and end must be YYYY-MM-DD dates")
+
+    rows = repo.attendance_rollups(tenant_id, scope, period, key=key, start=first, end=last)
+    return FastJSONResponse(build_report(scope, period, repo.time_slots(tenant_id), rows))
+
+def attendance_range(start: Optional[str], end: Optional[str]):
+    for day in (start, end):
+        if day:
+            try:
+                date.fromisoformat(day)
+            except ValueError:
+                raise HTTPException(status_code=400, detail="start and end must be YYYY-MM-DD dates")
+
+@app.get("/api/reports/attendance/presence", response_class=FastJSONResponse)
+def get_attendance_presence(
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    class_name: Optional[str] = None,
+    section: Optional[str] = None,
+    student_id: Optional[str] = None,
+    token: Dict[str, Any] = Depends(verify_token),
+    tenant_id: str = Depends(get_tenant_id)
+):
+    """Presence over any date range for the school, one class or one student"""
+    attendance_range(start, end)
+    student_ids = None
+    if class_name and section:
+        student_ids = repo.roster(tenant_id, class_name, section)
+    elif student_id:
+        student_ids = {student_id}
+    counts = repo.attendance_presence(tenant_id, start=start, end=end, student_ids=student_ids)
+    return FastJSONResponse({"start": start, "end": end, "time_slots": repo.time_slots(tenant_id), **summarize(counts)})
+
+@app.get("/api/attendance/grid", response_class=FastJSONResponse)
+def get_attendance_grid(
+    class_name: str,
+    section: str,
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    token: Dict[str, Any] = Depends(verify_token),
+    tenant_id: str = Depends(get_tenant_id)
+):
+    """A class register: per student, the slot mask of each marked day (null where unmarked)"""
+    attendance_range(start, end)
+    students = sorted(repo.roster(tenant_id, class_name, section))
+    dates, grid = repo.attendance_grid(tenant_id, students, start=start, end=end)
+    return FastJSONResponse({
+        "class_name": class_name,
+        "section": section,
+        # Bit i of each mark is time_slots[i], as in POST /api/attendance/batch bitmaps
+        "time_slots": repo.time_slots(tenant_id),
+        "dates": dates,
+        "marks": {
+            student_id: [mark if mark >= 0 else None for mark in row]
+            for student_id, row in zip(students, grid.tolist())
+        },
+    })
 
 @app.get("/api/exam-results")
-async def get_exam_results(
+def get_exam_results(
+    request: Request,
     student_id: Optional[str] = None,
-    token: str = Depends(verify_token),
+    page: PageParams = Depends(),
+    token: Dict[str, Any] = Depends(verify_token),
     tenant_id: str = Depends(get_tenant_id)
 ):
-    results = mock_data["tenants"][tenant_id]["exam_results"]
-    if student_id:
-        results = [r for r in results if r["student_id"] == student_id]
-    return results
+    return list_records(request, page, tenant_id, "exam_results", student_id=student_id)
 
 @app.post("/api/exam-results")
-async def create_exam_result(
+def create_exam_result(
     result: ExamResultCreate, 
-    token: str = Depends(verify_token),
+    token: Dict[str, Any] = Depends(verify_token),
     tenant_id: str = Depends(get_tenant_id)
 ):
     new_result = {
-        "id": f"exam{len(mock_data['tenants'][tenant_id]['exam_results']) + 1}",
+        "id": new_id("exam"),
         **result.dict(),
         "school_id": tenant_id
     }
-    mock_data["tenants"][tenant_id]["exam_results"].append(new_result)
+    repo.add(tenant_id, "exam_results", new_result)
+    exam_stats.record(tenant_id, new_result)
     return new_result
 
+def exam_frame(tenant_id: str, exam_type: str, date: Optional[str]):
+    found = exam_stats.frame(tenant_id, exam_type, date)
+    if found is None:
+        raise HTTPException(status_code=404, detail="No results for this exam")
+    return found
+
+@app.get("/api/reports/exams", response_class=FastJSONResponse)
+async def get_exams(
+    token: Dict[str, Any] = Depends(verify_token),
+    tenant_id: str = Depends(get_tenant_id)
+):
+    """Every exam sitting (exam_type and date) with its student count and subjects"""
+    return FastJSONResponse(await run_in_threadpool(exam_stats.exams, tenant_id))
+
+@app.get("/api/reports/exams/rankings", response_class=FastJSONResponse)
+async def get_exam_rankings(
+    exam_type: str,
+    date: Optional[str] = None,
+    class_name: Optional[str] = None,
+    section: Optional[str] = None,
+    limit: Optional[int] = None,
+    token: Dict[str, Any] = Depends(verify_token),
+    tenant_id: str = Depends(get_tenant_id)
+):
+    """Students of one exam by total score, with school and class ranks and percentiles"""
+    if limit is not None and limit < 1:
+        raise HTTPException(status_code=400, detail="limit must be positive")
+    # Loading the matrices and the pandas work run in the threadpool, off the event loop
+    (exam_type, date), frame = await run_in_threadpool(exam_frame, tenant_id, exam_type, date)
+    return FastJSONResponse({
+        "exam_type": exam_type,
+        "date": date,
+        "class_name": class_name,
+        "section": section,
+        "subjects": subject_columns(frame),
+        "rankings": await run_in_threadpool(rankings, frame, class_name, section, limit=limit),
+    })
+
+@app.get("/api/reports/exams/subjects", response_class=FastJSONResponse)
+async def get_exam_subjects(
+    exam_type: str,
+    date: Optional[str] = None,
+    class_name: Optional[str] = None,
+    section: Optional[str] = None,
+    token: Dict[str, Any] = Depends(verify_token),
+    tenant_id: str = Depends(get_tenant_id)
+):
+    """Per-subject count, mean, standard deviation, min, median and max for the school or a class"""
+    (exam_type, date), frame = await run_in_threadpool(exam_frame, tenant_id, exam_type, date)
+    return FastJSONResponse({
+        "exam_type": exam_type,
+        "date": date,
+        "class_name": class_name,
+        "section": section,
+        **await run_in_threadpool(subject_stats, frame, class_name, section),
+    })
+
+@app.get("/api/reports/exams/trends", response_class=FastJSONResponse)
+async def get_exam_trends(
+    exam_type: Optional[str] = None,
+    student_id: Optional[str] = None,
+    class_name: Optional[str] = None,
+    section: Optional[str] = None,
+    token: Dict[str, Any] = Depends(verify_token),
+    tenant_id: str = Depends(get_tenant_id)
+):
+    """Scores per exam in date order with the change from the exam before, for a student, a class or the school"""
+    frames = await run_in_threadpool(exam_stats.frames, tenant_id, exam_type)
+    return FastJSONResponse({
+        "exam_type": exam_type,
+        "student_id": student_id,
+        "class_name": class_name,
+        "section": section,
+        "exams": await run_in_threadpool(trends, frames, student_id=student_id, class_name=class_name, section=section),
+    })
+
 @app.get("/api/queries")
-async def get_queries(
+def get_queries(
+    request: Request,
     student_id: Optional[str] = None,
-    token: str = Depends(verify_token),
+    page: PageParams = Depends(),
+    token: Dict[str, Any] = Depends(verify_token),
     tenant_id: str = Depends(get_tenant_id)
 ):
-    queries = mock_data["tenants"][tenant_id]["queries"]
-    if student_id:
-        queries = [q for q in queries if q["student_id"] == student_id]
-    return queries
+    return list_records(request, page, tenant_id, "queries", student_id=student_id)
 
 @app.post("/api/queries")
-async def create_query(
+def create_query(
     query: QueryCreate, 
-    token: str = Depends(verify_token),
+    token: Dict[str, Any] = Depends(verify_token),
     tenant_id: str = Depends(get_tenant_id)
 ):
     new_query = {
-        "id": f"query{len(mock_data['tenants'][tenant_id]['queries']) + 1}",
+        "id": new_id("query"),
         **query.dict(),
         "status": "pending",
         "date": datetime.now().strftime("%Y-%m-%d"),
         "school_id": tenant_id
     }
-    mock_data["tenants"][tenant_id]["queries"].append(new_query)
-    return new_query
+    return repo.add(tenant_id, "queries", new_query)
 
 # Fee Management Endpoints
 @app.get("/api/fees")
-async def get_fees(
+def get_fees(
+    request: Request,
     student_id: Optional[str] = None,
-    token: str = Depends(verify_token),
+    page: PageParams = Depends(),
+    token: Dict[str, Any] = Depends(verify_token),
     tenant_id: str = Depends(get_tenant_id)
 ):
-    fees = mock_data["tenants"][tenant_id]["fees"]
-    if student_id:
-        fees = [f for f in fees if f["student_id"] == student_id]
-    return fees
+    return list_records(request, page, tenant_id, "fees", student_id=student_id)
+
+@app.get("/api/fees/dues", response_class=FastJSONResponse)
+def get_fee_dues(
+    kind: str = "overdue",
+    days: int = 30,
+    student_id: Optional[str] = None,
+    limit: int = 100,
+    token: Dict[str, Any] = Depends(verify_token),
+    tenant_id: str = Depends(get_tenant_id)
+):
+    """Pending installments, earliest due first: already overdue, or due within `days`"""
+    if kind not in DUE_KINDS:
+        raise HTTPException(status_code=400, detail=f"kind must be one of {', '.join(DUE_KINDS)}")
+    if not 1 <= limit <= 1000 or days < 0:
+        raise HTTPException(status_code=400, detail="limit must be 1-1000 and days must not be negative")
+
+    today = date.today()
+    if kind == "overdue":
+        start, end = None, (today - timedelta(days=1)).isoformat()
+    else:
+        start, end = today.isoformat(), (today + timedelta(days=days)).isoformat()
+    return FastJSONResponse(repo.fee_dues(tenant_id, start=start, end=end, student_id=student_id, limit=limit))
+
+@app.get("/api/fees/summary", response_class=FastJSONResponse)
+def get_fee_summary(
+    scope: str = "year",
+    student_id: Optional[str] = None,
+    academic_year: Optional[str] = None,
+    token: Dict[str, Any] = Depends(verify_token),
+    tenant_id: str = Depends(get_tenant_id)
+):
+    """Billed, paid and remaining totals per student or academic year"""
+    if scope not in LEDGER_SCOPES:
+        raise HTTPException(status_code=400, detail=f"scope must be one of {', '.join(LEDGER_SCOPES)}")
+    key = student_id if scope == "student" else academic_year
+    return FastJSONResponse(build_summary(scope, repo.fee_totals(tenant_id, scope, key=key)))
 
 @app.get("/api/fees/{fee_id}")
-async def get_fee(
+def get_fee(
     fee_id: str,
-    token: str = Depends(verify_token),
+    token: Dict[str, Any] = Depends(verify_token),
     tenant_id: str = Depends(get_tenant_id)
 ):
-    fee = next((f for f in mock_data["tenants"][tenant_id]["fees"] if f["id"] == fee_id), None)
+    fee = repo.get(tenant_id, "fees", fee_id)
     if not fee:
         raise HTTPException(status_code=404, detail="Fee record not found")
     return fee
 
 @app.post("/api/fees")
-async def create_fee(
+def create_fee(
     fee: FeeCreate,
-    token: str = Depends(verify_token),
+    token: Dict[str, Any] = Depends(verify_token),
     tenant_id: str = Depends(get_tenant_id)
 ):
+    # Every installment needs an id to be paid and listed as due
+    installments = [
+        {**installment, "id": installment.get("id") or new_id("inst"), "status": installment.get("status") or "pending",
+         "paid_date": installment.get("paid_date")}
+        for installment in fee.installments or []
+    ]
     new_fee = {
-        "id": f"fee{len(mock_data['tenants'][tenant_id]['fees']) + 1}",
+        "id": new_id("fee"),
         "student_id": fee.student_id,
         "academic_year": fee.academic_year,
         "total_amount": fee.total_amount,
-        "paid_amount": 0,
+        # Installments created as paid count from the start; later payments move this by their amount
+        "paid_amount": sum((money(i.get("amount")) for i in installments if i["status"] == "paid"), money(0)),
         "remaining_amount": fee.total_amount,
         "due_date": fee.due_date,
         "status": "unpaid",
         "school_id": tenant_id,
-        "installments": fee.installments or []
+        "installments": installments
     }
-    mock_data["tenants"][tenant_id]["fees"].append(new_fee)
-    return new_fee
+    settle(new_fee)
+    return repo.add(tenant_id, "fees", new_fee)
 
 @app.put("/api/fees/{fee_id}")
-async def update_fee(
+def update_fee(
     fee_id: str,
     fee_update: FeeUpdate,
-    token: str = Depends(verify_token),
+    token: Dict[str, Any] = Depends(verify_token),
     tenant_id: str = Depends(get_tenant_id)
 ):
-    fee_index = next((i for i, f in enumerate(mock_data["tenants"][tenant_id]["fees"]) if f["id"] == fee_id), None)
-    if fee_index is None:
-        raise HTTPException(status_code=404, detail="Fee record not found")
-
-    fee = mock_data["tenants"][tenant_id]["fees"][fee_index]
     update_data = fee_update.dict(exclude_unset=True)
 
-    for key, value in update_data.items():
-        fee[key] = value
+    def change(fee: Dict[str, Any]):
+        fee.update(update_data)
+        if "total_amount" in update_data:
+            settle(fee)
 
+    # Read, change and write under the fee's lock, so concurrent edits and payments are not lost
+    fee = repo.mutate(tenant_id, "fees", fee_id, change)
+    if fee is None:
+        raise HTTPException(status_code=404, detail="Fee record not found")
     return fee
 
 @app.post("/api/fees/{fee_id}/installments")
-async def add_installment(
+def add_installment(
     fee_id: str,
     installment: InstallmentCreate,
-    token: str = Depends(verify_token),
+    token: Dict[str, Any] = Depends(verify_token),
     tenant_id: str = Depends(get_tenant_id)
 ):
-    fee_index = next((i for i, f in enumerate(mock_data["tenants"][tenant_id]["fees"]) if f["id"] == fee_id), None)
-    if fee_index is None:
-        raise HTTPException(status_code=404, detail="Fee record not found")
-
-    fee = mock_data["tenants"][tenant_id]["fees"][fee_index]
     new_installment = {
-        "id": f"inst{len(fee['installments']) + 1}",
+        "id": new_id("inst"),
         "amount": installment.amount,
         "due_date": installment.due_date,
         "paid_date": None,
         "status": "pending"
     }
-
-    fee["installments"].append(new_installment)
-
-    # Recalculate total amount
-    fee["total_amount"] = sum(inst["amount"] for inst in fee["installments"])
-    fee["remaining_amount"] = fee["total_amount"] - fee["paid_amount"]
-
+    fee = repo.mutate(tenant_id, "fees", fee_id, lambda fee: add_fee_installment(fee, new_installment))
+    if fee is None:
+        raise HTTPException(status_code=404, detail="Fee record not found")
     return fee
 
 @app.post("/api/fees/{fee_id}/installments/{installment_id}/pay")
-async def record_payment(
+def record_payment(
     fee_id: str,
     installment_id: str,
     payment: PaymentRecord,
-    token: str = Depends(verify_token),
+    token: Dict[str, Any] = Depends(verify_token),
     tenant_id: str = Depends(get_tenant_id)
 ):
-    fee_index = next((i for i, f in enumerate(mock_data["tenants"][tenant_id]["fees"]) if f["id"] == fee_id), None)
-    if fee_index is None:
+    def change(fee: Dict[str, Any]):
+        if pay_installment(fee, installment_id, payment.paid_date) is None:
+            # Raised inside mutate, so nothing is written
+            raise HTTPException(status_code=404, detail="Installment not found")
+
+    fee = repo.mutate(tenant_id, "fees", fee_id, change)
+    if fee is None:
         raise HTTPException(status_code=404, detail="Fee record not found")
+    return fee
+
+# Roster import
+ROSTER_MODELS = {"students": StudentCreate, "parents": ParentCreate, "teachers": TeacherCreate}
+
+def import_roster_job(job: JobContext):
+    payload = job.payload
+    progress = ImportJob(job.tenant_id, payload["filename"], job_id=job.id)
+    run_import(repo, ROSTER_MODELS, progress, payload["path"], payload["extension"], payload["kind"],
+               report=lambda progress: job.report(progress.to_dict()))
+    if progress.status == "failed":
+        raise RuntimeError(progress.detail)
+    return {"created": progress.created, "failed": progress.failed}
+
+# One attempt only: a failed import may have committed some batches already
+jobs.register("roster_import", import_roster_job, max_attempts=1)
+
+def queue_import(tenant_id: str, path: str, filename: str, extension: str, kind: Optional[str]) -> Dict[str, Any]:
+    """Queue the stored upload, or return the active import of an identical file"""
+    job_id = new_id("job")
+    job = jobs.enqueue(
+        tenant_id, "roster_import",
+        {"path": path, "filename": filename, "extension": extension, "kind": kind},
+        dedup_key=file_digest(path),
+        job_id=job_id,
+        progress=ImportJob(tenant_id, filename, job_id=job_id).to_dict(),
+    )
+    if job["id"] != job_id:
+        os.remove(path)
+    return job
+
+@app.post("/api/imports/roster", status_code=status.HTTP_202_ACCEPTED)
+async def import_roster(
+    file: UploadFile = File(...),
+    kind: Optional[str] = Form(None),
+    token: Dict[str, Any] = Depends(verify_token),
+    tenant_id: str = Depends(get_tenant_id)
+):
+    filename = file.filename or ""
+    extension = import_format(filename)
+    if extension is None:
+        raise HTTPException(status_code=400, detail="Upload a .csv or .xlsx file")
+    if kind and kind not in ROSTER_KINDS:
+        raise HTTPException(status_code=400, detail=f"kind must be one of {', '.join(ROSTER_KINDS)}")
+
+    # Kept outside uploads/, which is publicly served
+    path = os.path.join(tempfile.gettempdir(), f"roster-{new_id()}.{extension}")
+    await run_in_threadpool(copy_stream, file.file, path)
+    # Queued before responding, so the returned id can be polled right away
+    job = await run_in_threadpool(queue_import, tenant_id, path, filename, extension, kind)
+    return import_status(job)
+
+def import_status(job: Dict[str, Any]) -> Dict[str, Any]:
+    progress = job["progress"]
+    if job["status"] in ("failed", "cancelled") and progress["status"] not in ("completed", "failed"):
+        # Cancelled, or its worker died mid-import
+        progress = {**progress, "status": "failed", "detail": job["error"] or "Import was cancelled"}
+    return progress
+
+@app.get("/api/imports/{job_id}")
+def get_import(
+    job_id: str,
+    token: Dict[str, Any] = Depends(verify_token),
+    tenant_id: str = Depends(get_tenant_id)
+):
+    job = jobs.store.get(tenant_id, job_id)
+    if job is None or job["kind"] != "roster_import":
+        raise HTTPException(status_code=404, detail="Import not found")
+    return import_status(job)
+
+# Jobs
+@app.get("/api/jobs")
+def get_jobs(
+    status: Optional[str] = None,
+    kind: Optional[str] = None,
+    limit: int = 100,
+    token: Dict[str, Any] = Depends(verify_token),
+    tenant_id: str = Depends(get_tenant_id)
+):
+    """The school's background jobs, newest first"""
+    if status and status not in JOB_STATUSES:
+        raise HTTPException(status_code=400, detail=f"status must be one of {', '.join(JOB_STATUSES)}")
+    if not 1 <= limit <= 1000:
+        raise HTTPException(status_code=400, detail="limit must be 1-1000")
+    return jobs.store.list(tenant_id, status=status, kind=kind, limit=limit)
+
+@app.get("/api/jobs/{job_id}")
+def get_job(
+    job_id: str,
+    token: Dict[str, Any] = Depends(verify_token),
+    tenant_id: str = Depends(get_tenant_id)
+):
+    job = jobs.store.get(tenant_id, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@app.delete("/api/jobs/{job_id}")
+def cancel_job(
+    job_id: str,
+    token: Dict[str, Any] = Depends(verify_token),
+    tenant_id: str = Depends(get_tenant_id)
+):
+    """Cancel a job that has not started yet"""
+    job = jobs.store.cancel(tenant_id, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if job["status"] != "cancelled":
+        raise HTTPException(status_code=409, detail=f"Job is already {job['status']}")
+    return job
+
+# Exports
+def export_response(rows, export_format: str, name: str) -> StreamingResponse:
+    if export_format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of {', '.join(EXPORT_FORMATS)}")
+    body = stream_csv(rows) if export_format == "csv" else stream_xlsx(rows, name)
+    filename = f"{name}-{datetime.now().strftime('%Y%m%d')}.{export_format}"
+    return StreamingResponse(
+        body,
+        media_type=MEDIA_TYPES[export_format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+def students_by_id(tenant_id: str) -> Dict[str, Dict[str, Any]]:
+    return {s["id"]: s for s in iter_records(repo, tenant_id, "students")}
+
+@app.get("/api/exports/attendance")
+def export_attendance(
+    format: str = "csv",
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    student_id: Optional[str] = None,
+    class_name: Optional[str] = None,
+    section: Optional[str] = None,
+    token: Dict[str, Any] = Depends(verify_token),
+    tenant_id: str = Depends(get_tenant_id)
+):
+    def records():
+        return iter_records(repo, tenant_id, "attendance", student_id=student_id, class_name=class_name, section=section)
 
-    fee = mock_data["tenants"][tenant_id]["fees"][fee_index]
-    installment_index = next((i for i, inst in enumerate(fee["installments"]) if inst["id"] == installment_id), None)
-    if installment_index is None:
-        raise HTTPException(status_code=404, detail="Installment not found")
+    rows = attendance_table(records, students_by_id(tenant_id), repo.time_slots(tenant_id), start=start, end=end)
+    return export_response(rows, format, "attendance")
 
-    installment = fee["installments"][installment_index]
-    installment["paid_date"] = payment.paid_date
-    installment["status"] = "paid"
+@app.get("/api/exports/exam-results")
+def export_exam_results(
+    format: str = "csv",
+    exam_type: Optional[str] = None,
+    student_id: Optional[str] = None,
+    token: Dict[str, Any] = Depends(verify_token),
+    tenant_id: str = Depends(get_tenant_id)
+):
+    def records():
+        return iter_records(repo, tenant_id, "exam_results", student_id=student_id)
 
-    # Recalculate fee totals
-    total_paid = sum(inst["amount"] for inst in fee["installments"] if inst["status"] == "paid")
-    fee["paid_amount"] = total_paid
-    fee["remaining_amount"] = fee["total_amount"] - total_paid
+    rows = exam_results_table(records, students_by_id(tenant_id), exam_type=exam_type)
+    return export_response(rows, format, "exam-results")
 
-    if total_paid == fee["total_amount"]:
-        fee["status"] = "paid"
-    elif total_paid > 0:
-        fee["status"] = "partial"
+@app.get("/api/exports/fees")
+def export_fees(
+    format: str = "csv",
+    academic_year: Optional[str] = None,
+    student_id: Optional[str] = None,
+    token: Dict[str, Any] = Depends(verify_token),
+    tenant_id: str = Depends(get_tenant_id)
+):
+    def records():
+        return iter_records(repo, tenant_id, "fees", student_id=student_id)
+
+    rows = fees_table(records, students_by_id(tenant_id), academic_year=academic_year)
+    return export_response(rows, format, "fees")
+
+def verify_stream_token(
+    authorization: Optional[str] = Header(None),
+    domain_header: Optional[str] = Header(None, alias="X-School-Domain"),
+    access_token: Optional[str] = None,
+    school_domain: Optional[str] = None,
+) -> str:
+    """Tenant of a change feed request; EventSource cannot set headers, so query parameters work too"""
+    tenant_id = get_tenant_id(domain_header or school_domain or "")
+    token = authorization[7:] if authorization and authorization.lower().startswith("bearer ") else access_token
+    if not token:
+        raise HTTPException(status_code=401, detail="Not authenticated", headers={"WWW-Authenticate": "Bearer"})
+    try:
+        claims = tokens.verify(token)
+    except InvalidToken:
+        raise HTTPException(status_code=401, detail="Invalid token", headers={"WWW-Authenticate": "Bearer"})
+    if claims["tenant"] != tenant_id:
+        raise HTTPException(status_code=403, detail="Token is not valid for this school")
+    return tenant_id
+
+@app.get("/api/changes")
+async def change_feed(
+    collections: Optional[str] = None,
+    student_id: Optional[List[str]] = Query(None),
+    class_name: Optional[str] = None,
+    section: Optional[str] = None,
+    last_event_id: Optional[str] = Header(None, alias="Last-Event-ID"),
+    tenant_id: str = Depends(verify_stream_token)
+):
+    """Server-sent events for writes in this school, optionally limited to some students or one class"""
+    watched = set(collections.split(",")) if collections else None
+    if watched is not None and not watched <= set(FEED_COLLECTIONS):
+        raise HTTPException(status_code=400, detail=f"collections must be among {', '.join(FEED_COLLECTIONS)}")
+    if bool(class_name) != bool(section):
+        raise HTTPException(status_code=400, detail="class_name and section must be given together")
+    if student_id and class_name:
+        raise HTTPException(status_code=400, detail="Filter by student_id or by class, not both")
+
+    student_ids = set(student_id) if student_id else None
+    if class_name and section:
+        student_ids = set(await run_in_threadpool(repo.roster, tenant_id, class_name, section))
+    subscription = Subscription(tenant_id, watched, student_ids, class_name, section, queue_size=changes.queue_size)
+    return StreamingResponse(
+        changes.stream(subscription, last_event_id),
+        media_type="text/event-stream",
+        # No proxy buffering, or events arrive in bursts
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+class ProfilerToggle(BaseModel):
+    enabled: bool
+    interval: Optional[float] = None
+    reset: bool = True
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    return Response(metrics.render(), media_type=PROMETHEUS_CONTENT_TYPE)
+
+@app.get("/api/admin/profiler", dependencies=[Depends(verify_platform_admin)])
+async def profiler_status(format: str = "status", limit: Optional[int] = None):
+    """Profiler state, or with format=collapsed the sampled stacks for flamegraph tools"""
+    if format == "collapsed":
+        return Response(profiler.collapsed(limit), media_type="text/plain")
+    if format != "status":
+        raise HTTPException(status_code=400, detail="format must be status or collapsed")
+    return profiler.status()
+
+@app.post("/api/admin/profiler", dependencies=[Depends(verify_platform_admin)])
+async def toggle_profiler(toggle: ProfilerToggle):
+    if toggle.interval is not None and not 0.001 <= toggle.interval <= 1:
+        raise HTTPException(status_code=400, detail="interval must be between 0.001 and 1 seconds")
+    if toggle.enabled:
+        profiler.start(toggle.interval, reset=toggle.reset)
     else:
-        fee["status"] = "unpaid"
-
-    return fee
+        profiler.stop()
+    logger.info("Sampling profiler %s", "started" if toggle.enabled else "stopped")
+    return profiler.status()
+
+@app.on_event("startup")
+async def start_change_feed():
+    await changes.start()
+
+@app.on_event("shutdown")
+async def stop_change_feed():
+    await changes.stop()
+
+@app.on_event("startup")
+async def start_rate_limiter():
+    if rate_limiter is not None:
+        await rate_limiter.start()
+
+@app.on_event("shutdown")
+async def stop_rate_limiter():
+    if rate_limiter is not None:
+        await rate_limiter.stop()
+
+@app.on_event("startup")
+def start_job_workers():
+    jobs.start()
+
+@app.on_event("shutdown")
+def stop_job_workers():
+    # Before the repository closes: running jobs may still write to it
+    jobs.stop()
+    jobs.store.close()
+
+@app.on_event("shutdown")
+def close_repository():
+    # Flushes the memory-store journal / releases pooled connections
+    profiler.stop()
+    repo.close()
 
 @app.get("/")
 async def root():
@@ -0,0 +1,250 @@
+import os
+import sys
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter, defaultdict
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+# Seconds; the upper bound of each bucket, +Inf is implicit
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Bytes
+SIZE_BUCKETS = (128, 512, 2048, 8192, 32768, 131072, 524288, 2097152, 8388608)
+UNMATCHED_ROUTE = "unmatched"
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def _format_labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+    escaped = (
+        (name, value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"'))
+        for name, value in labels
+    )
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+
+def _format_bound(bound: float) -> str:
+    return repr(float(bound)) if bound != float("inf") else "+Inf"
+
+
+class Histogram:
+    """Prometheus-style histogram: per label set, a count per bucket plus sum and count"""
+
+    def __init__(self, name: str, documentation: str, buckets: Iterable[float]):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(buckets)
+        self._series: Dict[Labels, List[float]] = {}
+
+    def observe(self, labels: Labels, value: float):
+        series = self._series.get(labels)
+        if series is None:
+            # One slot per bucket, one for +Inf, then sum
+            series = self._series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+        series[bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for labels, series in sorted(self._series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), series):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_format_labels(labels + (('le', _format_bound(bound)),))} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(labels)} {series[-1]}")
+            lines.append(f"{self.name}_count{_format_labels(labels)} {cumulative}")
+        return lines
+
+
+class CounterMetric:
+    def __init__(self, name: str, documentation: str):
+        self.name = name
+        self.documentation = documentation
+        self._values: Dict[Labels, float] = defaultdict(int)
+
+    def inc(self, labels: Labels, amount: float = 1):
+        self._values[labels] += amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        lines.extend(f"{self.name}{_format_labels(labels)} {value}" for labels, value in sorted(self._values.items()))
+        return lines
+
+
+class RequestMetrics:
+    """Request counters and histograms by route template, method and tenant.
+
+    Updated from the event loop only, so no locking. Each worker process keeps
+    its own numbers; Prometheus aggregates across workers when scraping them.
+    """
+
+    def __init__(self):
+        self.started = time.time()
+        self.requests = CounterMetric("http_requests_total", "Requests by route, method, tenant and status code")
+        self.errors = CounterMetric("http_request_errors_total", "Requests that ended in a 5xx response or an exception")
+        self.latency = Histogram("http_request_duration_seconds", "Time from request start to the last body chunk", LATENCY_BUCKETS)
+        self.request_size = Histogram("http_request_size_bytes", "Request body size from Content-Length", SIZE_BUCKETS)
+        self.response_size = Histogram("http_response_size_bytes", "Response body bytes sent", SIZE_BUCKETS)
+        self.shed = CounterMetric("http_requests_shed_total", "Requests answered 429 by the rate limiter, by tenant, route class and reason")
+        self.in_flight = 0
+
+    def record(self, route: str, method: str, tenant: str, status: int, duration: float,
+               request_bytes: int, response_bytes: int):
+        labels = (("route", route), ("method", method), ("tenant", tenant))
+        self.requests.inc(labels + (("status", str(status)),))
+        if status >= 500:
+            self.errors.inc(labels)
+        self.latency.observe(labels, duration)
+        self.request_size.observe(labels, request_bytes)
+        self.response_size.observe(labels, response_bytes)
+
+    def record_shed(self, tenant: str, route_class: str, reason: str):
+        self.shed.inc((("tenant", tenant), ("class", route_class), ("reason", reason)))
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in (self.requests, self.errors, self.latency, self.request_size, self.response_size, self.shed):
+            lines.extend(metric.render())
+        lines += [
+            "# HELP http_requests_in_flight Requests currently being handled",
+            "# TYPE http_requests_in_flight gauge",
+            f"http_requests_in_flight {self.in_flight}",
+            "# HELP process_start_time_seconds Start time of the process since unix epoch",
+            "# TYPE process_start_time_seconds gauge",
+            f"process_start_time_seconds {self.started}",
+        ]
+        return "\n".join(lines) + "\n"
+
+
+class MetricsMiddleware:
+    """ASGI middleware feeding RequestMetrics.
+
+    Plain ASGI rather than BaseHTTPMiddleware, so streamed responses pass
+    through untouched and only their byte counts are observed. Routes are
+    labelled by their template (/api/fees/{fee_id}); unmatched paths share one
+    label so made-up URLs cannot grow the series without bound.
+    """
+
+    def __init__(self, app, metrics: RequestMetrics, tenant_of: Callable[[Optional[str]], str]):
+        self.app = app
+        self.metrics = metrics
+        self.tenant_of = tenant_of
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        status = 500
+        response_bytes = 0
+
+        async def observed_send(message):
+            nonlocal status, response_bytes
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body":
+                response_bytes += len(message.get("body", b""))
+            await send(message)
+
+        self.metrics.in_flight += 1
+        try:
+            await self.app(scope, receive, observed_send)
+        finally:
+            self.metrics.in_flight -= 1
+            headers = dict(scope.get("headers") or [])
+            route = scope.get("route")
+            try:
+                request_bytes = int(headers.get(b"content-length", b"0"))
+            except ValueError:
+                request_bytes = 0
+            domain = headers.get(b"x-school-domain")
+            self.metrics.record(
+                getattr(route, "path", UNMATCHED_ROUTE),
+                scope["method"],
+                self.tenant_of(domain.decode("latin-1") if domain else None),
+                status,
+                time.perf_counter() - started,
+                request_bytes,
+                response_bytes,
+            )
+
+
+class SamplingProfiler:
+    """Statistical profiler that can be switched on and off while serving.
+
+    A daemon thread snapshots every thread's stack each `interval` seconds and
+    counts them in collapsed form ("thread;module:function;... count"), which
+    flamegraph.pl and speedscope read directly. Nothing runs while it is off.
+    """
+
+    def __init__(self, interval: float = 0.005, max_depth: int = 64):
+        self.interval = interval
+        self.max_depth = max_depth
+        self.samples = 0
+        self._stacks: Counter = Counter()
+        self._lock = threading.Lock()
+        self._stop: Optional[threading.Event] = None
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, interval: Optional[float] = None, reset: bool = True):
+        if self.running:
+            self.stop()
+        if interval:
+            self.interval = interval
+        if reset:
+            with self._lock:
+                self._stacks.clear()
+                self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, args=(self._stop,), name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._stop is not None:
+            self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self._thread = None
+
+    def _run(self, stop: threading.Event):
+        own = threading.get_ident()
+        while not stop.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            collected = []
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                # Innermost frames first; walking f_back avoids traceback's source line lookups
+                while frame is not None and len(stack) < self.max_depth:
+                    code = frame.f_code
+                    stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                collected.append(";".join(reversed(stack)))
+            with self._lock:
+                self._stacks.update(collected)
+                self.samples += 1
+
+    def status(self) -> Dict[str, Any]:
+        return {"running": self.running, "interval": self.interval, "samples": self.samples, "stacks": len(self._stacks)}
+
+    def collapsed(self, limit: Optional[int] = None) -> str:
+        with self._lock:
+            stacks = self._stacks.most_common(limit)
+        return "".join(f"{stack} {count}\n" for stack, count in stacks)
+
+
+def create_profiler() -> SamplingProfiler:
+    profiler = SamplingProfiler(interval=float(os.getenv("PROFILER_INTERVAL", "0.005")))
+    if os.getenv("PROFILER_ENABLED", "false").lower() == "true":
+        profiler.start()
+    return profiler
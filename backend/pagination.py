@@ -0,0 +1,47 @@
+import base64
+import binascii
+import json
+from typing import Any, Dict, List, Optional
+
+from fastapi import HTTPException, Query
+
+MAX_PAGE_SIZE = 1000
+DEFAULT_PAGE_SIZE = 100
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def encode_cursor(key: int) -> str:
+    return base64.urlsafe_b64encode(json.dumps({"k": key}).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> int:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        key = json.loads(base64.urlsafe_b64decode(padded.encode()))["k"]
+    except (binascii.Error, ValueError, KeyError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if not isinstance(key, int):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return key
+
+
+class PageParams:
+    """Optional ?limit=&cursor=&fields= on list routes; without limit/cursor the full list is returned"""
+
+    def __init__(
+        self,
+        limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+        cursor: Optional[str] = None,
+        fields: Optional[str] = None,
+    ):
+        self.paginated = limit is not None or cursor is not None
+        self.limit = limit or DEFAULT_PAGE_SIZE
+        self.after = decode_cursor(cursor) if cursor else None
+        self.fields = [f.strip() for f in fields.split(",") if f.strip()] if fields else None
+
+
+def project(records: List[Dict[str, Any]], fields: Optional[List[str]]) -> List[Dict[str, Any]]:
+    """Keep only the requested top-level fields of each record"""
+    if not fields:
+        return records
+    return [{f: r[f] for f in fields if f in r} for r in records]
@@ -0,0 +1,69 @@
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional, Tuple
+
+from passlib.context import CryptContext
+
+DEFAULT_BCRYPT_ROUNDS = 12
+DEFAULT_HASH_WORKERS = 4
+DEFAULT_LOGINS_PER_TENANT = 8
+DEFAULT_LOGIN_WAIT = 10.0
+
+
+class LoginThrottled(Exception):
+    """Too many logins for one school are already waiting"""
+
+
+class PasswordHasher:
+    """bcrypt hashing on a dedicated, bounded thread pool.
+
+    bcrypt takes 100ms+ and releases the GIL, so it runs beside the event loop
+    instead of on it. Each tenant may have at most `per_tenant` verifications
+    queued or running, so one school's sign-in rush cannot take the whole pool.
+    Hashes made with other parameters (older rounds, or demo plaintext) still
+    verify and come back with a replacement hash to store.
+    """
+
+    def __init__(self, rounds: int = DEFAULT_BCRYPT_ROUNDS, workers: int = DEFAULT_HASH_WORKERS,
+                 per_tenant: int = DEFAULT_LOGINS_PER_TENANT, wait: float = DEFAULT_LOGIN_WAIT):
+        # "plaintext" only matches legacy seed passwords, which are upgraded on their first login
+        self.context = CryptContext(schemes=["bcrypt", "plaintext"], deprecated=["plaintext"], bcrypt__rounds=rounds)
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="password-hash")
+        self.per_tenant = per_tenant
+        self.wait = wait
+        self._slots: Dict[str, asyncio.Semaphore] = {}
+        # Verified when the user does not exist, so response time does not reveal valid emails
+        self._dummy_hash = self.context.hash("dummy-password")
+
+    async def _run(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+
+    async def hash(self, password: str) -> str:
+        return await self._run(self.context.hash, password)
+
+    async def verify(self, tenant_id: str, password: str, stored: Optional[str]) -> Tuple[bool, Optional[str]]:
+        """Return (valid, new_hash); new_hash is set when the stored hash should be replaced"""
+        slots = self._slots.get(tenant_id)
+        if slots is None:
+            slots = self._slots[tenant_id] = asyncio.Semaphore(self.per_tenant)
+        try:
+            await asyncio.wait_for(slots.acquire(), self.wait)
+        except asyncio.TimeoutError:
+            raise LoginThrottled()
+        try:
+            if stored is None:
+                await self._run(self.context.verify, password, self._dummy_hash)
+                return False, None
+            return await self._run(self.context.verify_and_update, password, stored)
+        finally:
+            slots.release()
+
+
+def create_password_hasher() -> PasswordHasher:
+    return PasswordHasher(
+        rounds=int(os.getenv("BCRYPT_ROUNDS", str(DEFAULT_BCRYPT_ROUNDS))),
+        workers=int(os.getenv("PASSWORD_HASH_WORKERS", str(DEFAULT_HASH_WORKERS))),
+        per_tenant=int(os.getenv("LOGIN_CONCURRENCY_PER_TENANT", str(DEFAULT_LOGINS_PER_TENANT))),
+        wait=float(os.getenv("LOGIN_QUEUE_TIMEOUT", str(DEFAULT_LOGIN_WAIT))),
+    )
@@ -0,0 +1,322 @@
+import hashlib
+import logging
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from jsonresponse import dumps
+
+try:
+    import redis.asyncio as redis_asyncio  # pyright: ignore[reportMissingImports]
+except ImportError:  # Only needed for RATE_LIMIT_BACKEND=redis
+    redis_asyncio = None
+
+logger = logging.getLogger(__name__)
+
+# (rate per second, burst) for each budget
+Budget = Tuple[float, float]
+
+DEFAULT_TENANT_BUDGET: Budget = (50.0, 100.0)
+DEFAULT_TOKEN_BUDGET: Budget = (10.0, 40.0)
+DEFAULT_IN_FLIGHT = 16
+DEFAULT_MAX_KEYS = 10000
+
+# Expensive routes also draw on a budget of their own, per user (Bearer token) of each school.
+# First match wins: (class, methods or None for any, path prefixes)
+ROUTE_CLASSES = (
+    ("upload", ("POST",), ("/api/students", "/api/imports", "/api/attendance/batch")),
+    ("export", None, ("/api/exports",)),
+    ("report", None, ("/api/reports", "/api/attendance/grid")),
+)
+DEFAULT_CLASS_BUDGETS: Dict[str, Budget] = {
+    "upload": (5.0, 30.0),
+    "export": (1.0, 10.0),
+    "report": (10.0, 40.0),
+}
+
+# Never limited: health checks, scrapes, docs and static files
+EXEMPT_PATHS = {"/", "/favicon.ico", "/metrics", "/openapi.json"}
+EXEMPT_PREFIXES = ("/docs", "/redoc", "/uploads/")
+# Long-lived streams would hold an in-flight slot for their whole life; only their connects are rate limited
+STREAM_PATHS = {"/api/changes"}
+
+
+def route_class(method: str, path: str) -> Optional[str]:
+    """Name of the expensive-route budget a request draws on, or None"""
+    for name, methods, prefixes in ROUTE_CLASSES:
+        if methods is not None and method not in methods:
+            continue
+        for prefix in prefixes:
+            if path == prefix or path.startswith(prefix + "/"):
+                return name
+    return None
+
+
+def token_key(authorization: bytes) -> Optional[str]:
+    """Short digest of a Bearer token; the raw token never becomes a dict or Redis key"""
+    scheme, _, credentials = authorization.partition(b" ")
+    if scheme.lower() != b"bearer" or not credentials:
+        return None
+    return hashlib.sha256(credentials.strip()).hexdigest()[:24]
+
+
+class LocalLimiter:
+    """Token buckets held by this worker.
+
+    Buckets are (tokens, last refill) pairs refilled lazily when drawn on. The
+    least recently used are dropped beyond max_keys: a bucket left alone that
+    long has usually refilled, which is the same as a fresh one.
+    """
+
+    def __init__(self, max_keys: int = DEFAULT_MAX_KEYS):
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    async def acquire(self, draws: Sequence[Tuple[str, float, float]]) -> float:
+        return self.take(draws)
+
+    def take(self, draws: Sequence[Tuple[str, float, float]], now: Optional[float] = None) -> float:
+        """Take one token from every (key, rate, burst) bucket, or none of them.
+
+        Returns 0 when admitted, else the seconds until all of them would have a token.
+        """
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            levels = []
+            wait = 0.0
+            for key, rate, burst in draws:
+                bucket = self._buckets.get(key)
+                tokens = burst if bucket is None else min(burst, bucket[0] + (now - bucket[1]) * rate)
+                levels.append(tokens)
+                if tokens < 1:
+                    wait = max(wait, (1 - tokens) / rate)
+            if wait:
+                return wait
+            for (key, _, _), tokens in zip(draws, levels):
+                self._buckets[key] = [tokens - 1, now]
+                self._buckets.move_to_end(key)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return 0.0
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+
+# All-or-nothing draw on KEYS; ARGV holds rate, burst per key. Uses the Redis clock so workers agree.
+TAKE_SCRIPT = """
+local now = redis.call('TIME')
+local t = tonumber(now[1]) + tonumber(now[2]) / 1000000
+local levels = {}
+local wait = 0
+for i, key in ipairs(KEYS) do
+  local rate, burst = tonumber(ARGV[2 * i - 1]), tonumber(ARGV[2 * i])
+  local state = redis.call('HMGET', key, 'tokens', 'ts')
+  local tokens = tonumber(state[1]) or burst
+  local ts = tonumber(state[2]) or t
+  tokens = math.min(burst, tokens + math.max(0, t - ts) * rate)
+  levels[i] = tokens
+  if tokens < 1 then wait = math.max(wait, (1 - tokens) / rate) end
+end
+if wait > 0 then return tostring(wait) end
+for i, key in ipairs(KEYS) do
+  local rate, burst = tonumber(ARGV[2 * i - 1]), tonumber(ARGV[2 * i])
+  redis.call('HSET', key, 'tokens', tostring(levels[i] - 1), 'ts', tostring(t))
+  redis.call('PEXPIRE', key, math.ceil(burst / rate * 1000) + 1000)
+end
+return '0'
+"""
+
+
+class RedisLimiter:
+    """Token buckets in Redis, shared by every worker.
+
+    While Redis is unreachable requests are limited by this worker's own
+    buckets instead, so an outage neither rejects everything nor lifts the limits.
+    """
+
+    def __init__(self, url: str, prefix: str = "ratelimit:", max_keys: int = DEFAULT_MAX_KEYS):
+        if redis_asyncio is None:
+            raise RuntimeError("RATE_LIMIT_BACKEND=redis requires the redis package")
+        self.url = url
+        self.prefix = prefix
+        self.fallback = LocalLimiter(max_keys)
+        self._client = None
+        self._script = None
+        self._warned = 0.0
+
+    async def start(self):
+        assert redis_asyncio is not None  # checked in __init__
+        self._client = redis_asyncio.from_url(self.url)
+        self._script = self._client.register_script(TAKE_SCRIPT)
+
+    async def acquire(self, draws: Sequence[Tuple[str, float, float]]) -> float:
+        script = self._script
+        if script is None:
+            return self.fallback.take(draws)
+        args: List[float] = []
+        for _, rate, burst in draws:
+            args += [rate, burst]
+        try:
+            wait = await script(keys=[self.prefix + key for key, _, _ in draws], args=args)
+        except Exception as exc:
+            now = time.monotonic()
+            if now - self._warned > 60:
+                self._warned = now
+                logger.warning("Rate limit backend unavailable, limiting per worker: %s", exc)
+            return self.fallback.take(draws)
+        return float(wait)
+
+    async def stop(self):
+        if self._client is not None:
+            await self._client.close()
+            self._client = self._script = None
+
+
+class RateLimiter:
+    """Per-tenant and per-token budgets plus a per-tenant in-flight cap.
+
+    Every request draws one token from its tenant's bucket and one from its
+    Bearer token's; requests to expensive routes also draw from that token's
+    bucket for the route class, so one user's month-end exports do not use up
+    the rest of the school's. The in-flight cap always counts this worker's
+    requests only: it guards the worker's own threads and connections.
+    """
+
+    def __init__(self, backend, tenant: Budget = DEFAULT_TENANT_BUDGET, token: Budget = DEFAULT_TOKEN_BUDGET,
+                 classes: Optional[Dict[str, Budget]] = None, in_flight: int = DEFAULT_IN_FLIGHT):
+        self.backend = backend
+        self.tenant = tenant
+        self.token = token
+        self.classes = dict(DEFAULT_CLASS_BUDGETS if classes is None else classes)
+        self.in_flight = in_flight
+        self._active: Dict[str, int] = {}
+
+    def draws(self, tenant: str, token: Optional[str], klass: Optional[str]) -> List[Tuple[str, float, float]]:
+        draws = [("tenant:" + tenant, self.tenant[0], self.tenant[1])]
+        if klass is not None and klass in self.classes:
+            rate, burst = self.classes[klass]
+            # Requests without a token share one bucket per school
+            draws.append((f"{klass}:{tenant}:{token or '-'}", rate, burst))
+        if token is not None:
+            draws.append(("token:" + token, self.token[0], self.token[1]))
+        return draws
+
+    async def admit(self, tenant: str, token: Optional[str], klass: Optional[str]) -> float:
+        """0 when the request may run, else seconds the client should wait"""
+        return await self.backend.acquire(self.draws(tenant, token, klass))
+
+    def enter(self, tenant: str) -> bool:
+        active = self._active.get(tenant, 0)
+        if self.in_flight and active >= self.in_flight:
+            return False
+        self._active[tenant] = active + 1
+        return True
+
+    def leave(self, tenant: str):
+        active = self._active[tenant] - 1
+        if active:
+            self._active[tenant] = active
+        else:
+            del self._active[tenant]
+
+    async def start(self):
+        await self.backend.start()
+
+    async def stop(self):
+        await self.backend.stop()
+
+
+class RateLimitMiddleware:
+    """ASGI middleware answering 429 with Retry-After once a budget is spent.
+
+    Requests are shed before any routing or body parsing, so a school over its
+    budget costs the worker almost nothing. Tenants are the school ids behind
+    X-School-Domain, as resolved for metrics, so invented domains share one key.
+    """
+
+    def __init__(self, app, limiter: Optional[RateLimiter], tenant_of: Callable[[Optional[str]], str],
+                 on_shed: Optional[Callable[[str, str, str], None]] = None):
+        self.app = app
+        self.limiter = limiter
+        self.tenant_of = tenant_of
+        self.on_shed = on_shed
+
+    async def __call__(self, scope, receive, send):
+        path = scope.get("path", "")
+        if (self.limiter is None or scope["type"] != "http" or scope["method"] == "OPTIONS"
+                or path in EXEMPT_PATHS or path.startswith(EXEMPT_PREFIXES)):
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope.get("headers") or [])
+        domain = headers.get(b"x-school-domain")
+        tenant = self.tenant_of(domain.decode("latin-1") if domain else None)
+        authorization = headers.get(b"authorization")
+        klass = route_class(scope["method"], path)
+
+        wait = await self.limiter.admit(tenant, token_key(authorization) if authorization else None, klass)
+        if wait:
+            await self._reject(send, tenant, klass, "rate", wait, "Too many requests, slow down")
+            return
+        if path in STREAM_PATHS:
+            await self.app(scope, receive, send)
+            return
+        if not self.limiter.enter(tenant):
+            await self._reject(send, tenant, klass, "in_flight", 1, "Too many concurrent requests for this school")
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.limiter.leave(tenant)
+
+    async def _reject(self, send, tenant: str, klass: Optional[str], reason: str, wait: float, detail: str):
+        if self.on_shed is not None:
+            self.on_shed(tenant, klass or "default", reason)
+        body = dumps({"detail": detail})
+        await send({
+            "type": "http.response.start",
+            "status": 429,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(max(1, math.ceil(wait))).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
+
+
+def _budget(name: str, default: Budget) -> Budget:
+    rate = float(os.getenv(f"RATE_LIMIT_{name}_RATE", str(default[0])))
+    burst = float(os.getenv(f"RATE_LIMIT_{name}_BURST", str(default[1])))
+    if rate <= 0 or burst < 1:
+        raise ValueError(f"RATE_LIMIT_{name}_RATE must be positive and RATE_LIMIT_{name}_BURST at least 1")
+    return rate, burst
+
+
+def create_rate_limiter() -> Optional[RateLimiter]:
+    """RateLimiter from RATE_LIMIT_* settings, or None when RATE_LIMIT_ENABLED=false"""
+    if os.getenv("RATE_LIMIT_ENABLED", "true").lower() != "true":
+        return None
+    max_keys = int(os.getenv("RATE_LIMIT_MAX_KEYS", str(DEFAULT_MAX_KEYS)))
+    backend = os.getenv("RATE_LIMIT_BACKEND", "local")
+    if backend == "redis":
+        store = RedisLimiter(os.getenv("REDIS_URL", "redis://localhost:6379/0"), max_keys=max_keys)
+    elif backend == "local":
+        store = LocalLimiter(max_keys)
+    else:
+        raise ValueError(f"Unknown RATE_LIMIT_BACKEND: {backend}")
+    return RateLimiter(
+        store,
+        tenant=_budget("TENANT", DEFAULT_TENANT_BUDGET),
+        token=_budget("TOKEN", DEFAULT_TOKEN_BUDGET),
+        classes={name: _budget(name.upper(), budget) for name, budget in DEFAULT_CLASS_BUDGETS.items()},
+        in_flight=int(os.getenv("RATE_LIMIT_IN_FLIGHT", str(DEFAULT_IN_FLIGHT))),
+    )
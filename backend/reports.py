@@ -0,0 +1,157 @@
+from collections import defaultdict
+from datetime import date as date_type
+from functools import lru_cache
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Sequence, Tuple
+
+PERIODS = ("day", "week", "month")
+SCOPES = ("school", "class", "student")
+
+# (scope, scope_key, period, bucket, slot) -> (present, total)
+RollupKey = Tuple[str, str, str, str, str]
+
+
+@lru_cache(maxsize=65536)
+def bucket_for(day: str, period: str) -> str:
+    """Bucket label of a YYYY-MM-DD date; labels of one period sort chronologically"""
+    parsed = date_type.fromisoformat(day)
+    if period == "day":
+        return parsed.isoformat()
+    if period == "month":
+        return parsed.isoformat()[:7]
+    year, week, _ = parsed.isocalendar()
+    return f"{year}-W{week:02d}"
+
+
+def scope_key(scope: str, class_name: Optional[str] = None, section: Optional[str] = None,
+              student_id: Optional[str] = None) -> str:
+    if scope == "class":
+        return f"{class_name}|{section}"
+    if scope == "student":
+        return student_id or ""
+    return ""
+
+
+def describe_scope(scope: str, key: str) -> Dict[str, str]:
+    if scope == "class":
+        class_name, _, section = key.partition("|")
+        return {"class_name": class_name, "section": section}
+    if scope == "student":
+        return {"student_id": key}
+    return {}
+
+
+def rollup_deltas(
+    record: Optional[Dict[str, Any]],
+    student: Optional[Dict[str, Any]],
+    time_slots: Iterable[str],
+    sign: int,
+) -> Dict[RollupKey, List[int]]:
+    """Counter changes caused by adding (sign=1) or removing (sign=-1) one attendance record"""
+    deltas: Dict[RollupKey, List[int]] = {}
+    if not record:
+        return deltas
+    try:
+        buckets = [(period, bucket_for(record["date"], period)) for period in PERIODS]
+    except (KeyError, TypeError, ValueError):
+        # Undated or malformed dates cannot be bucketed
+        return deltas
+
+    scopes = [("school", ""), ("student", record["student_id"])]
+    if student:
+        scopes.append(("class", scope_key("class", student["class"], student["section"])))
+
+    for slot in time_slots:
+        if record.get(slot) is None:
+            continue
+        present = sign if record[slot] else 0
+        for scope, key in scopes:
+            for period, bucket in buckets:
+                deltas[(scope, key, period, bucket, slot)] = [present, sign]
+    return deltas
+
+
+def merge_deltas(target: Dict[RollupKey, List[int]], deltas: Dict[RollupKey, List[int]]):
+    for key, (present, total) in deltas.items():
+        counts = target.setdefault(key, [0, 0])
+        counts[0] += present
+        counts[1] += total
+
+
+def _rate(present: int, total: int) -> Optional[float]:
+    return round(present / total, 4) if total else None
+
+
+def summarize(slots: Mapping[str, Sequence[int]]) -> Dict[str, Any]:
+    """Overall and per-slot present/total/rate from slot -> (present, total)"""
+    present = sum(p for p, _ in slots.values())
+    total = sum(t for _, t in slots.values())
+    return {
+        "present": present,
+        "total": total,
+        "rate": _rate(present, total),
+        "slots": {
+            slot: {"present": p, "total": t, "rate": _rate(p, t)}
+            for slot, (p, t) in slots.items()
+        },
+    }
+
+
+def build_report(
+    scope: str,
+    period: str,
+    time_slots: List[str],
+    rows: Iterable[Tuple[str, str, str, int, int]],
+) -> Dict[str, Any]:
+    """Shape (scope_key, bucket, slot, present, total) rows into the report response"""
+    groups: Dict[str, Dict[str, Dict[str, List[int]]]] = defaultdict(lambda: defaultdict(dict))
+    for key, bucket, slot, present, total in rows:
+        if total:
+            groups[key][bucket][slot] = [present, total]
+
+    result = []
+    for key in sorted(groups):
+        buckets = groups[key]
+        overall: Dict[str, List[int]] = {}
+        for slots in buckets.values():
+            for slot, (present, total) in slots.items():
+                counts = overall.setdefault(slot, [0, 0])
+                counts[0] += present
+                counts[1] += total
+        result.append({
+            **describe_scope(scope, key),
+            "summary": summarize(overall),
+            "buckets": [{"bucket": bucket, **summarize(buckets[bucket])} for bucket in sorted(buckets)],
+        })
+    return {"scope": scope, "period": period, "time_slots": time_slots, "groups": result}
+
+
+class AttendanceRollups:
+    """In-process rollup counters for one tenant: scope -> period -> key -> bucket -> slot -> [present, total]"""
+
+    def __init__(self):
+        self._counts: Dict[str, Dict[str, Dict[str, Dict[str, Dict[str, List[int]]]]]] = defaultdict(
+            lambda: defaultdict(lambda: defaultdict(lambda: defaultdict(dict)))
+        )
+
+    def apply(self, deltas: Dict[RollupKey, List[int]]):
+        for (scope, key, period, bucket, slot), (present, total) in deltas.items():
+            counts = self._counts[scope][period][key][bucket].setdefault(slot, [0, 0])
+            counts[0] += present
+            counts[1] += total
+
+    def rows(
+        self,
+        scope: str,
+        period: str,
+        key: Optional[str] = None,
+        start: Optional[str] = None,
+        end: Optional[str] = None,
+    ) -> Iterable[Tuple[str, str, str, int, int]]:
+        series = self._counts.get(scope, {}).get(period, {})
+        keys = [key] if key is not None else list(series)
+        for k in keys:
+            for bucket, slots in series.get(k, {}).items():
+                if (start and bucket < start) or (end and bucket > end):
+                    continue
+                for slot, (present, total) in slots.items():
+                    yield k, bucket, slot, present, total
@@ -0,0 +1,972 @@
+import copy
+import os
+import secrets
+import threading
+from decimal import Decimal
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+from sqlalchemy import case, func, inspect, select, update
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import IntegrityError, OperationalError
+from sqlalchemy.orm import InstrumentedAttribute, sessionmaker
+
+from attendancestore import AttendanceColumns
+from database import Attendance, AttendanceRollup, Base, CollectionVersion, Fee, FeeLedgerTotal, Installment, School, Student, TENANT_MODELS, User, create_db_engine
+from indexes import build_indexes, Records, TenantIndex
+from journal import Journal, create_journal_options, open_journaled
+from ledger import FeeLedger, LedgerKey, ledger_deltas, merge_ledger, money
+from reports import AttendanceRollups, RollupKey, merge_deltas, rollup_deltas
+
+DEFAULT_TIME_SLOTS = ["morning", "afternoon", "evening"]
+
+ChangeListener = Callable[[str, str, str, List[Dict[str, Any]]], None]
+
+
+def notify_changes(changed: ChangeListener, tenant_id: str, results: List[Tuple[str, Dict[str, Any]]]):
+    """Report upsert_attendance results as one created and one updated batch"""
+    for op in ("created", "updated"):
+        changed(tenant_id, "attendance", op, [record for result, record in results if result == op])
+
+
+def merge_attendance(current: Dict[str, Any], changes: Dict[str, Any]) -> Dict[str, Any]:
+    """Apply submitted fields to an existing attendance record, keeping earlier slot images"""
+    merged = {**current, **{k: v for k, v in changes.items() if k != "captured_images"}}
+    if "captured_images" in changes:
+        merged["captured_images"] = {**(current.get("captured_images") or {}), **changes["captured_images"]}
+    return merged
+
+
+class MemoryRepository:
+    """Tenant store backed by the in-process mock_data dict"""
+
+    def __init__(self, data: Dict[str, Any]):
+        self.data = data
+        # Set by journal.open_journaled once replay is done; mutations are then logged
+        self.journal: Optional[Journal] = None
+        # Called as (tenant_id, collection, "created"|"updated", records) after each write, e.g. by the change feed
+        self.on_change: Optional[ChangeListener] = None
+        self._lock = threading.RLock()
+        # Counters restart with the process, so ETags built from them also carry this epoch
+        self.version_epoch = secrets.token_hex(8)
+        self._versions: Dict[Tuple[str, str], int] = {}
+        loaded_attendance: Dict[str, List[Dict[str, Any]]] = {}
+        for tenant_id, tenant in data["tenants"].items():
+            for collection in TENANT_MODELS:
+                tenant.setdefault(collection, [])
+            # Attendance is kept in columns; the loaded dicts are only read once more, for the rollups
+            loaded_attendance[tenant_id] = tenant["attendance"]
+            tenant["attendance"] = AttendanceColumns(tenant_id, loaded_attendance[tenant_id])
+        self._schools_by_domain = {s["domain"]: s for s in data["schools"]}
+        self._schools_by_id = {s["id"]: s for s in data["schools"]}
+        self.indexes: Dict[str, TenantIndex] = build_indexes(data["tenants"])
+        self.rollups: Dict[str, AttendanceRollups] = {}
+        for tenant_id, tenant in data["tenants"].items():
+            self.rollups[tenant_id] = AttendanceRollups()
+            # Summed first and applied once: far fewer counter updates on a cold start
+            slots = self.time_slots(tenant_id)
+            deltas: Dict[RollupKey, List[int]] = {}
+            for record in loaded_attendance.pop(tenant_id):
+                merge_deltas(deltas, rollup_deltas(record, self._student(tenant_id, record["student_id"]), slots, 1))
+            self.rollups[tenant_id].apply(deltas)
+        self.ledgers: Dict[str, FeeLedger] = {}
+        for tenant_id, tenant in data["tenants"].items():
+            self.ledgers[tenant_id] = FeeLedger()
+            self.ledgers[tenant_id].load(tenant.get("fees", []))
+
+    def list_schools(self) -> List[Dict[str, Any]]:
+        return self.data["schools"]
+
+    def get_school(self, domain: str) -> Optional[Dict[str, Any]]:
+        return self._schools_by_domain.get(domain)
+
+    def add_school(self, school: Dict[str, Any], users: Sequence[Dict[str, Any]] = ()) -> Dict[str, Any]:
+        """Add a school together with its first logins"""
+        with self._lock:
+            if school["domain"] in self._schools_by_domain or school["id"] in self._schools_by_id:
+                raise ValueError("School already exists")
+            self.data["schools"].append(school)
+            self._schools_by_domain[school["domain"]] = school
+            self._schools_by_id[school["id"]] = school
+            tenant: Dict[str, Records] = {collection: [] for collection in TENANT_MODELS}
+            tenant["attendance"] = AttendanceColumns(school["id"])
+            tenant["users"] = list(users)
+            self.data["tenants"][school["id"]] = tenant
+            self.indexes[school["id"]] = TenantIndex(tenant)
+            self.rollups[school["id"]] = AttendanceRollups()
+            self.ledgers[school["id"]] = FeeLedger()
+            if users:
+                self._bump(school["id"], "users")
+            # One entry, so a replay never finds the school without its users
+            self._log({"op": "add_school", "record": school, "users": list(users)})
+        return school
+
+    def find_user(self, tenant_id: str, email: str) -> Optional[Dict[str, Any]]:
+        """A login by email, compared case-insensitively"""
+        email = email.lower()
+        tenant = self.data["tenants"].get(tenant_id, {})
+        return next((user for user in tenant.get("users", []) if user["email"].lower() == email), None)
+
+    def _log(self, entry: Dict[str, Any]):
+        if self.journal is not None:
+            self.journal.append(entry)
+
+    def _changed(self, tenant_id: str, collection: str, op: str, records: List[Dict[str, Any]]):
+        if self.on_change is not None and records:
+            self.on_change(tenant_id, collection, op, records)
+
+    def _journal_seq(self) -> int:
+        """Seq of the last journaled mutation; 0 for a store that is not journaled"""
+        return self.journal.seq if self.journal is not None else 0
+
+    def snapshot_schools(self) -> Tuple[int, List[Dict[str, Any]]]:
+        """(journal seq, schools) as of one instant, for journal snapshots"""
+        with self._lock:
+            return self._journal_seq(), list(self.data["schools"])
+
+    def snapshot_tenant(self, tenant_id: str) -> Tuple[int, Dict[str, List[Dict[str, Any]]]]:
+        """(journal seq, shallow copy of the tenant lists); records are replaced on update, never mutated"""
+        with self._lock:
+            tenant = self.data["tenants"][tenant_id]
+            # copy() of AttendanceColumns copies arrays; its dicts are built later, outside the lock
+            return self._journal_seq(), {collection: records.copy() for collection, records in tenant.items()}
+
+    def close(self):
+        if self.journal is not None:
+            self.journal.close()
+
+    def list(
+        self,
+        tenant_id: str,
+        collection: str,
+        student_id: Optional[str] = None,
+        date: Optional[str] = None,
+        class_name: Optional[str] = None,
+        section: Optional[str] = None,
+    ) -> List[Dict[str, Any]]:
+        return self.indexes[tenant_id].select(
+            collection, student_id=student_id, date=date, class_name=class_name, section=section
+        )
+
+    def page(
+        self,
+        tenant_id: str,
+        collection: str,
+        after: Optional[int] = None,
+        limit: int = 100,
+        **filters: Optional[str],
+    ) -> Tuple[List[Dict[str, Any]], Optional[int]]:
+        """One page in insertion order; the returned key resumes after the last record"""
+        return self.indexes[tenant_id].page(collection, after=after, limit=limit, **filters)
+
+    def count(self, tenant_id: str, collection: str) -> int:
+        return len(self.data["tenants"][tenant_id][collection])
+
+    def versions(self, tenant_id: str, collections: Iterable[str]) -> Tuple[int, ...]:
+        """Write counters of the given collections; any add or update bumps its collection's counter"""
+        return tuple(self._versions.get((tenant_id, c), 0) for c in collections)
+
+    def _bump(self, tenant_id: str, collection: str):
+        key = (tenant_id, collection)
+        self._versions[key] = self._versions.get(key, 0) + 1
+
+    def time_slots(self, tenant_id: str) -> List[str]:
+        school = self._schools_by_id.get(tenant_id)
+        return (school or {}).get("settings", {}).get("time_slots", DEFAULT_TIME_SLOTS)
+
+    def _student(self, tenant_id: str, student_id: str) -> Optional[Dict[str, Any]]:
+        position = self.indexes[tenant_id].position("students", student_id)
+        return None if position is None else self.data["tenants"][tenant_id]["students"][position]
+
+    def _track_attendance(self, tenant_id: str, before: Optional[Dict[str, Any]], after: Optional[Dict[str, Any]]):
+        """Move one attendance record's contribution in the rollups from `before` to `after`"""
+        slots = self.time_slots(tenant_id)
+        deltas: Dict[RollupKey, List[int]] = {}
+        for record, sign in ((before, -1), (after, 1)):
+            if record:
+                merge_deltas(deltas, rollup_deltas(record, self._student(tenant_id, record["student_id"]), slots, sign))
+        self.rollups[tenant_id].apply(deltas)
+
+    def attendance_rollups(
+        self,
+        tenant_id: str,
+        scope: str,
+        period: str,
+        key: Optional[str] = None,
+        start: Optional[str] = None,
+        end: Optional[str] = None,
+    ) -> List[Tuple[str, str, str, int, int]]:
+        """(scope_key, bucket, slot, present, total) rows of the precomputed attendance counters"""
+        # Writers add buckets and keys to these dicts under the lock; iterating them without it can fail
+        with self._lock:
+            return list(self.rollups[tenant_id].rows(scope, period, key=key, start=start, end=end))
+
+    def attendance_presence(
+        self,
+        tenant_id: str,
+        start: Optional[str] = None,
+        end: Optional[str] = None,
+        student_ids: Optional[Iterable[str]] = None,
+    ) -> Dict[str, Tuple[int, int]]:
+        """(present, total) per time slot over the records in [start, end] of these students (all when None)"""
+        with self._lock:
+            frame = self.data["tenants"][tenant_id]["attendance"].frame()
+        return frame.presence(frame.select(start, end, student_ids), self.time_slots(tenant_id))
+
+    def attendance_grid(
+        self,
+        tenant_id: str,
+        student_ids: List[str],
+        start: Optional[str] = None,
+        end: Optional[str] = None,
+    ) -> Tuple[List[str], np.ndarray]:
+        """Dates and a students × dates matrix of slot masks (time_slots bit order), -1 where unmarked"""
+        with self._lock:
+            frame = self.data["tenants"][tenant_id]["attendance"].frame()
+        return frame.grid(frame.select(start, end, student_ids), student_ids, self.time_slots(tenant_id))
+
+    def fee_totals(self, tenant_id: str, scope: str, key: Optional[str] = None) -> List[Tuple[str, Decimal, Decimal]]:
+        """(scope_key, billed, paid) running fee totals per student or academic year"""
+        with self._lock:
+            return list(self.ledgers[tenant_id].rows(scope, key=key))
+
+    def fee_dues(
+        self,
+        tenant_id: str,
+        start: Optional[str] = None,
+        end: Optional[str] = None,
+        student_id: Optional[str] = None,
+        limit: int = 100,
+    ) -> List[Dict[str, Any]]:
+        """Pending installments due in [start, end], earliest first"""
+        with self._lock:
+            return self.ledgers[tenant_id].dues(start=start, end=end, student_id=student_id, limit=limit)
+
+    def existing_ids(self, tenant_id: str, collection: str, ids: Iterable[str]) -> Set[str]:
+        index = self.indexes[tenant_id]
+        return {i for i in ids if index.position(collection, i) is not None}
+
+    def roster(self, tenant_id: str, class_name: str, section: str) -> Set[str]:
+        return set(self.indexes[tenant_id].roster(class_name, section))
+
+    def get(self, tenant_id: str, collection: str, record_id: str) -> Optional[Dict[str, Any]]:
+        """Return a detached copy of one record; persist changes with update()"""
+        position = self.indexes[tenant_id].position(collection, record_id)
+        if position is None:
+            return None
+        return copy.deepcopy(self.data["tenants"][tenant_id][collection][position])
+
+    def add(self, tenant_id: str, collection: str, record: Dict[str, Any]) -> Dict[str, Any]:
+        with self._lock:
+            self._add(tenant_id, collection, record)
+            self._bump(tenant_id, collection)
+        self._changed(tenant_id, collection, "created", [record])
+        return record
+
+    def _add(self, tenant_id: str, collection: str, record: Dict[str, Any]):
+        with self._lock:
+            # Derived totals first: a record they reject must not be left half-stored
+            if collection == "attendance":
+                self._track_attendance(tenant_id, None, record)
+            elif collection == "fees":
+                self.ledgers[tenant_id].track(None, record)
+            self.data["tenants"][tenant_id][collection].append(record)
+            self.indexes[tenant_id].add(collection, record)
+            self._log({"op": "add", "tenant": tenant_id, "collection": collection, "record": record})
+
+    def add_many(self, tenant_id: str, collection: str, records: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        # One counter bump per batch, not per record
+        with self._lock:
+            for record in records:
+                self._add(tenant_id, collection, record)
+            if records:
+                self._bump(tenant_id, collection)
+        self._changed(tenant_id, collection, "created", records)
+        return records
+
+    def update(self, tenant_id: str, collection: str, record_id: str, record: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            if self._update(tenant_id, collection, record_id, record) is None:
+                return None
+            self._bump(tenant_id, collection)
+        self._changed(tenant_id, collection, "updated", [record])
+        return record
+
+    def mutate(self, tenant_id: str, collection: str, record_id: str,
+               change: Callable[[Dict[str, Any]], Any]) -> Optional[Dict[str, Any]]:
+        """Read, change and write back one record as a single step; None if it does not exist.
+
+        `change` edits the record in place; an exception from it leaves the record untouched.
+        """
+        with self._lock:
+            record = self.get(tenant_id, collection, record_id)
+            if record is None:
+                return None
+            change(record)
+            self._update(tenant_id, collection, record_id, record)
+            self._bump(tenant_id, collection)
+        self._changed(tenant_id, collection, "updated", [record])
+        return record
+
+    def update_many(self, tenant_id: str, collection: str, records: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Replace existing records by id in one batch; returns those found"""
+        with self._lock:
+            updated = [record for record in records if self._update(tenant_id, collection, record["id"], record) is not None]
+            if updated:
+                self._bump(tenant_id, collection)
+        self._changed(tenant_id, collection, "updated", updated)
+        return updated
+
+    def _update(self, tenant_id: str, collection: str, record_id: str, record: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            index = self.indexes[tenant_id]
+            position = index.position(collection, record_id)
+            if position is None:
+                return None
+            records = self.data["tenants"][tenant_id][collection]
+            before = records[position]
+            if collection == "attendance":
+                self._track_attendance(tenant_id, before, record)
+            elif collection == "fees":
+                self.ledgers[tenant_id].track(before, record)
+            records[position] = record
+            index.update(collection, position, before)
+            self._log({"op": "update", "tenant": tenant_id, "collection": collection, "id": record_id, "record": record})
+        return record
+
+    def upsert_attendance(
+        self,
+        tenant_id: str,
+        rows: List[Dict[str, Any]],
+        create: Callable[[Dict[str, Any]], Dict[str, Any]],
+    ) -> List[Tuple[str, Dict[str, Any]]]:
+        """Insert or merge attendance keyed by (student_id, date); `create` builds new records"""
+        index = self.indexes[tenant_id]
+        results = []
+        with self._lock:
+            for changes in rows:
+                existing = index.select("attendance", student_id=changes["student_id"], date=changes["date"])
+                if existing:
+                    record = merge_attendance(existing[-1], changes)
+                    self._update(tenant_id, "attendance", record["id"], record)
+                    results.append(("updated", record))
+                else:
+                    record = create(changes)
+                    self._add(tenant_id, "attendance", record)
+                    results.append(("created", record))
+            if rows:
+                self._bump(tenant_id, "attendance")
+        notify_changes(self._changed, tenant_id, results)
+        return results
+
+
+class SQLRepository:
+    """Tenant store backed by a SQLAlchemy database"""
+
+    # Versions live in the database, so every worker derives the same ETags
+    version_epoch = ""
+
+    def __init__(self, engine=None):
+        self.engine = engine or create_db_engine()
+        self.Session = sessionmaker(self.engine, expire_on_commit=False)
+        self._time_slots: Dict[str, List[str]] = {}
+        # Called after each committed write, see MemoryRepository.on_change
+        self.on_change: Optional[ChangeListener] = None
+
+    def close(self):
+        self.engine.dispose()
+
+    def _changed(self, tenant_id: str, collection: str, op: str, records: List[Dict[str, Any]]):
+        if self.on_change is not None and records:
+            self.on_change(tenant_id, collection, op, records)
+
+    def init_schema(self, seed: Optional[Dict[str, Any]] = None):
+        """Create missing tables and load `seed` into an empty database"""
+        existing_tables = set(inspect(self.engine).get_table_names())
+        try:
+            Base.metadata.create_all(self.engine)
+        except OperationalError:
+            # Another worker created the tables between our check and create
+            Base.metadata.create_all(self.engine)
+
+        if not seed:
+            return
+        try:
+            with self.Session.begin() as session:
+                if session.scalar(select(School.seq).limit(1)) is not None:
+                    self._seed_new_tables(session, seed, existing_tables)
+                    return
+                for school in seed["schools"]:
+                    session.add(School.from_dict(school))
+                session.flush()
+                for tenant_id, tenant in seed["tenants"].items():
+                    for collection, records in tenant.items():
+                        model = TENANT_MODELS[collection]
+                        session.add_all(model.from_dict(r, school_id=tenant_id) for r in records)
+        except IntegrityError:
+            # Another worker seeded first
+            pass
+        self.rebuild_rollups(only_if_empty=True)
+        self.rebuild_ledger(only_if_empty=True)
+
+    @staticmethod
+    def _seed_new_tables(session, seed: Dict[str, Any], existing_tables: Set[str]):
+        """Fill tables added since the database was first seeded, e.g. users"""
+        schools = set(session.scalars(select(School.id)))
+        for collection, model in TENANT_MODELS.items():
+            if model.__tablename__ in existing_tables:
+                continue
+            for tenant_id, tenant in seed["tenants"].items():
+                if tenant_id in schools:
+                    session.add_all(model.from_dict(r, school_id=tenant_id) for r in tenant.get(collection, []))
+
+    def rebuild_rollups(self, only_if_empty: bool = False):
+        """Recompute the attendance rollup table from the attendance history"""
+        with self.Session.begin() as session:
+            if only_if_empty and session.scalar(select(AttendanceRollup.seq).limit(1)) is not None:
+                return
+            session.query(AttendanceRollup).delete()
+            for (tenant_id,) in session.execute(select(School.id)):
+                deltas: Dict[RollupKey, List[int]] = {}
+                students = {s.id: s.to_dict() for s in session.scalars(select(Student).where(Student.school_id == tenant_id))}
+                slots = self.time_slots(tenant_id, session)
+                rows = session.scalars(select(Attendance).where(Attendance.school_id == tenant_id).execution_options(yield_per=1000))
+                for row in rows:
+                    record = row.to_dict()
+                    merge_deltas(deltas, rollup_deltas(record, students.get(record["student_id"]), slots, 1))
+                self._apply_rollups(session, tenant_id, deltas)
+
+    def rebuild_ledger(self, only_if_empty: bool = False):
+        """Recompute the fee ledger totals from the fee records"""
+        with self.Session.begin() as session:
+            if only_if_empty and session.scalar(select(FeeLedgerTotal.seq).limit(1)) is not None:
+                return
+            session.query(FeeLedgerTotal).delete()
+            for (tenant_id,) in session.execute(select(School.id)):
+                deltas: Dict[LedgerKey, List[Decimal]] = {}
+                for row in session.scalars(select(Fee).where(Fee.school_id == tenant_id).execution_options(yield_per=1000)):
+                    merge_ledger(deltas, ledger_deltas(row.to_dict(), 1))
+                self._apply_ledger(session, tenant_id, deltas)
+
+    def list_schools(self) -> List[Dict[str, Any]]:
+        with self.Session() as session:
+            return [s.to_dict() for s in session.scalars(select(School).order_by(School.seq))]
+
+    def get_school(self, domain: str) -> Optional[Dict[str, Any]]:
+        with self.Session() as session:
+            school = session.scalar(select(School).where(School.domain == domain))
+            return school.to_dict() if school else None
+
+    def add_school(self, school: Dict[str, Any], users: Sequence[Dict[str, Any]] = ()) -> Dict[str, Any]:
+        """Add a school together with its first logins, in one transaction"""
+        try:
+            with self.Session.begin() as session:
+                session.add(School.from_dict(school))
+                # Users reference the school row; write it first
+                session.flush()
+                session.add_all([User.from_dict(user, school_id=school["id"]) for user in users])
+                if users:
+                    self._bump(session, school["id"], "users")
+        except IntegrityError:
+            raise ValueError("School already exists")
+        return school
+
+    def find_user(self, tenant_id: str, email: str) -> Optional[Dict[str, Any]]:
+        """A login by email, compared case-insensitively"""
+        with self.Session() as session:
+            user = session.scalar(select(User).where(User.school_id == tenant_id, func.lower(User.email) == email.lower()))
+            return user.to_dict() if user else None
+
+    def _select(
+        self,
+        tenant_id: str,
+        collection: str,
+        student_id: Optional[str] = None,
+        date: Optional[str] = None,
+        class_name: Optional[str] = None,
+        section: Optional[str] = None,
+    ):
+        model = TENANT_MODELS[collection]
+        stmt = select(model).where(model.school_id == tenant_id)
+        if student_id:
+            stmt = stmt.where(model.student_id == student_id)
+        if class_name and section:
+            roster = select(Student.id).where(
+                Student.school_id == tenant_id,
+                Student.class_name == class_name,
+                Student.section == section,
+            )
+            stmt = stmt.where(model.student_id.in_(roster))
+        if date:
+            stmt = stmt.where(model.date == date)
+        return stmt.order_by(model.seq)
+
+    def list(self, tenant_id: str, collection: str, **filters: Optional[str]) -> List[Dict[str, Any]]:
+        with self.Session() as session:
+            return [r.to_dict() for r in session.scalars(self._select(tenant_id, collection, **filters))]
+
+    def page(
+        self,
+        tenant_id: str,
+        collection: str,
+        after: Optional[int] = None,
+        limit: int = 100,
+        **filters: Optional[str],
+    ) -> Tuple[List[Dict[str, Any]], Optional[int]]:
+        """One page in insertion (seq) order; the returned key resumes after the last record"""
+        model = TENANT_MODELS[collection]
+        stmt = self._select(tenant_id, collection, **filters)
+        if after is not None:
+            stmt = stmt.where(model.seq > after)
+        with self.Session() as session:
+            rows = list(session.scalars(stmt.limit(limit + 1)))
+        next_after = rows[limit - 1].seq if len(rows) > limit else None
+        return [r.to_dict() for r in rows[:limit]], next_after
+
+    def count(self, tenant_id: str, collection: str) -> int:
+        model = TENANT_MODELS[collection]
+        with self.Session() as session:
+            return session.scalar(select(func.count()).select_from(model).where(model.school_id == tenant_id)) or 0
+
+    def versions(self, tenant_id: str, collections: Iterable[str]) -> Tuple[int, ...]:
+        """Write counters of the given collections; any add or update bumps its collection's counter"""
+        collections = list(collections)
+        with self.Session() as session:
+            found = {collection: version for collection, version in session.execute(
+                select(CollectionVersion.collection, CollectionVersion.version).where(
+                    CollectionVersion.school_id == tenant_id,
+                    CollectionVersion.collection.in_(collections),
+                )
+            )}
+        return tuple(found.get(c, 0) for c in collections)
+
+    def _bump(self, session, tenant_id: str, collection: str):
+        """Increment a collection's write counter inside the caller's transaction.
+
+        Every write to the collection updates this one row, so callers bump once
+        per transaction and as its last statement, holding the row lock briefly.
+        """
+        dialect = self.engine.dialect.name
+        if dialect in ("sqlite", "postgresql"):
+            insert = sqlite_insert if dialect == "sqlite" else postgresql_insert
+            stmt = insert(CollectionVersion).values(school_id=tenant_id, collection=collection, version=1)
+            session.execute(stmt.on_conflict_do_update(
+                index_elements=["school_id", "collection"],
+                set_={"version": CollectionVersion.version + 1},
+            ))
+            return
+        existing = session.scalar(select(CollectionVersion).filter_by(
+            school_id=tenant_id, collection=collection
+        ).with_for_update())
+        if existing is None:
+            session.add(CollectionVersion(school_id=tenant_id, collection=collection, version=1))
+        else:
+            existing.version += 1
+
+    def time_slots(self, tenant_id: str, session=None) -> List[str]:
+        if tenant_id not in self._time_slots:
+            query = select(School.settings).where(School.id == tenant_id)
+            if session is None:
+                with self.Session() as session:
+                    settings = session.scalar(query)
+            else:
+                settings = session.scalar(query)
+            self._time_slots[tenant_id] = (settings or {}).get("time_slots", DEFAULT_TIME_SLOTS)
+        return self._time_slots[tenant_id]
+
+    def _attendance_deltas(
+        self,
+        session,
+        tenant_id: str,
+        before: Optional[Dict[str, Any]],
+        after: Optional[Dict[str, Any]],
+        students: Optional[Dict[str, Any]] = None,
+    ) -> Dict[RollupKey, List[int]]:
+        """Rollup changes for replacing `before` with `after`; `students` caches student rows by id"""
+        slots = self.time_slots(tenant_id, session)
+        deltas: Dict[RollupKey, List[int]] = {}
+        for record, sign in ((before, -1), (after, 1)):
+            if not record:
+                continue
+            student_id = record["student_id"]
+            if students is not None and student_id in students:
+                student = students[student_id]
+            else:
+                row = self._find(session, tenant_id, "students", student_id)
+                student = row.to_dict() if row else None
+            merge_deltas(deltas, rollup_deltas(record, student, slots, sign))
+        return deltas
+
+    def _apply_rollups(self, session, tenant_id: str, deltas: Dict[RollupKey, List[int]]):
+        """Add counter deltas to the rollup table inside the caller's transaction"""
+        rows = [
+            {"school_id": tenant_id, "scope": scope, "scope_key": key, "period": period,
+             "bucket": bucket, "slot": slot, "present": present, "total": total}
+            for (scope, key, period, bucket, slot), (present, total) in deltas.items()
+            if present or total
+        ]
+        if not rows:
+            return
+        dialect = self.engine.dialect.name
+        if dialect in ("sqlite", "postgresql"):
+            insert = sqlite_insert if dialect == "sqlite" else postgresql_insert
+            stmt = insert(AttendanceRollup)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=["school_id", "scope", "period", "scope_key", "bucket", "slot"],
+                set_={"present": AttendanceRollup.present + stmt.excluded.present, "total": AttendanceRollup.total + stmt.excluded.total},
+            )
+            session.execute(stmt, rows)
+            return
+        for row in rows:
+            existing = session.scalar(select(AttendanceRollup).filter_by(
+                **{k: row[k] for k in ("school_id", "scope", "period", "scope_key", "bucket", "slot")}
+            ).with_for_update())
+            if existing is None:
+                session.add(AttendanceRollup(**row))
+            else:
+                existing.present += row["present"]
+                existing.total += row["total"]
+
+    def _apply_ledger(self, session, tenant_id: str, deltas: Dict[LedgerKey, List[Decimal]]):
+        """Add fee total deltas to the ledger table inside the caller's transaction"""
+        rows = [
+            {"school_id": tenant_id, "scope": scope, "scope_key": key, "billed": billed, "paid": paid}
+            for (scope, key), (billed, paid) in deltas.items()
+            if billed or paid
+        ]
+        if not rows:
+            return
+        dialect = self.engine.dialect.name
+        if dialect in ("sqlite", "postgresql"):
+            insert = sqlite_insert if dialect == "sqlite" else postgresql_insert
+            stmt = insert(FeeLedgerTotal)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=["school_id", "scope", "scope_key"],
+                set_={"billed": FeeLedgerTotal.billed + stmt.excluded.billed, "paid": FeeLedgerTotal.paid + stmt.excluded.paid},
+            )
+            session.execute(stmt, rows)
+            return
+        for row in rows:
+            existing = session.scalar(select(FeeLedgerTotal).filter_by(
+                **{k: row[k] for k in ("school_id", "scope", "scope_key")}
+            ).with_for_update())
+            if existing is None:
+                session.add(FeeLedgerTotal(**row))
+            else:
+                existing.billed += row["billed"]
+                existing.paid += row["paid"]
+
+    def _fee_deltas(self, before: Optional[Dict[str, Any]], after: Optional[Dict[str, Any]]) -> Dict[LedgerKey, List[Decimal]]:
+        deltas: Dict[LedgerKey, List[Decimal]] = {}
+        merge_ledger(deltas, ledger_deltas(before, -1))
+        merge_ledger(deltas, ledger_deltas(after, 1))
+        return deltas
+
+    def attendance_rollups(
+        self,
+        tenant_id: str,
+        scope: str,
+        period: str,
+        key: Optional[str] = None,
+        start: Optional[str] = None,
+        end: Optional[str] = None,
+    ) -> List[Tuple[str, str, str, int, int]]:
+        """(scope_key, bucket, slot, present, total) rows of the precomputed attendance counters"""
+        stmt = select(
+            AttendanceRollup.scope_key,
+            AttendanceRollup.bucket,
+            AttendanceRollup.slot,
+            AttendanceRollup.present,
+            AttendanceRollup.total,
+        ).where(
+            AttendanceRollup.school_id == tenant_id,
+            AttendanceRollup.scope == scope,
+            AttendanceRollup.period == period,
+        )
+        if key is not None:
+            stmt = stmt.where(AttendanceRollup.scope_key == key)
+        if start:
+            stmt = stmt.where(AttendanceRollup.bucket >= start)
+        if end:
+            stmt = stmt.where(AttendanceRollup.bucket <= end)
+        with self.Session() as session:
+            return [tuple(row) for row in session.execute(stmt)]
+
+    def _attendance_range(self, stmt, tenant_id: str, start: Optional[str], end: Optional[str],
+                          student_ids: Optional[Iterable[str]]):
+        stmt = stmt.where(Attendance.school_id == tenant_id)
+        if start:
+            stmt = stmt.where(Attendance.date >= start)
+        if end:
+            stmt = stmt.where(Attendance.date <= end)
+        if student_ids is not None:
+            stmt = stmt.where(Attendance.student_id.in_(list(student_ids)))
+        return stmt
+
+    def attendance_presence(
+        self,
+        tenant_id: str,
+        start: Optional[str] = None,
+        end: Optional[str] = None,
+        student_ids: Optional[Iterable[str]] = None,
+    ) -> Dict[str, Tuple[int, int]]:
+        """(present, total) per time slot over the records in [start, end] of these students (all when None)"""
+        slots = [slot for slot in self.time_slots(tenant_id) if isinstance(getattr(Attendance, slot, None), InstrumentedAttribute)]
+        counts = {slot: (0, 0) for slot in self.time_slots(tenant_id)}
+        if not slots:
+            return counts
+        columns = []
+        for slot in slots:
+            column = getattr(Attendance, slot)
+            columns += [func.coalesce(func.sum(case((column.is_(True), 1), else_=0)), 0), func.count(column)]
+        stmt = self._attendance_range(select(*columns), tenant_id, start, end, student_ids)
+        with self.Session() as session:
+            row = session.execute(stmt).one()
+        for number, slot in enumerate(slots):
+            counts[slot] = (int(row[2 * number]), int(row[2 * number + 1]))
+        return counts
+
+    def attendance_grid(
+        self,
+        tenant_id: str,
+        student_ids: List[str],
+        start: Optional[str] = None,
+        end: Optional[str] = None,
+    ) -> Tuple[List[str], np.ndarray]:
+        """Dates and a students × dates matrix of slot masks (time_slots bit order), -1 where unmarked"""
+        slots = self.time_slots(tenant_id)
+        stmt = self._attendance_range(select(Attendance), tenant_id, start, end, student_ids).order_by(Attendance.seq)
+        with self.Session() as session:
+            records = [row.to_dict() for row in session.scalars(stmt)]
+        dates = sorted({record["date"] for record in records})
+        row_of = {student_id: row for row, student_id in enumerate(student_ids)}
+        column_of = {day: column for column, day in enumerate(dates)}
+        grid = np.full((len(student_ids), len(dates)), -1, dtype=np.int16)
+        for record in records:
+            grid[row_of[record["student_id"]], column_of[record["date"]]] = sum(
+                1 << bit for bit, slot in enumerate(slots) if record.get(slot)
+            )
+        return dates, grid
+
+    def fee_totals(self, tenant_id: str, scope: str, key: Optional[str] = None) -> List[Tuple[str, Decimal, Decimal]]:
+        """(scope_key, billed, paid) running fee totals per student or academic year"""
+        stmt = select(FeeLedgerTotal.scope_key, FeeLedgerTotal.billed, FeeLedgerTotal.paid).where(
+            FeeLedgerTotal.school_id == tenant_id,
+            FeeLedgerTotal.scope == scope,
+        )
+        if key is not None:
+            stmt = stmt.where(FeeLedgerTotal.scope_key == key)
+        with self.Session() as session:
+            return [(k, money(billed), money(paid)) for k, billed, paid in session.execute(stmt)]
+
+    def fee_dues(
+        self,
+        tenant_id: str,
+        start: Optional[str] = None,
+        end: Optional[str] = None,
+        student_id: Optional[str] = None,
+        limit: int = 100,
+    ) -> List[Dict[str, Any]]:
+        """Pending installments due in [start, end], earliest first (served by ix_installments_due)"""
+        stmt = select(
+            Installment.fee_id, Installment.id, Fee.student_id, Fee.academic_year, Installment.amount, Installment.due_date
+        ).join(Fee, (Fee.school_id == Installment.school_id) & (Fee.id == Installment.fee_id)).where(
+            Installment.school_id == tenant_id,
+            Installment.status == "pending",
+            Installment.due_date.is_not(None),
+        )
+        if start:
+            stmt = stmt.where(Installment.due_date >= start)
+        if end:
+            stmt = stmt.where(Installment.due_date <= end)
+        if student_id is not None:
+            stmt = stmt.where(Fee.student_id == student_id)
+        stmt = stmt.order_by(Installment.due_date, Installment.fee_id, Installment.id).limit(limit)
+        fields = ("fee_id", "installment_id", "student_id", "academic_year", "amount", "due_date")
+        with self.Session() as session:
+            return [dict(zip(fields, row)) for row in session.execute(stmt)]
+
+    def existing_ids(self, tenant_id: str, collection: str, ids: Iterable[str]) -> Set[str]:
+        model = TENANT_MODELS[collection]
+        ids = set(ids)
+        if not ids:
+            return set()
+        with self.Session() as session:
+            return set(session.scalars(select(model.id).where(model.school_id == tenant_id, model.id.in_(ids))))
+
+    def roster(self, tenant_id: str, class_name: str, section: str) -> Set[str]:
+        with self.Session() as session:
+            return set(session.scalars(select(Student.id).where(
+                Student.school_id == tenant_id,
+                Student.class_name == class_name,
+                Student.section == section,
+            )))
+
+    def _find(self, session, tenant_id: str, collection: str, record_id: str):
+        model = TENANT_MODELS[collection]
+        return session.scalar(select(model).where(model.school_id == tenant_id, model.id == record_id))
+
+    def get(self, tenant_id: str, collection: str, record_id: str) -> Optional[Dict[str, Any]]:
+        with self.Session() as session:
+            row = self._find(session, tenant_id, collection, record_id)
+            return row.to_dict() if row else None
+
+    def add(self, tenant_id: str, collection: str, record: Dict[str, Any]) -> Dict[str, Any]:
+        with self.Session.begin() as session:
+            session.add(TENANT_MODELS[collection].from_dict(record, school_id=tenant_id))
+            if collection == "attendance":
+                self._apply_rollups(session, tenant_id, self._attendance_deltas(session, tenant_id, None, record))
+            elif collection == "fees":
+                self._apply_ledger(session, tenant_id, self._fee_deltas(None, record))
+            self._bump(session, tenant_id, collection)
+        self._changed(tenant_id, collection, "created", [record])
+        return record
+
+    def add_many(self, tenant_id: str, collection: str, records: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Insert a batch of records in one transaction"""
+        model = TENANT_MODELS[collection]
+        with self.Session.begin() as session:
+            session.add_all([model.from_dict(record, school_id=tenant_id) for record in records])
+            if collection == "attendance":
+                deltas: Dict[RollupKey, List[int]] = {}
+                for record in records:
+                    merge_deltas(deltas, self._attendance_deltas(session, tenant_id, None, record))
+                self._apply_rollups(session, tenant_id, deltas)
+            elif collection == "fees":
+                fee_deltas: Dict[LedgerKey, List[Decimal]] = {}
+                for record in records:
+                    merge_ledger(fee_deltas, ledger_deltas(record, 1))
+                self._apply_ledger(session, tenant_id, fee_deltas)
+            if records:
+                self._bump(session, tenant_id, collection)
+        self._changed(tenant_id, collection, "created", records)
+        return records
+
+    def update(self, tenant_id: str, collection: str, record_id: str, record: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        with self.Session.begin() as session:
+            row = self._find(session, tenant_id, collection, record_id)
+            if row is None:
+                return None
+            self._update_row(session, tenant_id, collection, row, record)
+            self._bump(session, tenant_id, collection)
+        self._changed(tenant_id, collection, "updated", [record])
+        return record
+
+    def mutate(self, tenant_id: str, collection: str, record_id: str,
+               change: Callable[[Dict[str, Any]], Any]) -> Optional[Dict[str, Any]]:
+        """Read, change and write back one record in one transaction, with the row locked throughout"""
+        model = TENANT_MODELS[collection]
+        with self.Session.begin() as session:
+            if self.engine.dialect.name == "sqlite":
+                # SQLite ignores FOR UPDATE; a no-op write takes its database write lock before the read instead
+                session.execute(
+                    update(model).where(model.school_id == tenant_id, model.id == record_id).values(seq=model.seq)
+                )
+                row = self._find(session, tenant_id, collection, record_id)
+            else:
+                row = session.scalar(select(model).where(
+                    model.school_id == tenant_id, model.id == record_id
+                ).with_for_update())
+            if row is None:
+                return None
+            record = row.to_dict()
+            change(record)
+            self._update_row(session, tenant_id, collection, row, record)
+            self._bump(session, tenant_id, collection)
+        self._changed(tenant_id, collection, "updated", [record])
+        return record
+
+    def update_many(self, tenant_id: str, collection: str, records: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Replace existing records by id in one transaction; returns those found"""
+        updated = []
+        with self.Session.begin() as session:
+            for record in records:
+                row = self._find(session, tenant_id, collection, record["id"])
+                if row is not None:
+                    self._update_row(session, tenant_id, collection, row, record)
+                    updated.append(record)
+            if updated:
+                self._bump(session, tenant_id, collection)
+        self._changed(tenant_id, collection, "updated", updated)
+        return updated
+
+    def _update_row(self, session, tenant_id: str, collection: str, row, record: Dict[str, Any]):
+        if collection == "attendance":
+            self._apply_rollups(session, tenant_id, self._attendance_deltas(session, tenant_id, row.to_dict(), record))
+        elif collection == "fees":
+            self._apply_ledger(session, tenant_id, self._fee_deltas(row.to_dict(), record))
+        self._assign(row, record)
+
+    @staticmethod
+    def _assign(row, record: Dict[str, Any]):
+        """Overwrite a loaded row with the values of `record`"""
+        replacement = type(row).from_dict(record, school_id=row.school_id)
+        for attr in list(row.fields().values()) + ["extra"]:
+            setattr(row, attr, getattr(replacement, attr))
+        if "installments" in record:
+            row.installments = replacement.installments
+
+    def upsert_attendance(
+        self,
+        tenant_id: str,
+        rows: List[Dict[str, Any]],
+        create: Callable[[Dict[str, Any]], Dict[str, Any]],
+    ) -> List[Tuple[str, Dict[str, Any]]]:
+        """Insert or merge attendance keyed by (student_id, date) in a single transaction"""
+        results = []
+        deltas: Dict[RollupKey, List[int]] = {}
+        with self.Session.begin() as session:
+            existing: Dict[Tuple[str, str], Any] = {}
+            students: Dict[str, Any] = {}
+            if rows:
+                student_ids = {r["student_id"] for r in rows}
+                students = dict.fromkeys(student_ids)
+                for student in session.scalars(select(Student).where(
+                    Student.school_id == tenant_id, Student.id.in_(student_ids)
+                )):
+                    students[student.id] = student.to_dict()
+                stmt = select(Attendance).where(
+                    Attendance.school_id == tenant_id,
+                    Attendance.student_id.in_({r["student_id"] for r in rows}),
+                    Attendance.date.in_({r["date"] for r in rows}),
+                ).order_by(Attendance.seq)
+                for row in session.scalars(stmt):
+                    existing[(row.student_id, row.date)] = row
+
+            for changes in rows:
+                key = (changes["student_id"], changes["date"])
+                row = existing.get(key)
+                if row is None:
+                    before = None
+                    record = create(changes)
+                    existing[key] = Attendance.from_dict(record, school_id=tenant_id)
+                    session.add(existing[key])
+                    results.append(("created", record))
+                else:
+                    before = row.to_dict()
+                    record = merge_attendance(before, changes)
+                    self._assign(row, record)
+                    results.append(("updated", record))
+                merge_deltas(deltas, self._attendance_deltas(session, tenant_id, before, record, students))
+            self._apply_rollups(session, tenant_id, deltas)
+            if rows:
+                self._bump(session, tenant_id, "attendance")
+        notify_changes(self._changed, tenant_id, results)
+        return results
+
+
+def create_repository(seed: Dict[str, Any]):
+    """Build the configured store; `seed` is loaded into an empty store"""
+    # "memory" keeps everything in the process (demo / single worker), "sql" persists
+    # through SQLAlchemy so every gunicorn worker sees the same data
+    backend = os.getenv("STORAGE_BACKEND", "sql" if os.getenv("DATABASE_URL") else "memory")
+    if backend == "sql":
+        repository = SQLRepository()
+        repository.init_schema(seed)
+        return repository
+    journal_dir = os.getenv("MEMORY_JOURNAL_DIR")
+    if journal_dir:
+        # Durable memory store: snapshot + journal replay at startup, mutations journaled
+        return open_journaled(journal_dir, seed, MemoryRepository, **create_journal_options())
+    return MemoryRepository(seed)
@@ -0,0 +1,130 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+DEFAULT_NEGATIVE_TTL = 30.0
+DEFAULT_NEGATIVE_CACHE_SIZE = 10000
+
+
+class SchoolRegistry:
+    """In-process lookup tables for tenant resolution and login.
+
+    Built once from the repository at startup and updated as schools and users
+    are added. Domains not in the table are looked up in the repository (they may
+    have been created by another worker); misses are remembered for a short TTL so
+    requests for made-up domains do not reach the database.
+    """
+
+    def __init__(self, repo, negative_ttl: float = DEFAULT_NEGATIVE_TTL,
+                 negative_size: int = DEFAULT_NEGATIVE_CACHE_SIZE):
+        self.repo = repo
+        self.negative_ttl = negative_ttl
+        self.negative_size = negative_size
+        self._by_domain: Dict[str, Dict[str, Any]] = {}
+        self._by_id: Dict[str, Dict[str, Any]] = {}
+        self._users: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        self._unknown: "OrderedDict[str, float]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.load()
+
+    def load(self):
+        """(Re)build every table from the repository"""
+        by_domain, by_id, users = {}, {}, {}
+        for school in self.repo.list_schools():
+            by_domain[school["domain"]] = by_id[school["id"]] = school
+            for user in self.repo.list(school["id"], "users"):
+                users[(school["id"], user["email"].lower())] = user
+        with self._lock:
+            self._by_domain, self._by_id, self._users = by_domain, by_id, users
+            self._unknown.clear()
+
+    def _index_school(self, school: Dict[str, Any]):
+        users = {(school["id"], u["email"].lower()): u for u in self.repo.list(school["id"], "users")}
+        with self._lock:
+            self._by_domain[school["domain"]] = self._by_id[school["id"]] = school
+            self._users.update(users)
+            self._unknown.pop(school["domain"], None)
+
+    def _known_unknown(self, domain: str, now: float) -> bool:
+        with self._lock:
+            expires = self._unknown.get(domain)
+            if expires is None:
+                return False
+            if expires > now:
+                return True
+            del self._unknown[domain]
+            return False
+
+    def _remember_unknown(self, domain: str, now: float):
+        with self._lock:
+            self._unknown[domain] = now + self.negative_ttl
+            self._unknown.move_to_end(domain)
+            while len(self._unknown) > self.negative_size:
+                self._unknown.popitem(last=False)
+
+    def resolve(self, domain: str) -> Optional[Dict[str, Any]]:
+        """School for a domain, or None"""
+        school = self._by_domain.get(domain)
+        if school is not None:
+            return school
+        now = time.monotonic()
+        if self._known_unknown(domain, now):
+            return None
+        school = self.repo.get_school(domain)
+        if school is None:
+            self._remember_unknown(domain, now)
+            return None
+        self._index_school(school)
+        return school
+
+    def known(self, domain: str) -> Optional[Dict[str, Any]]:
+        """School for a domain already in this worker's table; never queries the repository"""
+        return self._by_domain.get(domain)
+
+    def school(self, school_id: str) -> Optional[Dict[str, Any]]:
+        return self._by_id.get(school_id)
+
+    def schools(self) -> List[Dict[str, Any]]:
+        return list(self._by_id.values())
+
+    def user(self, school_id: str, email: str) -> Optional[Dict[str, Any]]:
+        """Login by email; misses go to the repository, as the user may have been added by another worker"""
+        key = (school_id, email.lower())
+        user = self._users.get(key)
+        if user is None:
+            user = self.repo.find_user(school_id, email)
+            if user is not None:
+                with self._lock:
+                    self._users[key] = user
+        return user
+
+    def add_school(self, school: Dict[str, Any], users: Sequence[Dict[str, Any]] = ()) -> Dict[str, Any]:
+        """Persist a new school with its first users; raises ValueError if the id or domain is taken"""
+        self.repo.add_school(school, users)
+        self._index_school(school)
+        return school
+
+    def add_user(self, user: Dict[str, Any]) -> Dict[str, Any]:
+        """Persist a new login for an existing school; raises ValueError if the email is taken"""
+        if self.user(user["school_id"], user["email"]) is not None:
+            raise ValueError("A user with this email already exists")
+        self.repo.add(user["school_id"], "users", user)
+        with self._lock:
+            self._users[(user["school_id"], user["email"].lower())] = user
+        return user
+
+    def update_user(self, user: Dict[str, Any]) -> Dict[str, Any]:
+        self.repo.update(user["school_id"], "users", user["id"], user)
+        with self._lock:
+            self._users[(user["school_id"], user["email"].lower())] = user
+        return user
+
+
+def create_school_registry(repo) -> SchoolRegistry:
+    return SchoolRegistry(
+        repo,
+        negative_ttl=float(os.getenv("SCHOOL_NEGATIVE_TTL", str(DEFAULT_NEGATIVE_TTL))),
+        negative_size=int(os.getenv("SCHOOL_NEGATIVE_CACHE_SIZE", str(DEFAULT_NEGATIVE_CACHE_SIZE))),
+    )
@@ -0,0 +1,99 @@
+"""POST /api/attendance/batch: bad rows fail one by one, the rest are written.
+
+Run with `pytest test_attendance_batch.py` from the backend directory.
+"""
+import base64
+import os
+
+import pytest
+from fastapi.testclient import TestClient
+
+from blobstore import BLOB_DIR
+from conftest import BACKENDS
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_batch_reports_errors_per_row(load_main, login, backend):
+    main = load_main(backend)
+    with TestClient(main.app) as client:
+        headers = login(client)
+        response = client.post("/api/attendance/batch", headers=headers, json={
+            "records": [
+                {"student_id": "student1", "date": "2024-01-15", "evening": True},  # merges into att1
+                {"student_id": "student3", "date": "2024-01-16", "morning": True},
+                {"student_id": "student1", "date": "15/01/2024"},
+                {"student_id": "nobody", "date": "2024-01-16"},
+                {"date": "2024-01-16"},
+                {"student_id": "student4", "date": "2024-01-16"},  # another school's student
+            ],
+            # student3 is in 9-B; bit 0 is morning, bit 1 afternoon
+            "bitmap": {"date": "2024-01-17", "class_name": "10", "section": "A",
+                       "marks": {"student1": 1, "student2": 3, "student3": 1}},
+        })
+        assert response.status_code == 200, response.text
+        body = response.json()
+        attendance = client.get("/api/attendance", headers=headers, params={"date": "2024-01-17"}).json()
+        merged = client.get("/api/attendance", headers=headers, params={"student_id": "student1", "date": "2024-01-15"}).json()
+
+    statuses = [(r["index"], r["status"], r.get("error")) for r in body["results"]]
+    assert statuses[:2] == [(0, "updated", None), (1, "created", None)]
+    assert statuses[2][1] == "error" and "does not match format" in statuses[2][2]
+    assert statuses[3] == (3, "error", "Student not found")
+    assert statuses[4][1] == "error" and "student_id" in statuses[4][2]
+    assert statuses[5] == (5, "error", "Student not found")
+    assert statuses[6:] == [(6, "created", None), (7, "created", None), (8, "error", "Student is not in this class")]
+    assert (body["created"], body["updated"], body["failed"]) == (3, 1, 5)
+
+    assert sorted((r["student_id"], r["morning"], r["afternoon"]) for r in attendance) == [
+        ("student1", True, False), ("student2", True, True),
+    ]
+    # Fields the row left out keep their stored values
+    assert [(r["id"], r["morning"], r["afternoon"], r["evening"]) for r in merged] == [("att1", True, True, True)]
+
+
+def test_batch_rejects_unknown_slots_and_oversized_batches(load_main, login):
+    main = load_main()
+    with TestClient(main.app) as client:
+        headers = login(client)
+        unknown = client.post("/api/attendance/batch", headers=headers, json={
+            "bitmap": {"date": "2024-01-17", "time_slots": ["morning", "lunch"], "marks": {"student1": 1}},
+        })
+        rows = [{"student_id": "student1", "date": "2024-01-17"}] * (main.MAX_ATTENDANCE_BATCH + 1)
+        oversized = client.post("/api/attendance/batch", headers=headers, json={"records": rows})
+
+    assert unknown.status_code == 400
+    assert oversized.status_code == 413
+
+
+def capture(payload: bytes) -> str:
+    return "data:image/png;base64," + base64.b64encode(payload).decode()
+
+
+def test_images_are_stored_only_for_written_rows(load_main, login):
+    main = load_main()
+    with TestClient(main.app) as client:
+        response = client.post("/api/attendance/batch", headers=login(client), json={"records": [
+            {"student_id": "student1", "date": "2024-01-18", "captured_images": {"morning": capture(b"kept")}},
+            {"student_id": "nobody", "date": "2024-01-18", "captured_images": {"morning": capture(b"unknown")}},
+            {"student_id": "student4", "date": "2024-01-18", "captured_images": {"morning": capture(b"other school")}},
+            {"student_id": "student2", "date": "2024-01-18", "captured_images": {"morning": "data:image/png;base64,@@"}},
+        ]})
+
+    assert response.status_code == 200, response.text
+    results = response.json()["results"]
+    assert [r["status"] for r in results] == ["created", "error", "error", "error"]
+    assert results[3]["error"] == "Invalid base64 image data"
+    stored = [name for _, _, names in os.walk(BLOB_DIR) for name in names]
+    assert len(stored) == 1
+    assert results[0]["record"]["captured_images"]["morning"].endswith(stored[0])
+
+
+@pytest.mark.parametrize("place", [{"class_name": "10"}, {"section": "A"}])
+def test_bitmap_class_check_needs_class_and_section(load_main, login, place):
+    main = load_main()
+    with TestClient(main.app) as client:
+        response = client.post("/api/attendance/batch", headers=login(client), json={
+            "bitmap": {"date": "2024-01-17", "marks": {"student3": 1}, **place},
+        })
+    assert response.status_code == 400
+    assert main.repo.list("school1", "attendance", date="2024-01-17") == []
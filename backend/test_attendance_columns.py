@@ -0,0 +1,154 @@
+"""AttendanceColumns answers exactly like attendance kept as one dict per record.
+
+The same synthetic school is loaded into the memory store (columns) and the SQL
+store (rows), and both are checked against plain loops over the source records.
+Run with `pytest test_attendance_columns.py` from the backend directory.
+"""
+import copy
+
+import numpy as np
+import pytest
+
+import attendancestore
+from attendancestore import AttendanceColumns
+from benchmarks.synthetic import TIME_SLOTS, generate
+from database import create_db_engine
+from repository import MemoryRepository, SQLRepository
+
+TENANT = "bench1"
+
+
+@pytest.fixture
+def stores(tmp_path):
+    data = generate(schools=1, students=40, days=25, seed=3)
+    records = data["tenants"][TENANT]["attendance"]
+    # Hand-written IDs and extra fields sit next to generated ones, as in the seed data
+    records[0] = dict(records[0], id="att1", note="late bus")
+    memory = MemoryRepository(copy.deepcopy(data))
+    sql = SQLRepository(create_db_engine(f"sqlite:///{tmp_path / 'rows.db'}"))
+    sql.init_schema(copy.deepcopy(data))
+    yield data, memory, sql
+    sql.close()
+
+
+def loop_presence(records, start, end, students):
+    counts = {slot: [0, 0] for slot in TIME_SLOTS}
+    for record in records:
+        if (not start or record["date"] >= start) and (not end or record["date"] <= end) \
+                and (students is None or record["student_id"] in students):
+            for slot in TIME_SLOTS:
+                if slot in record:
+                    counts[slot][1] += 1
+                    counts[slot][0] += record[slot] is True
+    return {slot: tuple(count) for slot, count in counts.items()}
+
+
+def test_columns_store_records_as_written(stores):
+    data, _, _ = stores
+    records = data["tenants"][TENANT]["attendance"]
+    columns = AttendanceColumns(TENANT, copy.deepcopy(records))
+    assert list(columns) == records
+    assert columns[0]["note"] == "late bus"
+    assert columns.position(records[5]["id"]) == 5
+    assert columns.position("att-unknown") is None
+
+    changed = dict(records[5], morning=not records[5]["morning"], captured_images={"morning": "blobs/x.jpg"})
+    columns[5] = changed
+    columns.append(dict(records[6], id="att-extra", date="2030-01-01"))
+    assert columns[5] == changed
+    assert columns[len(columns) - 1]["id"] == "att-extra"
+    assert columns.copy()[5] == changed
+
+
+def test_captured_images_stay_out_of_the_side_table(stores):
+    data, _, _ = stores
+    records = data["tenants"][TENANT]["attendance"]
+    assert any(r["captured_images"]["morning"] for r in records)
+    columns = AttendanceColumns(TENANT, copy.deepcopy(records[1:]))
+    assert columns._verbatim == {}
+    assert list(columns) == records[1:]
+
+    at = next(i for i, r in enumerate(records[1:]) if r["captured_images"]["morning"])
+    stored = len(columns._image_urls)
+    retaken = dict(records[at + 1], captured_images={"morning": "/uploads/blobs/ab/retaken.jpg", "afternoon": ""})
+    columns[at] = retaken
+    snapshot = copy.deepcopy(columns)
+    # A rewrite with as many images reuses the row's slots
+    assert len(columns._image_urls) == stored
+    columns[at] = dict(retaken, captured_images={"morning": "", "afternoon": "", "evening": "/uploads/blobs/cd/late.jpg"})
+    assert columns[at]["captured_images"]["evening"] == "/uploads/blobs/cd/late.jpg"
+    assert snapshot[at] == retaken
+    assert list(columns)[at + 1:] == records[at + 2:]
+
+
+def test_positions_match_a_scan(stores, monkeypatch):
+    data, _, _ = stores
+    records = copy.deepcopy(data["tenants"][TENANT]["attendance"])
+    # A short tail, so the appends below are served from it and then folded into the sorted lookups
+    monkeypatch.setattr(attendancestore, "MIN_TAIL", 8)
+    columns = AttendanceColumns(TENANT, records[:300])
+    students = sorted({r["student_id"] for r in records})
+    dates = sorted({r["date"] for r in records})
+
+    def check():
+        current = list(columns)
+        queries = [([students[0]], None), (students[:5], None), (students[:5], dates[3]), ([students[1]], dates[-1]),
+                   (None, dates[0]), (None, dates[-1]), (["student-unknown"], None), (None, "2031-01-01")]
+        for wanted, date in queries:
+            expected = [i for i, r in enumerate(current)
+                        if (wanted is None or r["student_id"] in wanted) and (date is None or r["date"] == date)]
+            assert list(columns.positions(wanted, date)) == expected
+
+    check()
+    columns.extend(records[300:305])
+    check()
+    columns.extend(records[305:])
+    check()
+    columns[7] = dict(records[7], student_id=students[0], date=dates[-1])
+    check()
+
+
+def test_memory_and_sql_stores_agree(stores):
+    data, memory, sql = stores
+    records = data["tenants"][TENANT]["attendance"]
+    students = data["tenants"][TENANT]["students"]
+    dates = sorted({r["date"] for r in records})
+    first = students[0]
+    roster = sorted(s["id"] for s in students if (s["class"], s["section"]) == (first["class"], first["section"]))
+
+    for repo in (memory, sql):
+        assert repo.list(TENANT, "attendance") == records
+        assert repo.list(TENANT, "attendance", student_id=first["id"]) == [r for r in records if r["student_id"] == first["id"]]
+        assert repo.list(TENANT, "attendance", date=dates[3]) == [r for r in records if r["date"] == dates[3]]
+        assert repo.get(TENANT, "attendance", "att1") == records[0]
+
+    ranges = [(None, None, None), (dates[2], dates[9], None), (dates[2], dates[9], set(roster)), (dates[-1], None, {first["id"]})]
+    for start, end, only in ranges:
+        expected = loop_presence(records, start, end, only)
+        assert memory.attendance_presence(TENANT, start, end, only) == expected
+        assert sql.attendance_presence(TENANT, start, end, only) == expected
+
+    memory_dates, memory_grid = memory.attendance_grid(TENANT, roster, dates[0], dates[6])
+    sql_dates, sql_grid = sql.attendance_grid(TENANT, roster, dates[0], dates[6])
+    assert memory_dates == sql_dates == dates[:7]
+    assert np.array_equal(memory_grid, sql_grid)
+    for record in records:
+        if record["student_id"] in roster and record["date"] <= dates[6]:
+            mask = sum(1 << bit for bit, slot in enumerate(TIME_SLOTS) if record.get(slot))
+            assert memory_grid[roster.index(record["student_id"]), dates.index(record["date"])] == mask
+
+
+def test_stores_agree_after_writes(stores):
+    data, memory, sql = stores
+    records = data["tenants"][TENANT]["attendance"]
+    target = records[10]
+    changed = dict(target, morning=not target["morning"], evening=True)
+    added = dict(records[11], id="att-new", date="2030-01-02", morning=True, afternoon=False, evening=False)
+    for repo in (memory, sql):
+        repo.update(TENANT, "attendance", target["id"], copy.deepcopy(changed))
+        repo.add(TENANT, "attendance", copy.deepcopy(added))
+
+    expected = [changed if r["id"] == target["id"] else r for r in records] + [added]
+    assert memory.list(TENANT, "attendance") == sql.list(TENANT, "attendance") == expected
+    assert memory.attendance_presence(TENANT) == sql.attendance_presence(TENANT) == loop_presence(expected, None, None, None)
+    assert memory.list(TENANT, "attendance", date="2030-01-02") == [added]
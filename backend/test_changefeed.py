@@ -0,0 +1,125 @@
+"""Change feed: per-subscription filtering and Last-Event-ID resume or reset.
+
+Run with `pytest test_changefeed.py` from the backend directory.
+"""
+import asyncio
+
+from fastapi.testclient import TestClient
+
+from changefeed import HEARTBEAT, RESET, ChangeHub, Subscription
+
+
+def event_ids(chunk: bytes):
+    return [line[4:].decode() for line in chunk.split(b"\n") if line.startswith(b"id: ")]
+
+
+def record(record_id, **fields):
+    return {"id": record_id, "school_id": "school1", **fields}
+
+
+async def next_chunk(stream):
+    return await asyncio.wait_for(stream.__anext__(), 1)
+
+
+def run(scenario):
+    async def wrapped():
+        hub = ChangeHub(heartbeat=0.05)
+        await hub.start()
+        try:
+            return await scenario(hub)
+        finally:
+            await hub.stop()
+    return asyncio.run(wrapped())
+
+
+def test_subscriptions_only_get_matching_events():
+    async def scenario(hub):
+        by_class = Subscription("school1", student_ids={"student1"}, class_name="10", section="A")
+        by_collection = Subscription("school1", collections={"fees"})
+        streams = [hub.stream(by_class), hub.stream(by_collection)]
+        for stream in streams:
+            await next_chunk(stream)  # retry: header
+
+        hub.record_changed("school1", "attendance", "created", [record("a1", student_id="student1", date="2024-02-01")])
+        hub.record_changed("school1", "attendance", "created", [record("a2", student_id="student3", date="2024-02-01")])
+        hub.record_changed("school1", "fees", "updated", [record("fee1", student_id="student1", status="paid")])
+        # A student joining the class is followed from then on
+        hub.record_changed("school1", "students", "created", [record("student9", **{"class": "10", "section": "A"})])
+        hub.record_changed("school1", "attendance", "created", [record("a3", student_id="student9", date="2024-02-01")])
+        hub.record_changed("school2", "fees", "created", [record("fee9", student_id="student4", status="unpaid")])
+        hub.record_changed("school1", "users", "created", [record("user9")])
+        await asyncio.sleep(0)
+
+        chunks = [await next_chunk(stream) for stream in streams]
+        for stream in streams:
+            await stream.aclose()
+        return chunks, hub.subscribers
+
+    (by_class, by_collection), subscribers = run(scenario)
+    assert b'"record_id":"a1"' in by_class and b'"record_id":"fee1"' in by_class
+    assert b'"record_id":"student9"' in by_class and b'"record_id":"a3"' in by_class
+    assert b'"record_id":"a2"' not in by_class
+    assert len(event_ids(by_class)) == 4
+    assert len(event_ids(by_collection)) == 1 and b'"record_id":"fee1"' in by_collection
+    # Users are not on the feed at all, and nothing crosses schools
+    assert b"user9" not in by_class + by_collection and b"fee9" not in by_collection
+    assert subscribers == 0
+
+
+def test_last_event_id_resumes_or_resets():
+    async def scenario(hub):
+        hub.record_changed("school1", "attendance", "created", [
+            record(f"a{i}", student_id="student1" if i % 2 else "student3", date="2024-02-01") for i in range(6)
+        ])
+        await asyncio.sleep(0)
+        history = list(hub._history["school1"])
+
+        resumed = hub.stream(Subscription("school1", student_ids={"student1"}), last_event_id=history[1]["id"])
+        await next_chunk(resumed)
+        replayed = [await next_chunk(resumed) for _ in range(2)]
+        await resumed.aclose()
+
+        unknown = hub.stream(Subscription("school1"), last_event_id="evicted-long-ago")
+        await next_chunk(unknown)
+        reset = await next_chunk(unknown)
+        heartbeat = await next_chunk(unknown)
+        await unknown.aclose()
+        return history, replayed, reset, heartbeat
+
+    history, replayed, reset, heartbeat = run(scenario)
+    # Only the missed events after the given id that pass the filter: a3 and a5
+    assert [event_ids(chunk)[0] for chunk in replayed] == [history[3]["id"], history[5]["id"]]
+    assert reset == RESET
+    assert heartbeat == HEARTBEAT
+
+
+def test_slow_reader_gets_one_reset():
+    async def scenario(hub):
+        stream = hub.stream(Subscription("school1", queue_size=3))
+        await next_chunk(stream)
+        for i in range(10):
+            hub.record_changed("school1", "fees", "updated", [record("fee1", student_id="student1", status=str(i))])
+        await asyncio.sleep(0)
+        first = await next_chunk(stream)
+        hub.record_changed("school1", "fees", "updated", [record("fee1", student_id="student1", status="done")])
+        await asyncio.sleep(0)
+        second = await next_chunk(stream)
+        await stream.aclose()
+        return first, second
+
+    first, second = run(scenario)
+    assert first == RESET
+    assert b'"status":"done"' in second
+
+
+def test_repository_writes_reach_the_hub(load_main, login):
+    main = load_main()
+    with TestClient(main.app) as client:
+        headers = login(client)
+        bad = client.get("/api/changes", headers=headers, params={"collections": "users"})
+        mixed = client.get("/api/changes", headers=headers, params={"student_id": "student1", "class_name": "10", "section": "A"})
+        client.post("/api/attendance", headers=headers, json={"student_id": "student3", "date": "2024-02-01"})
+        history = list(main.changes._history["school1"])
+
+    assert bad.status_code == 400 and mixed.status_code == 400
+    assert [(e["collection"], e["op"], e["student_id"]) for e in history] == [("attendance", "created", "student3")]
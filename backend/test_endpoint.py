@@ -16,12 +16,16 @@ data = {
     'date_of_birth': '2010-01-01'
 }
 
-headers = {
-    'Authorization': 'Bearer mock-jwt-token',
-    'X-School-Domain': 'stmarys'
-}
-
 try:
+    login = requests.post("http://localhost:8000/api/login", json={
+        'email': 'admin@stmarys.edu',
+        'password': 'admin123',
+        'school_domain': 'stmarys'
+    })
+    headers = {
+        'Authorization': f"Bearer {login.json()['token']}",
+        'X-School-Domain': 'stmarys'
+    }
     response = requests.post(url, data=data, headers=headers)
     print(f"Status Code: {response.status_code}")
     print(f"Response: {response.text}")
@@ -0,0 +1,161 @@
+"""Regression tests: uploads and repository calls must not block the event loop.
+
+Disk writes and repository calls are slowed down artificially; if any of them
+ran on the event loop, a timer coroutine running next to the requests would
+fall behind by at least that much. Run with `pytest test_event_loop.py` from
+the backend directory.
+"""
+import asyncio
+import base64
+import io
+import os
+import sys
+import time
+
+import httpx
+import pytest
+from PIL import Image
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+SLOW_WRITE = 0.3
+TICK = 0.005
+CONCURRENT_UPLOADS = 4
+
+
+@pytest.fixture(scope="module")
+def main(tmp_path_factory):
+    with pytest.MonkeyPatch.context() as mp:
+        # The app writes uploads/ relative to the working directory
+        mp.chdir(tmp_path_factory.mktemp("app"))
+        mp.setenv("STORAGE_BACKEND", "memory")
+        mp.syspath_prepend(BACKEND_DIR)
+        sys.modules.pop("main", None)
+        import main
+
+        yield main
+        sys.modules.pop("main", None)
+
+
+@pytest.fixture
+def slow_disk(main, monkeypatch):
+    import blobstore
+
+    def slowed(func):
+        def wrapper(*args, **kwargs):
+            time.sleep(SLOW_WRITE)
+            return func(*args, **kwargs)
+        return wrapper
+
+    monkeypatch.setattr(main, "copy_stream", slowed(main.copy_stream))
+    monkeypatch.setattr(main, "write_base64", slowed(main.write_base64))
+    monkeypatch.setattr(blobstore, "put_bytes", slowed(blobstore.put_bytes))
+
+
+@pytest.fixture
+def slow_repository(main, monkeypatch):
+    """Every repository call takes as long as a slow database round-trip"""
+    def slowed(func):
+        def wrapper(*args, **kwargs):
+            time.sleep(SLOW_WRITE)
+            return func(*args, **kwargs)
+        return wrapper
+
+    for name in ("list", "page", "get", "add", "update", "versions", "roster", "existing_ids", "upsert_attendance"):
+        monkeypatch.setattr(main.repo, name, slowed(getattr(main.repo, name)))
+
+
+def photo_bytes() -> bytes:
+    buffer = io.BytesIO()
+    Image.effect_noise((512, 512), 64).convert("RGB").save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+async def login_headers(client: httpx.AsyncClient) -> dict:
+    login = await client.post("/api/login", json={
+        "email": "admin@stmarys.edu", "password": "admin123", "school_domain": "stmarys"
+    })
+    return {"Authorization": f"Bearer {login.json()['token']}", "X-School-Domain": "stmarys"}
+
+
+async def max_loop_lag(stop: asyncio.Event) -> float:
+    """Largest delay of a TICK-second sleep while `stop` is unset"""
+    worst = 0.0
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(TICK)
+        worst = max(worst, time.perf_counter() - started - TICK)
+    return worst
+
+
+def test_uploads_do_not_block_event_loop(main, slow_disk):
+    photo = photo_bytes()
+    data_url = "data:image/png;base64," + base64.b64encode(photo).decode()
+
+    async def scenario():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            headers = await login_headers(client)
+            form = {"name": "Upload Test", "class_name": "10", "section": "A", "parent_id": "parent1"}
+
+            # Bodies are encoded up front: client and app share this loop, and only the app is under test
+            requests = []
+            for i in range(CONCURRENT_UPLOADS):
+                requests.append(client.build_request(
+                    "POST", "/api/students", headers=headers, data=form,
+                    files={"file": (f"photo{i}.png", photo, "image/png")},
+                ))
+                requests.append(client.build_request(
+                    "POST", "/api/students", headers=headers, data={**form, "photo_url": data_url},
+                ))
+                requests.append(client.build_request("POST", "/api/attendance", headers=headers, json={
+                    "student_id": "student1", "date": f"2024-02-{i + 1:02d}", "morning": True,
+                    "captured_images": {"morning": data_url},
+                }))
+
+            stop = asyncio.Event()
+            monitor = asyncio.ensure_future(max_loop_lag(stop))
+            started = time.perf_counter()
+            responses = await asyncio.gather(*[client.send(request) for request in requests])
+            elapsed = time.perf_counter() - started
+            stop.set()
+            return responses, await monitor, elapsed
+
+    responses, lag, elapsed = asyncio.run(scenario())
+
+    assert [r.status_code for r in responses] == [200] * len(responses)
+    # Writes were really slowed down, and overlapped instead of running one after another
+    assert elapsed >= SLOW_WRITE
+    assert elapsed < SLOW_WRITE * len(responses)
+    assert lag < SLOW_WRITE / 2, f"event loop stalled for {lag * 1000:.0f} ms"
+
+
+def test_repository_calls_do_not_block_event_loop(main, slow_repository):
+    async def scenario():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            headers = await login_headers(client)
+            requests = [
+                client.build_request("GET", "/api/fees", headers=headers),
+                client.build_request("GET", "/api/fees/fee1", headers=headers),
+                client.build_request("GET", "/api/attendance", headers=headers, params={"date": "2024-01-15"}),
+                client.build_request("POST", "/api/teachers", headers=headers, json={
+                    "name": "Slow Teacher", "class_name": "10", "section": "A", "phone": "1"
+                }),
+                client.build_request("POST", "/api/attendance", headers=headers, json={
+                    "student_id": "student1", "date": "2024-03-01", "morning": True,
+                }),
+                client.build_request("POST", "/api/attendance/batch", headers=headers, json={
+                    "records": [{"student_id": "student1", "date": "2024-03-02", "morning": True}],
+                }),
+            ]
+
+            stop = asyncio.Event()
+            monitor = asyncio.ensure_future(max_loop_lag(stop))
+            responses = await asyncio.gather(*[client.send(request) for request in requests])
+            stop.set()
+            return responses, await monitor
+
+    responses, lag = asyncio.run(scenario())
+
+    assert [r.status_code for r in responses] == [200] * len(responses)
+    assert lag < SLOW_WRITE / 2, f"event loop stalled for {lag * 1000:.0f} ms"
@@ -0,0 +1,35 @@
+"""Exam reports keep subjects apart from the student's name, class and section.
+
+Run with `pytest test_exam_reports.py` from the backend directory.
+"""
+from fastapi.testclient import TestClient
+
+
+def test_subjects_named_like_placement_columns(load_main, login):
+    main = load_main()
+    with TestClient(main.app) as client:
+        headers = login(client)
+        for student_id, scores in (("student1", {"name": 70, "class": 60, "section": 50}),
+                                   ("student2", {"name": 90, "class": 40}),
+                                   ("student3", {"name": 80, "class": 80, "section": 20})):
+            response = client.post("/api/exam-results", headers=headers, json={
+                "student_id": student_id, "exam_type": "unit", "scores": scores, "date": "2024-02-01",
+            })
+            assert response.status_code == 200, response.text
+        rankings = client.get("/api/reports/exams/rankings", headers=headers, params={"exam_type": "unit"}).json()
+        subjects = client.get("/api/reports/exams/subjects", headers=headers, params={"exam_type": "unit"}).json()
+        trend = client.get("/api/reports/exams/trends", headers=headers,
+                           params={"exam_type": "unit", "student_id": "student2"}).json()
+
+    assert rankings["subjects"] == ["name", "class", "section"]
+    assert [(r["student_id"], r["name"], r["class_name"], r["section"], r["total"], r["scores"])
+            for r in rankings["rankings"]] == [
+        # Tied totals are ordered by class, then section
+        ("student1", "Alice Johnson", "10", "A", 180, [70, 60, 50]),
+        ("student3", "Charlie Brown", "9", "B", 180, [80, 80, 20]),
+        ("student2", "Bob Smith", "10", "A", 130, [90, 40, None]),
+    ]
+    assert subjects["subjects"]["class"]["mean"] == 60
+    assert subjects["subjects"]["section"]["count"] == 2
+    assert [(c["class_name"], c["section"], c["students"]) for c in subjects["classes"]] == [("10", "A", 2), ("9", "B", 1)]
+    assert trend["exams"][0]["scores"] == {"name": 90, "class": 40, "average": 65}
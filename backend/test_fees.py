@@ -0,0 +1,173 @@
+"""Fee records read back the same on both storage backends.
+
+Run with `pytest test_fees.py` from the backend directory.
+"""
+import asyncio
+import time
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+
+from conftest import BACKENDS
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_fee_amounts_keep_their_json_shape(load_main, login, backend):
+    main = load_main(backend)
+    with TestClient(main.app) as client:
+        headers = login(client)
+        fee = client.get("/api/fees/fee1", headers=headers).json()
+        created = client.post("/api/fees", headers=headers, json={
+            "student_id": "student1", "academic_year": "2025-2026", "total_amount": 1234.5, "due_date": "2026-03-31",
+        }).json()
+        reread = client.get(f"/api/fees/{created['id']}", headers=headers).json()
+
+    # Whole amounts stay ints, as in the seed data; "50000.0" would differ from the memory store
+    assert '"total_amount":50000,' in main.dumps(fee).decode()
+    assert fee["installments"][0]["amount"] == 15000
+    assert type(fee["installments"][0]["amount"]) is int
+    assert reread["total_amount"] == 1234.5
+    assert reread["remaining_amount"] == 1234.5
+    assert reread["paid_amount"] == 0 and type(reread["paid_amount"]) is int
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_created_installments_get_ids_and_are_due(load_main, login, backend):
+    main = load_main(backend)
+    with TestClient(main.app) as client:
+        headers = login(client)
+        response = client.post("/api/fees", headers=headers, json={
+            "student_id": "student3", "academic_year": "2025-2026", "total_amount": 800, "due_date": "2026-03-31",
+            "installments": [{"amount": 500, "due_date": "2025-09-30"}, {"amount": 300, "due_date": "2026-01-31"}],
+        })
+        assert response.status_code == 200, response.text
+        fee = response.json()
+        dues = client.get("/api/fees/dues", headers=headers, params={"student_id": "student3"}).json()
+        listed = [f["id"] for f in client.get("/api/fees", headers=headers).json()]
+
+    assert [(i["amount"], i["status"], i["paid_date"]) for i in fee["installments"]] == [
+        (500, "pending", None), (300, "pending", None),
+    ]
+    assert all(i["id"].startswith("inst") for i in fee["installments"])
+    assert [d["installment_id"] for d in dues] == [i["id"] for i in fee["installments"]]
+    assert fee["id"] in listed
+
+
+def test_rejected_fee_leaves_the_memory_store_untouched(load_main):
+    main = load_main()
+    repo = main.repo
+    events = []
+    repo.on_change = lambda *args: events.append(args)
+    versions = repo.versions("school1", ["fees"])
+    fees = repo.list("school1", "fees")
+
+    with pytest.raises(ArithmeticError):
+        repo.add("school1", "fees", {"id": "fee-bad", "student_id": "student1", "academic_year": "2024-2025",
+                                     "total_amount": "lots", "paid_amount": 0, "installments": []})
+
+    assert repo.list("school1", "fees") == fees
+    assert repo.get("school1", "fees", "fee-bad") is None
+    assert repo.versions("school1", ["fees"]) == versions
+    assert events == []
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_installment_totals_move_with_each_change(load_main, login, backend):
+    main = load_main(backend)
+    with TestClient(main.app) as client:
+        headers = login(client)
+        fee = client.post("/api/fees", headers=headers, json={
+            "student_id": "student3", "academic_year": "2025-2026", "total_amount": 100, "due_date": "2026-03-31",
+            "installments": [
+                {"id": "inst-a", "amount": 30, "due_date": "2025-09-30", "paid_date": "2025-09-01", "status": "paid"},
+                {"id": "inst-b", "amount": 50, "due_date": "2025-12-31"},
+            ],
+        }).json()
+        edited = client.put(f"/api/fees/{fee['id']}", headers=headers, json={"total_amount": 130}).json()
+        added = client.post(f"/api/fees/{fee['id']}/installments", headers=headers,
+                            json={"amount": 20, "due_date": "2026-02-28"}).json()
+        new_id = added["installments"][-1]["id"]
+        paid_b = client.post(f"/api/fees/{fee['id']}/installments/inst-b/pay", headers=headers,
+                             json={"paid_date": "2025-12-01", "payment_method": "cash"}).json()
+        paid_again = client.post(f"/api/fees/{fee['id']}/installments/inst-b/pay", headers=headers,
+                                 json={"paid_date": "2025-12-02", "payment_method": "cash"}).json()
+        paid_new = client.post(f"/api/fees/{fee['id']}/installments/{new_id}/pay", headers=headers,
+                               json={"paid_date": "2026-02-01", "payment_method": "cash"}).json()
+        missing = client.post(f"/api/fees/{fee['id']}/installments/nope/pay", headers=headers,
+                              json={"paid_date": "2026-02-01", "payment_method": "cash"})
+        summary = client.get("/api/fees/summary", headers=headers,
+                             params={"scope": "student", "student_id": "student3"}).json()
+
+    def amounts(record):
+        return record["total_amount"], record["paid_amount"], record["remaining_amount"], record["status"]
+
+    # The installment created as paid counts from the start
+    assert amounts(fee) == (100, 30, 70, "partial")
+    # A PUT of the total settles the remaining amount and status with it
+    assert amounts(edited) == (130, 30, 100, "partial")
+    # 30 + 50 + 20 is still within the edited total, so it stays
+    assert amounts(added) == (130, 30, 100, "partial")
+    assert amounts(paid_b) == (130, 80, 50, "partial")
+    # Paying an installment twice counts it once
+    assert amounts(paid_again) == amounts(paid_b)
+    assert amounts(paid_new) == (130, 100, 30, "partial")
+    assert missing.status_code == 404
+    assert summary["totals"] == [{"student_id": "student3", "total_amount": 130, "paid_amount": 100, "remaining_amount": 30}]
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_installments_never_shrink_the_planned_total(load_main, login, backend):
+    main = load_main(backend)
+    with TestClient(main.app) as client:
+        headers = login(client)
+        fee = client.post("/api/fees", headers=headers, json={
+            "student_id": "student3", "academic_year": "2025-2026", "total_amount": 900, "due_date": "2026-03-31",
+        }).json()
+        first = client.post(f"/api/fees/{fee['id']}/installments", headers=headers,
+                            json={"amount": 400, "due_date": "2025-10-31"}).json()
+        second = client.post(f"/api/fees/{fee['id']}/installments", headers=headers,
+                             json={"amount": 500.5, "due_date": "2026-01-31"}).json()
+
+    # A partial plan leaves the rest of the total due
+    assert (first["total_amount"], first["remaining_amount"], first["status"]) == (900, 900, "unpaid")
+    # Installments beyond the total raise it to their sum
+    assert (second["total_amount"], second["remaining_amount"]) == (900.5, 900.5)
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_concurrent_payments_are_all_counted(load_main, login, backend, monkeypatch):
+    main = load_main(backend)
+    pay = main.pay_installment
+
+    def slow_pay(*args):
+        # Widens the gap between reading the fee and writing it back
+        time.sleep(0.02)
+        return pay(*args)
+
+    monkeypatch.setattr(main, "pay_installment", slow_pay)
+    with TestClient(main.app) as client:
+        headers = login(client)
+        fee = client.post("/api/fees", headers=headers, json={
+            "student_id": "student3", "academic_year": "2025-2026", "total_amount": 80, "due_date": "2026-03-31",
+            "installments": [{"id": f"inst-{n}", "amount": 10, "due_date": "2025-09-30"} for n in range(8)],
+        }).json()
+
+        async def pay_all():
+            transport = httpx.ASGITransport(app=main.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as concurrent:
+                return await asyncio.gather(*[
+                    concurrent.post(f"/api/fees/{fee['id']}/installments/inst-{n}/pay", headers=headers,
+                                    json={"paid_date": "2025-09-01", "payment_method": "cash"})
+                    for n in range(8)
+                ])
+
+        responses = asyncio.run(pay_all())
+        final = client.get(f"/api/fees/{fee['id']}", headers=headers).json()
+        summary = client.get("/api/fees/summary", headers=headers,
+                             params={"scope": "student", "student_id": "student3"}).json()
+
+    assert [r.status_code for r in responses] == [200] * 8
+    assert (final["paid_amount"], final["remaining_amount"], final["status"]) == (80, 0, "paid")
+    assert {i["status"] for i in final["installments"]} == {"paid"}
+    assert summary["totals"] == [{"student_id": "student3", "total_amount": 80, "paid_amount": 80, "remaining_amount": 0}]
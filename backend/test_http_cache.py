@@ -0,0 +1,76 @@
+"""ETags on list routes: 304 while nothing changed, a fresh body after a write.
+
+Run with `pytest test_http_cache.py` from the backend directory.
+"""
+import pytest
+from fastapi.testclient import TestClient
+
+from conftest import BACKENDS
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_etag_revalidation_and_invalidation(load_main, login, backend):
+    main = load_main(backend)
+    with TestClient(main.app) as client:
+        headers = login(client)
+        first = client.get("/api/attendance", headers=headers)
+        etag = first.headers["ETag"]
+        unchanged = client.get("/api/attendance", headers={**headers, "If-None-Match": etag})
+        weak = client.get("/api/attendance", headers={**headers, "If-None-Match": f'"other", W/{etag}'})
+        other_query = client.get("/api/attendance", headers={**headers, "If-None-Match": etag},
+                                 params={"student_id": "student1"})
+
+        client.post("/api/attendance", headers=headers, json={"student_id": "student3", "date": "2024-02-01", "morning": True})
+        after_write = client.get("/api/attendance", headers={**headers, "If-None-Match": etag})
+
+        # Other collections and other schools keep their ETags
+        students = client.get("/api/students", headers=headers)
+        other_school = login(client, "brightfuture")
+        theirs = client.get("/api/attendance", headers=other_school)
+        client.post("/api/attendance", headers=headers, json={"student_id": "student3", "date": "2024-02-02"})
+        students_again = client.get("/api/students", headers={**headers, "If-None-Match": students.headers["ETag"]})
+        theirs_again = client.get("/api/attendance", headers={**other_school, "If-None-Match": theirs.headers["ETag"]})
+
+    assert first.status_code == 200
+    assert unchanged.status_code == 304 and unchanged.content == b""
+    assert unchanged.headers["ETag"] == etag
+    assert weak.status_code == 304
+    assert other_query.status_code == 200
+    assert after_write.status_code == 200
+    assert after_write.headers["ETag"] != etag
+    assert len(after_write.json()) == len(first.json()) + 1
+    assert students_again.status_code == 304
+    assert theirs_again.status_code == 304
+
+
+def test_class_filter_follows_roster_writes(load_main, login):
+    main = load_main()
+    with TestClient(main.app) as client:
+        headers = login(client)
+        params = {"class_name": "9", "section": "B"}
+        before = client.get("/api/attendance", headers=headers, params=params)
+        client.post("/api/students", headers=headers, data={
+            "name": "Dana", "class_name": "9", "section": "B", "parent_id": "parent2",
+        })
+        after = client.get("/api/attendance", headers={**headers, "If-None-Match": before.headers["ETag"]}, params=params)
+
+    # The roster behind the filter changed, so the cached list is not reused
+    assert after.status_code == 200
+    assert after.headers["ETag"] != before.headers["ETag"]
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_batches_bump_the_counter_once(load_main, login, backend):
+    main = load_main(backend)
+    with TestClient(main.app) as client:
+        headers = login(client)
+        before = main.repo.versions("school1", ("attendance",))[0]
+        response = client.post("/api/attendance/batch", headers=headers, json={"records": [
+            {"student_id": "student1", "date": "2024-03-04", "morning": True},
+            {"student_id": "student2", "date": "2024-03-04", "morning": True},
+            {"student_id": "student1", "date": "2024-01-15", "evening": True},
+        ]})
+        after = main.repo.versions("school1", ("attendance",))[0]
+
+    assert response.status_code == 200, response.text
+    assert after == before + 1
@@ -0,0 +1,68 @@
+"""Generated record IDs: unique, and sorted by creation order.
+
+Run with `pytest test_ids.py` from the backend directory.
+"""
+import threading
+import time
+
+from ids import ENCODED_LENGTH, RANDOM_BITS, RANDOM_MAX, IdGenerator, id_timestamp, parse_id
+
+
+def test_ids_increase_within_one_millisecond_and_across_threads():
+    generator = IdGenerator()
+    sequential = [generator.new("att") for _ in range(20000)]
+    assert sequential == sorted(sequential)
+    assert len(set(sequential)) == len(sequential)
+
+    results = [[] for _ in range(8)]
+
+    def draw(out):
+        for _ in range(5000):
+            out.append(generator.new("att"))
+
+    threads = [threading.Thread(target=draw, args=(out,)) for out in results]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    drawn = [i for out in results for i in out]
+    assert len(set(drawn)) == len(drawn)
+    # Each thread sees its own IDs in increasing order
+    assert all(out == sorted(out) for out in results)
+
+
+def test_bulk_ids_continue_the_sequence():
+    generator = IdGenerator()
+    before = generator.new("fee")
+    block = generator.many("fee", 1000)
+    after = generator.new("fee")
+    assert [before] + block + [after] == sorted([before] + block + [after])
+    assert len(set(block)) == 1000
+    assert generator.many("fee", 0) == []
+
+
+def test_random_part_overflow_carries_into_the_timestamp():
+    generator = IdGenerator()
+    generator._last_ms = int(time.time() * 1000) + 60000  # as if the clock stepped back a minute
+    generator._random = RANDOM_MAX
+    first, second = generator.new(), generator.new()
+    assert first < second
+    parsed = parse_id(second)
+    assert parsed is not None
+    assert parsed[1] >> RANDOM_BITS == generator._last_ms
+
+
+def test_ids_round_trip_and_carry_their_time():
+    generator = IdGenerator()
+    started = time.time()
+    record_id = generator.new("student")
+    parsed = parse_id(record_id)
+    assert parsed is not None
+    prefix, value = parsed
+    assert prefix == "student"
+    assert prefix + IdGenerator.encode(value) == record_id
+    assert len(record_id) == len("student") + ENCODED_LENGTH
+    assert started - 0.002 <= id_timestamp(record_id) <= time.time() + 0.002
+    # Hand-written seed IDs are not generated ones
+    assert parse_id("student1") is None
+    assert parse_id("x" * ENCODED_LENGTH) is None
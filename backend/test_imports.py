@@ -0,0 +1,39 @@
+"""Roster imports only accept the formats they can read, and only photos hosted here.
+
+Run with `pytest test_imports.py` from the backend directory.
+"""
+import pytest
+from fastapi.testclient import TestClient
+
+
+@pytest.mark.parametrize("filename", ["roster.txt", "roster", "roster.csv.exe"])
+def test_unknown_formats_are_rejected(load_main, login, filename):
+    main = load_main()
+    with TestClient(main.app) as client:
+        response = client.post("/api/imports/roster", headers=login(client),
+                               files={"file": (filename, b"name,class,section\n", "text/plain")})
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Upload a .csv or .xlsx file"
+
+
+def test_student_photos_must_be_hosted_here(load_main, tmp_path):
+    main = load_main()
+    roster = tmp_path / "roster.csv"
+    roster.write_text(
+        "name,class,section,parent_id,photo_url\n"
+        "Hosted,10,A,parent1,/uploads/student_photos/student_abc.jpg\n"
+        "No Photo,10,A,parent1,\n"
+        "External,10,A,parent1,https://tracker.example.com/pixel.gif\n"
+        "Protocol Relative,10,A,parent1,//evil.example.com/a.jpg\n"
+        "Other Path,10,A,parent1,/api/students\n"
+    )
+    job = main.ImportJob("school1", "roster.csv")
+    main.run_import(main.repo, main.ROSTER_MODELS, job, str(roster), "csv", "students")
+
+    assert job.status == "completed"
+    assert (job.created["students"], job.failed) == (2, 3)
+    assert [(e["row"], e["errors"][0]["field"]) for e in job.errors] == [(4, "photo_url"), (5, "photo_url"), (6, "photo_url")]
+    photos = {s["name"]: s["photo_url"] for s in main.repo.list("school1", "students")}
+    assert photos["Hosted"] == "/uploads/student_photos/student_abc.jpg"
+    assert photos["No Photo"] == ""
+    assert "External" not in photos
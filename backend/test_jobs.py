@@ -0,0 +1,185 @@
+"""Job queue: leases, retries with backoff, deduplication and priorities.
+
+The clock is moved by hand; jobs run through run_once() without worker threads.
+Run with `pytest test_jobs.py` from the backend directory.
+"""
+import json
+import sqlite3
+import time
+
+import pytest
+
+import jobs
+from jobs import JobQueue, JobStore
+
+
+class Clock:
+    """Stands in for the time module inside jobs.py"""
+
+    perf_counter = staticmethod(time.perf_counter)
+
+    def __init__(self):
+        self.now = 1_700_000_000.0
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(jobs, "time", clock)
+    return clock
+
+
+@pytest.fixture
+def queue(tmp_path, clock):
+    queue = JobQueue(JobStore(str(tmp_path / "jobs.db")), workers=0, lease=30, backoff=2, backoff_max=10)
+    yield queue
+    queue.store.close()
+
+
+def test_expired_lease_requeues_then_fails_the_job(queue, clock):
+    queue.register("photo", lambda job: None, max_attempts=2)
+    job = queue.enqueue("school1", "photo", {"path": "a.jpg"})
+
+    # A worker claims the job and dies without finishing it
+    assert queue.store.claim(queue.lease)["id"] == job["id"]
+    clock.now += 29
+    assert queue.store.claim(queue.lease) is None
+    clock.now += 2
+    reclaimed = queue.store.claim(queue.lease)
+    assert (reclaimed["id"], reclaimed["attempts"]) == (job["id"], 2)
+
+    # Progress reports extend the lease
+    queue.store.report(job["id"], {"done": 1}, queue.lease)
+    clock.now += 29
+    assert queue.store.claim(queue.lease) is None
+    clock.now += 2
+    assert queue.store.claim(queue.lease) is None
+    failed = queue.store.get("school1", job["id"])
+    assert failed["status"] == "failed"
+    assert failed["error"] == "Worker stopped before the job finished"
+
+
+def test_failed_jobs_retry_after_backoff(queue, clock):
+    calls = []
+
+    def flaky(job):
+        calls.append(job.attempt)
+        if len(calls) < 3:
+            raise ValueError("disk full")
+        return {"variants": 3}
+
+    queue.register("photo", flaky, max_attempts=3)
+    job = queue.enqueue("school1", "photo", {})
+    assert queue.run_once()
+    retried = queue.store.get("school1", job["id"])
+    assert retried["status"] == "queued" and retried["error"] == "ValueError: disk full"
+
+    # Not due again until its backoff (2s ± 50% for the first retry) has passed
+    assert not queue.run_once()
+    clock.now += 3.01
+    assert queue.run_once()
+    clock.now += 6.01
+    assert queue.run_once()
+    done = queue.store.get("school1", job["id"])
+    assert calls == [1, 2, 3]
+    assert (done["status"], done["result"], done["attempts"]) == ("succeeded", {"variants": 3}, 3)
+
+
+def test_retry_delay_grows_and_is_capped(queue):
+    for attempt, base in ((1, 2), (2, 4), (3, 8), (4, 10), (9, 10)):
+        delays = [queue.retry_delay(attempt) for _ in range(200)]
+        assert base * 0.5 <= min(delays) and max(delays) <= base * 1.5
+
+
+def test_jobs_out_of_attempts_fail_for_good(queue, clock):
+    def broken(job):
+        raise RuntimeError("bad file")
+
+    queue.register("roster_import", broken, max_attempts=1)
+    job = queue.enqueue("school1", "roster_import", {})
+    assert queue.run_once()
+    clock.now += 3600
+    assert not queue.run_once()
+    assert queue.store.get("school1", job["id"])["status"] == "failed"
+
+
+def test_dedup_key_returns_the_active_job(queue, clock):
+    queue.register("roster_import", lambda job: "ok")
+    first = queue.enqueue("school1", "roster_import", {"file": 1}, dedup_key="sha-1")
+    again = queue.enqueue("school1", "roster_import", {"file": 2}, dedup_key="sha-1")
+    other_school = queue.enqueue("school2", "roster_import", {"file": 1}, dedup_key="sha-1")
+    assert again["id"] == first["id"]
+    assert other_school["id"] != first["id"]
+
+    # Still deduplicated while running, with the first payload; a finished job frees the key
+    assert json.loads(queue.store.claim(queue.lease)["payload"]) == {"file": 1}
+    assert queue.enqueue("school1", "roster_import", {}, dedup_key="sha-1")["id"] == first["id"]
+    queue.store.succeed(first["id"], "ok")
+    assert queue.enqueue("school1", "roster_import", {}, dedup_key="sha-1")["id"] != first["id"]
+
+
+def test_enqueue_conflicts_without_an_active_job_are_raised(queue):
+    queue.register("roster_import", lambda job: None)
+    taken = queue.enqueue("school1", "roster_import", {}, job_id="job-fixed")
+    # A caller-supplied id that is taken is an error even with a dedup key
+    with pytest.raises(sqlite3.IntegrityError):
+        queue.enqueue("school1", "roster_import", {}, dedup_key="sha-2", job_id=taken["id"])
+
+    store, real = queue.store, queue.store._conn
+
+    class Conflicting:
+        """Every insert conflicts, yet no active job holds the key"""
+        inserts = 0
+
+        def execute(self, sql, *args):
+            if sql.startswith("INSERT"):
+                Conflicting.inserts += 1
+                raise sqlite3.IntegrityError("UNIQUE constraint failed: jobs.tenant_id, jobs.kind, jobs.dedup_key")
+            return real.execute(sql, *args)
+
+    store._conn = Conflicting()
+    try:
+        with pytest.raises(sqlite3.IntegrityError):
+            store.enqueue("school1", "roster_import", {}, dedup_key="sha-3")
+    finally:
+        store._conn = real
+    assert Conflicting.inserts == jobs.ENQUEUE_ATTEMPTS
+
+
+def test_priority_then_age_and_exclusive_claims(tmp_path, queue, clock):
+    queue.register("roster_import", lambda job: None, priority=0)
+    queue.register("photo", lambda job: None, priority=10)
+    old_import = queue.enqueue("school1", "roster_import", {})
+    clock.now += 1
+    new_import = queue.enqueue("school1", "roster_import", {})
+    photo = queue.enqueue("school1", "photo", {})
+    later = queue.enqueue("school1", "photo", {}, delay=60)
+
+    # Another process sharing the file sees the same queue, and never the same job
+    other = JobStore(str(tmp_path / "jobs.db"))
+    try:
+        first = queue.store.claim(300)["id"]
+        taken_by_other = other.claim(300)
+        third = queue.store.claim(300)["id"]
+        assert taken_by_other is not None
+        claimed = [first, taken_by_other["id"], third]
+        assert other.claim(300) is None
+    finally:
+        other.close()
+    assert claimed == [photo["id"], old_import["id"], new_import["id"]]
+    clock.now += 60
+    assert queue.store.claim(300)["id"] == later["id"]
+
+
+def test_only_queued_jobs_can_be_cancelled(queue):
+    queue.register("photo", lambda job: None)
+    running = queue.enqueue("school1", "photo", {})
+    queued = queue.enqueue("school1", "photo", {})
+    queue.store.claim(30)
+    assert queue.store.cancel("school1", queued["id"])["status"] == "cancelled"
+    assert queue.store.cancel("school1", running["id"])["status"] == "running"
+    assert queue.store.cancel("school2", queued["id"]) is None
+    assert queue.store.claim(30) is None
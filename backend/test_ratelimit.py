@@ -0,0 +1,176 @@
+"""Rate limiting: route classes, 429 with Retry-After, per-user budgets and the in-flight cap.
+
+Run with `pytest test_ratelimit.py` from the backend directory.
+"""
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+
+from ratelimit import LocalLimiter, RateLimiter, RateLimitMiddleware, route_class
+
+
+@pytest.mark.parametrize("method, path, expected", [
+    ("POST", "/api/students", "upload"),
+    ("GET", "/api/students", None),
+    ("POST", "/api/imports/roster", "upload"),
+    ("POST", "/api/attendance/batch", "upload"),
+    ("POST", "/api/attendance", None),
+    ("GET", "/api/exports/fees", "export"),
+    ("GET", "/api/reports/exams/rankings", "report"),
+    ("GET", "/api/reports", "report"),
+    ("GET", "/api/reportsx", None),
+    ("GET", "/api/attendance/grid", "report"),
+    ("GET", "/api/attendance", None),
+])
+def test_route_classes(method, path, expected):
+    assert route_class(method, path) == expected
+
+
+def test_buckets_are_drawn_all_or_nothing():
+    limiter = LocalLimiter(max_keys=3)
+    assert limiter.take([("a", 1, 2)], now=0) == 0
+    assert limiter.take([("b", 1, 1)], now=0) == 0
+    # "b" is empty, so "a" keeps its last token
+    assert limiter.take([("a", 1, 2), ("b", 1, 1)], now=0) == pytest.approx(1.0)
+    assert limiter.take([("a", 1, 2)], now=0) == 0
+    assert limiter.take([("a", 1, 2)], now=0) == pytest.approx(1.0)
+    assert limiter.take([("a", 1, 2)], now=0.25) == pytest.approx(0.75)
+    assert limiter.take([("a", 1, 2)], now=1.0) == 0
+
+    # Least recently used buckets go first beyond max_keys
+    for key in ("c", "d", "e"):
+        limiter.take([(key, 1, 1)], now=2)
+    assert list(limiter._buckets) == ["c", "d", "e"]
+
+
+def test_export_budget_is_per_user_and_answers_429_with_retry_after(load_main, login):
+    main = load_main(RATE_LIMIT_ENABLED="true", RATE_LIMIT_EXPORT_RATE="0.01", RATE_LIMIT_EXPORT_BURST="3")
+    client = TestClient(main.app)
+    admin = login(client)
+    teacher = {**admin, "Authorization": "Bearer " + main.tokens.issue("2", "teacher", "school1")[0]}
+    browser = {"Origin": "https://app.example"}
+
+    admin_exports = [client.get("/api/exports/fees", headers={**admin, **browser}) for _ in range(4)]
+    teacher_export = client.get("/api/exports/fees", headers=teacher)
+    admin_list = client.get("/api/fees", headers=admin)
+    metrics = client.get("/metrics").text
+
+    assert [r.status_code for r in admin_exports] == [200, 200, 200, 429]
+    rejected = admin_exports[-1]
+    # One token refills in 1 / 0.01 = 100 seconds
+    assert rejected.headers["Retry-After"] == "100"
+    assert rejected.json() == {"detail": "Too many requests, slow down"}
+    # The browser can read the status and the delay
+    assert "Retry-After" in rejected.headers["Access-Control-Expose-Headers"]
+    # Another user's exports and the same user's other routes are unaffected
+    assert teacher_export.status_code == 200
+    assert admin_list.status_code == 200
+    assert 'http_requests_shed_total{tenant="school1",class="export",reason="rate"} 1' in metrics
+
+
+def test_unseen_domains_are_resolved_off_the_event_loop(load_main, monkeypatch):
+    main = load_main(RATE_LIMIT_ENABLED="true")
+    lookups = []
+    get_school = main.repo.get_school
+
+    def recording_get_school(domain):
+        try:
+            asyncio.get_running_loop()
+            lookups.append((domain, "event loop"))
+        except RuntimeError:
+            lookups.append((domain, "threadpool"))
+        return get_school(domain)
+
+    monkeypatch.setattr(main.repo, "get_school", recording_get_school)
+    client = TestClient(main.app)
+    responses = [client.get("/api/students", headers={"X-School-Domain": f"made-up-{n}", "Authorization": "Bearer x"}) for n in range(3)]
+    metrics = client.get("/metrics").text
+
+    assert [r.status_code for r in responses] == [400] * 3
+    # The middleware only reads the in-memory table; the request path looks the domain up in the threadpool
+    assert lookups == [(f"made-up-{n}", "threadpool") for n in range(3)]
+    assert 'tenant="unknown"' in metrics
+    assert "made-up" not in metrics
+
+
+def test_default_budgets_allow_a_month_end_burst(load_main, login):
+    main = load_main(RATE_LIMIT_ENABLED="true")
+    client = TestClient(main.app)
+    admin = login(client)
+    statuses = [client.get(f"/api/exports/{name}", headers=admin).status_code
+                for _ in range(3) for name in ("attendance", "exam-results", "fees")]
+    assert statuses == [200] * 9
+
+
+def test_in_flight_cap_per_tenant():
+    # Created inside the test's event loop (Python 3.8 binds events to a loop)
+    release = {}
+
+    async def slow_app(scope, receive, send):
+        await release["event"].wait()
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b""})
+
+    limiter = RateLimiter(LocalLimiter(), in_flight=2)
+    middleware = RateLimitMiddleware(slow_app, limiter, tenant_of=lambda domain: domain or "none")
+
+    async def request(domain, path="/api/attendance"):
+        response = {}
+
+        async def send(message):
+            if message["type"] == "http.response.start":
+                response.update(status=message["status"], headers=dict(message["headers"]))
+
+        await middleware({"type": "http", "method": "GET", "path": path,
+                          "headers": [(b"x-school-domain", domain.encode())]}, None, send)
+        return response
+
+    async def scenario():
+        release["event"] = asyncio.Event()
+        busy = [asyncio.ensure_future(request("a")) for _ in range(2)]
+        stream = asyncio.ensure_future(request("a", "/api/changes"))
+        await asyncio.sleep(0.01)
+        rejected = await request("a")
+        other_school = asyncio.ensure_future(request("b"))
+        await asyncio.sleep(0.01)
+        active = dict(limiter._active)
+        release["event"].set()
+        done = await asyncio.gather(*busy, stream, other_school)
+        after = await request("a")
+        return rejected, active, done, after, dict(limiter._active)
+
+    rejected, active, done, after, active_after = asyncio.run(scenario())
+    assert rejected["status"] == 429 and rejected["headers"][b"retry-after"] == b"1"
+    # The change feed stream holds no slot; the other school has its own
+    assert active == {"a": 2, "b": 1}
+    assert [r["status"] for r in done] == [200, 200, 200, 200]
+    assert after["status"] == 200
+    assert active_after == {}
+
+
+def test_exempt_paths_and_preflights_are_never_limited():
+    async def app(scope, receive, send):
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b""})
+
+    limiter = RateLimiter(LocalLimiter(), tenant=(0.001, 1), token=(0.001, 1))
+    middleware = RateLimitMiddleware(app, limiter, tenant_of=lambda domain: "school1")
+
+    async def status(method, path):
+        statuses = []
+
+        async def send(message):
+            if message["type"] == "http.response.start":
+                statuses.append(message["status"])
+
+        await middleware({"type": "http", "method": method, "path": path, "headers": []}, None, send)
+        return statuses[0]
+
+    async def scenario():
+        return [await status(method, path) for method, path in [
+            ("GET", "/api/students"), ("GET", "/api/students"), ("OPTIONS", "/api/students"),
+            ("GET", "/metrics"), ("GET", "/"), ("GET", "/uploads/student_photos/x.jpg"), ("GET", "/docs"),
+        ]]
+
+    assert asyncio.run(scenario()) == [200, 429, 200, 200, 200, 200, 200]
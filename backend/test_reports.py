@@ -0,0 +1,41 @@
+"""Attendance rollup reads are safe while attendance is being written.
+
+Run with `pytest test_reports.py` from the backend directory.
+"""
+import threading
+from datetime import date, timedelta
+
+
+def test_rollup_reads_during_writes(load_main):
+    main = load_main()
+    repo = main.repo
+    errors = []
+    done = threading.Event()
+
+    def write():
+        try:
+            # Every record opens new day buckets, so the rollup dicts grow while they are read
+            for n in range(1500):
+                day = (date(2024, 1, 1) + timedelta(days=n)).isoformat()
+                repo.add("school1", "attendance", {"id": f"att-race-{n}", "student_id": f"student{n % 3 + 1}",
+                                                   "date": day, "morning": True, "school_id": "school1"})
+        finally:
+            done.set()
+
+    def read():
+        while not done.is_set():
+            try:
+                repo.attendance_rollups("school1", "student", "day")
+            except Exception as exc:
+                errors.append(exc)
+                return
+
+    threads = [threading.Thread(target=write)] + [threading.Thread(target=read) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    rows = repo.attendance_rollups("school1", "student", "day")
+    assert sum(total for _, bucket, _, _, total in rows if bucket >= "2024-01-01") >= 1500
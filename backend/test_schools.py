@@ -0,0 +1,65 @@
+"""New schools come with their admin login, and logins added elsewhere are found.
+
+Run with `pytest test_schools.py` from the backend directory.
+"""
+import pytest
+from fastapi.testclient import TestClient
+
+from conftest import BACKENDS
+
+ADMIN_KEY = "test-admin-key"
+NEW_SCHOOL = {
+    "name": "Riverside", "domain": "riverside", "address": "1 River Rd", "phone": "1",
+    "email": "admin@riverside.edu", "admin_password": "river123",
+}
+
+
+def sign_in(client: TestClient, email: str, password: str) -> int:
+    return client.post("/api/login", json={
+        "email": email, "password": password, "school_domain": "riverside",
+    }).status_code
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_school_is_created_with_its_admin(load_main, backend):
+    main = load_main(backend, PLATFORM_ADMIN_KEY=ADMIN_KEY)
+    with TestClient(main.app) as client:
+        created = client.post("/api/schools", headers={"X-Admin-Key": ADMIN_KEY}, json=NEW_SCHOOL)
+        again = client.post("/api/schools", headers={"X-Admin-Key": ADMIN_KEY},
+                            json={**NEW_SCHOOL, "email": "other@riverside.edu"})
+        login = sign_in(client, "Admin@Riverside.edu", "river123")
+
+    assert created.status_code == 201, created.text
+    assert again.status_code == 409
+    assert login == 200
+    users = main.repo.list(created.json()["id"], "users")
+    assert [user["email"] for user in users] == ["admin@riverside.edu"]
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_user_missing_from_the_registry_is_looked_up(load_main, backend):
+    main = load_main(backend, PLATFORM_ADMIN_KEY=ADMIN_KEY)
+    with TestClient(main.app) as client:
+        school = client.post("/api/schools", headers={"X-Admin-Key": ADMIN_KEY}, json=NEW_SCHOOL).json()
+        before = sign_in(client, "teacher@riverside.edu", "teach123")
+        # As if another worker had added the login: straight to the store, bypassing this registry
+        main.repo.add(school["id"], "users", {
+            "id": "user-teacher", "email": "teacher@riverside.edu", "name": "Teacher", "role": "teacher",
+            "password": "teach123", "school_id": school["id"],
+        })
+        after = sign_in(client, "teacher@riverside.edu", "teach123")
+
+    assert before == 401
+    assert after == 200
+
+
+def test_journal_replays_the_school_with_its_admin(load_main, tmp_path):
+    journal = str(tmp_path / "journal")
+    main = load_main(PLATFORM_ADMIN_KEY=ADMIN_KEY, MEMORY_JOURNAL_DIR=journal)
+    with TestClient(main.app) as client:
+        assert client.post("/api/schools", headers={"X-Admin-Key": ADMIN_KEY}, json=NEW_SCHOOL).status_code == 201
+    main.repo.close()
+
+    main = load_main(PLATFORM_ADMIN_KEY=ADMIN_KEY, MEMORY_JOURNAL_DIR=journal)
+    with TestClient(main.app) as client:
+        assert sign_in(client, "admin@riverside.edu", "river123") == 200
@@ -0,0 +1,72 @@
+"""A student's photo_url is either hosted by this app or stored from an upload, metadata stripped.
+
+Run with `pytest test_student_photos.py` from the backend directory.
+"""
+import io
+import os
+
+import pytest
+from fastapi.testclient import TestClient
+from PIL import Image
+
+from images import PHOTO_DIR, staging_path
+
+FORM = {"name": "Photo Test", "class_name": "10", "section": "A", "parent_id": "parent1"}
+
+
+@pytest.mark.parametrize("photo_url", [
+    "/uploads/student_photos/student_abc.jpg",
+    "/uploads/blobs/ab/abcdef.jpg",
+])
+def test_hosted_photo_urls_are_kept(load_main, login, photo_url):
+    main = load_main()
+    with TestClient(main.app) as client:
+        response = client.post("/api/students", headers=login(client), data={**FORM, "photo_url": photo_url})
+    assert response.status_code == 200, response.text
+    assert response.json()["photo_url"] == photo_url
+
+
+@pytest.mark.parametrize("photo_url", [
+    "https://tracker.example.com/pixel.gif",
+    "http://10.0.0.1/admin",
+    "/api/students",
+    "/uploads/student_photos/../../main.py",
+])
+def test_other_photo_urls_are_rejected(load_main, login, photo_url):
+    main = load_main()
+    with TestClient(main.app) as client:
+        response = client.post("/api/students", headers=login(client), data={**FORM, "photo_url": photo_url})
+    assert response.status_code == 400
+
+
+def mpo_with_gps() -> bytes:
+    """A two-frame MPO, as phones take them, carrying the camera's GPS position"""
+    exif = Image.Exif()
+    exif[0x010F] = "PhoneMaker"
+    exif[0x8825] = {1: "N", 2: (51.0, 30.0, 0.0)}
+    frames = [Image.effect_noise((640, 480), sigma).convert("RGB") for sigma in (32, 64)]
+    buffer = io.BytesIO()
+    frames[0].save(buffer, "MPO", exif=exif, save_all=True, append_images=frames[1:])
+    return buffer.getvalue()
+
+
+def test_uploads_are_published_only_once_stripped(load_main, login):
+    main = load_main(JOB_WORKERS="0")
+    with TestClient(main.app) as client:
+        response = client.post("/api/students", headers=login(client), data=FORM,
+                               files={"file": ("holiday.mpo", mpo_with_gps(), "image/jpeg")})
+        assert response.status_code == 200, response.text
+        student = response.json()
+        # Nothing is served until the photo job has stripped the upload
+        assert student["photo_url"] == ""
+        assert not os.path.exists(PHOTO_DIR) or os.listdir(PHOTO_DIR) == []
+
+        assert main.jobs.run_once()
+
+    student = main.repo.get("school1", "students", student["id"])
+    assert student["photo_url"] == f"/uploads/student_photos/student_{student['id']}.jpg"
+    for key in ("photo_url", "photo_thumb_url", "photo_medium_url"):
+        with Image.open(os.path.join(PHOTO_DIR, os.path.basename(student[key]))) as published:
+            assert published.format != "MPO"
+            assert dict(published.getexif()) == {}
+    assert not os.path.exists(staging_path(student["id"], "jpg"))
@@ -589,7 +589,7 @@ const StudentsPage = () => {
                       <div className="flex items-center">
                         {student.photo_url ? (
                           <img
-                            src={student.photo_url}
+                            src={student.photo_thumb_url || student.photo_url}
                             alt={student.name}
                             className="h-10 w-10 rounded-full object-cover"
                           />